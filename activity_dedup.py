@@ -0,0 +1,146 @@
+"""Idempotent activity processing for Bot Connector retries.
+
+Bot Connector 等不到 webhook 回應時會以相同的活動 ID 重送請求，若再處理一次，
+同一個 Genie 問題會被問兩次，回饋也會透過 send_feedback 重複送出。
+ActivityDeduplicator 以「對話 ID + 活動 ID」為鍵，在時間窗內只處理第一次收到的活動：
+
+- 原始請求仍在處理中時，重複的請求等待其完成並回傳相同的結果（join）
+- 原始請求已完成時，重複的請求直接回傳原始請求的結果，不再處理（drop）；
+  invoke 活動的回應本文（例如分頁卡片）因此也會原樣回給重送的請求
+- 原始請求失敗（例外或狀態碼 >= 400）時釋放鍵，讓頻道的重送可以重新處理
+- 多工作行程模式下以 SharedMapping.claim 在所有行程間搶佔鍵；其他行程沒有原始結果，
+  重複的請求只能回傳 duplicate（回應本文無法重現的活動應以 local_only 只在本機去重複）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from shared_state import SharedMapping
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_STATUS = 200
+FAILED_STATUS = 500
+
+T = TypeVar("T")
+
+
+def _identity(result: Any) -> int:
+    return result
+
+
+def activity_dedup_key(activity: Any) -> Optional[str]:
+    """回傳活動的去重複鍵；缺少活動 ID 或對話 ID 時回傳 None（不去重複）"""
+    conversation = getattr(activity, "conversation", None)
+    if not activity.id or conversation is None or not conversation.id:
+        return None
+    return f"{activity.channel_id}:{conversation.id}:{activity.id}"
+
+
+class ActivityDeduplicator:
+    """有時間窗與筆數上限的活動去重複集合"""
+
+    def __init__(
+        self,
+        window_seconds: float,
+        max_entries: int,
+        shared: Optional[SharedMapping] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.shared = shared
+        self._clock = clock
+        # key -> (首次收到的時間, 原始請求結果的 future)，依收到的順序排列
+        self._seen: "OrderedDict[str, Tuple[float, asyncio.Future]]" = OrderedDict()
+        self._unique = 0
+        self._dropped = 0
+        self._joined = 0
+        self._released = 0
+
+    async def process(
+        self,
+        key: Optional[str],
+        handler: Callable[[], Awaitable[T]],
+        status_of: Callable[[T], int] = _identity,
+        duplicate: Any = DUPLICATE_STATUS,
+        failed: Any = FAILED_STATUS,
+        local_only: bool = False,
+    ) -> T:
+        """只處理時間窗內第一次收到的 key，回傳原始請求的結果
+
+        handler 執行實際的處理並回傳結果（預設為 HTTP 狀態碼，否則以 status_of 取出狀態碼）；
+        重複的請求不呼叫 handler。其他行程已處理的重複請求回傳 duplicate，
+        handler 拋出例外時等待中的重複請求收到 failed。local_only 為 True 時不與其他行程共用鍵。
+        """
+        if key is None:
+            return await handler()
+
+        self._prune()
+        entry = self._seen.get(key)
+        if entry is not None:
+            future = entry[1]
+            if future.done():
+                self._dropped += 1
+                logger.info(f"♻️ 略過重複的活動: {key}")
+                return future.result()
+            self._joined += 1
+            logger.info(f"♻️ 重複的活動等待原始請求完成: {key}")
+            return await asyncio.shield(future)
+
+        # 先登記本機的 future，等待共用資料庫時重送的請求可直接等待本次結果
+        future = asyncio.get_running_loop().create_future()
+        self._seen[key] = (self._clock(), future)
+        if self.shared is not None and not local_only and not await self.shared.claim_async(key, True):
+            self._seen.pop(key, None)
+            future.set_result(duplicate)
+            self._dropped += 1
+            logger.info(f"♻️ 略過其他行程已處理的重複活動: {key}")
+            return duplicate
+
+        self._unique += 1
+        try:
+            result = await handler()
+        except BaseException:
+            future.set_result(failed)
+            await self._release(key, local_only)
+            raise
+        if status_of(result) >= 400:
+            await self._release(key, local_only)
+        future.set_result(result)
+        return result
+
+    async def _release(self, key: str, local_only: bool = False) -> None:
+        self._seen.pop(key, None)
+        self._released += 1
+        if self.shared is not None and not local_only:
+            await self.shared.pop_async(key)
+
+    def _prune(self) -> None:
+        cutoff = self._clock() - self.window_seconds
+        while self._seen:
+            key, (seen_at, future) = next(iter(self._seen.items()))
+            # 處理中的活動即使超過時間窗也保留，重送的請求仍可等待其結果
+            if len(self._seen) <= self.max_entries and (seen_at >= cutoff or not future.done()):
+                break
+            del self._seen[key]
+
+    def stats(self) -> Dict[str, Any]:
+        duplicates = self._dropped + self._joined
+        total = self._unique + duplicates
+        return {
+            "entries": len(self._seen),
+            "max_entries": self.max_entries,
+            "window_seconds": self.window_seconds,
+            "unique": self._unique,
+            "dropped": self._dropped,
+            "joined": self._joined,
+            "released": self._released,
+            "duplicate_rate": round(duplicates / total, 4) if total else 0.0,
+            "shared": self.shared is not None,
+        }
@@ -32,20 +32,26 @@ DEBUG:asyncio:Using proactor: IocpProactor
 from asyncio.log import logger
 import os
 import json
+import signal
+import socket
+import sys
+import tempfile
+import multiprocessing
 from collections import defaultdict
-from functools import lru_cache
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 from aiohttp import web
 import asyncio
+import time
 import traceback
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
-from aiohttp.web import Request, Response, json_response
+from aiohttp.web import Request, Response
 from botbuilder.core import (
     BotFrameworkAdapterSettings,
     BotFrameworkAdapter,
     ActivityHandler,
     TurnContext,
+    serializer_helper,
 )
 from botbuilder.core.integration import aiohttp_error_middleware
 from botbuilder.integration.aiohttp import (
@@ -55,11 +61,16 @@ from botbuilder.integration.aiohttp import (
 from botbuilder.schema import (
     Activity,
     ActivityTypes,
+    Attachment,
     ChannelAccount,
+    DeliveryModes,
     InvokeResponse,
 )
 
+from activity_dedup import DUPLICATE_STATUS, ActivityDeduplicator, activity_dedup_key
 from config import DefaultConfig
+import json_codec
+from json_codec import json_response
 from genie_service import GenieService, process_query_results
 from user_session import (
     UserSession,
@@ -69,9 +80,37 @@ from user_session import (
 )
 from identity_flow import handle_pending_email_input, handle_user_identification
 from command_handler import handle_special_commands
-from feedback_cards import create_error_card, create_thank_you_card, send_feedback_card
+from feedback_cards import build_answer_feedback_card, create_error_card, create_thank_you_card
 from welcome_messages import build_authenticated_welcome, build_unauthenticated_welcome
 from graph_service import GraphService, get_teams_user_info
+from result_pagination import (
+    RESULT_PAGE_ACTION,
+    ResultCursorStore,
+    build_result_page_card,
+    create_expired_page_card,
+)
+from result_store import ResultStore
+from session_store import SessionStore, SessionSweeper
+from session_persistence import SQLITE_BACKEND, SessionPersister, create_session_backend
+from shared_state import SharedMapping, SharedStateDB
+from turn_queue import TurnQueue
+from turn_scheduler import TurnScheduler
+from user_context_cache import UserContextCache, load_graph_user_context
+from chart_render_pool import ChartRenderPool
+from chart_cache import ChartImageCache, sign_chart_path, verify_chart_signature
+from chart_encoder import ChartEncodeOptions
+from chart_cards import build_chart_card, create_chart_error_card
+from text_chart import render_text_chart
+from performance_metrics import DeliveryMetrics
+from reply_composer import ReplyComposer, ReplyMetrics, parse_channels
+from result_export import (
+    EXPORT_RESULT_ACTION,
+    ExportJob,
+    ExportLimitExceeded,
+    ResultExporter,
+    build_export_actions,
+    create_export_ready_card,
+)
 
 
 CONFIG = DefaultConfig()
@@ -89,10 +128,12 @@ except Exception as tz_error:
     LOCAL_TIMEZONE_LABEL = "UTC"
 
 
-def format_local_timestamp(dt: Optional[datetime]) -> str:
+def format_local_timestamp(dt: Union[datetime, float, None]) -> str:
     """Format timestamps in the configured timezone for user-facing text."""
     if not dt:
         return "N/A"
+    if isinstance(dt, (int, float)):
+        dt = datetime.fromtimestamp(dt, timezone.utc)
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=timezone.utc)
     localized = dt.astimezone(LOCAL_TIMEZONE)
@@ -125,6 +166,37 @@ ADAPTER.on_turn_error = on_error
 
 GENIE_SERVICE = GenieService(CONFIG)
 
+# 多工作行程模式：狀態存放在同一台機器上共用的 SQLite 資料庫
+MULTI_WORKER = CONFIG.WEB_WORKERS > 1
+
+# 以內容雜湊為鍵的圖表圖片快取（重複的圖表不重新繪製）
+# 多工作行程模式下磁碟目錄由所有行程共用，任何行程都能提供其他行程繪製的圖表
+CHART_CACHE = ChartImageCache(
+    memory_budget_bytes=CONFIG.CHART_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_dir=CONFIG.CHART_CACHE_DIR
+    or (os.path.join(tempfile.gettempdir(), "genie_chart_cache") if MULTI_WORKER else None),
+    disk_budget_bytes=CONFIG.CHART_CACHE_DISK_MB * 1024 * 1024,
+    shared_disk=MULTI_WORKER,
+)
+
+# 文字答案與圖表的送達時間（自收到訊息起算）
+DELIVERY_METRICS = DeliveryMetrics()
+
+# 每個回合的 Bot Connector 呼叫次數，以及合併回覆省下的呼叫與延遲
+REPLY_METRICS = ReplyMetrics()
+REPLY_COALESCE_CHANNELS = parse_channels(CONFIG.REPLY_COALESCE_CHANNELS)
+
+# 圖表繪圖行程池（避免 matplotlib 阻塞事件迴圈）
+CHART_RENDER_POOL = ChartRenderPool(
+    max_workers=CONFIG.CHART_RENDER_WORKERS,
+    max_queue_depth=CONFIG.CHART_RENDER_QUEUE_DEPTH,
+    render_timeout=CONFIG.CHART_RENDER_TIMEOUT_SECONDS,
+    executor=CONFIG.CHART_RENDER_EXECUTOR,
+    cache=CHART_CACHE,
+    encode_options=ChartEncodeOptions.from_config(CONFIG),
+    font_path=CONFIG.CHART_FONT_PATH or None,
+)
+
 # 初始化 Graph Service（如果啟用）
 GRAPH_SERVICE = None
 if CONFIG.ENABLE_GRAPH_API_AUTO_LOGIN and CONFIG.OAUTH_CONNECTION_NAME:
@@ -134,19 +206,170 @@ else:
     logger.info("Graph API 自動登入已停用，將使用手動 email 輸入")
 
 
+def build_public_url(path: str) -> str:
+    """以機器人對外網址組出完整 URL（未設定時使用本機位址）"""
+    base_url = CONFIG.PUBLIC_BASE_URL or f"http://localhost:{CONFIG.PORT}"
+    return base_url.rstrip("/") + path
+
+
+def chart_urls_enabled() -> bool:
+    """是否以 /charts 端點的簽章網址引用圖表圖片
+
+    需設定對外網址、磁碟快取與固定的簽章金鑰；否則重新啟動或由其他行程處理請求時網址會失效。
+    """
+    return bool(CONFIG.PUBLIC_BASE_URL and CONFIG.CHART_CACHE_DIR and CONFIG.CHART_URL_SECRET)
+
+
+def build_chart_image_url(render) -> str:
+    """圖表卡片引用的圖片網址
+
+    設定了 PUBLIC_BASE_URL、CHART_CACHE_DIR 與 CHART_URL_SECRET 且圖片已在快取中時，
+    回傳 /charts 端點的簽章網址；否則退回內嵌的 base64 data URI。
+    """
+    if chart_urls_enabled() and render.cache_key and render.cache_key in CHART_CACHE:
+        path = sign_chart_path(
+            render.cache_key,
+            CONFIG.CHART_URL_SECRET,
+            CONFIG.CHART_URL_TTL_HOURS * 3600,
+            extension=render.image.extension,
+        )
+        return build_public_url(path)
+    return render.image.data_uri()
+
+
+async def send_proactive_activity(reference, activity) -> None:
+    """在回合結束後透過已儲存的對話參考主動發送訊息"""
+    async def callback(turn_context: TurnContext):
+        await turn_context.send_activity(activity)
+
+    await ADAPTER.continue_conversation(reference, callback, CONFIG.APP_ID)
+
+
+async def update_proactive_activity(reference, activity_id: str, text: str) -> None:
+    """在回合結束後更新先前發送的訊息"""
+    async def callback(turn_context: TurnContext):
+        await turn_context.update_activity(
+            Activity(id=activity_id, type=ActivityTypes.message, text=text)
+        )
+
+    try:
+        await ADAPTER.continue_conversation(reference, callback, CONFIG.APP_ID)
+    except Exception as e:
+        logger.warning(f"無法更新訊息 {activity_id}: {str(e)}")
+
+
 class MyBot(ActivityHandler):
     def __init__(self, genie_service: GenieService, graph_service: Optional[GraphService] = None):
         self.genie_service = genie_service
         self.graph_service = graph_service
-        self.user_sessions: Dict[str, UserSession] = {}  # 將 Teams 使用者 ID 映射到 UserSession
-        self.email_sessions: Dict[str, UserSession] = {}  # 將電子郵件映射到 UserSession 以便於查找
-        self.message_feedback: Dict[str, Dict] = {}  # 追蹤每條訊息的回饋
-        self.pending_email_input: Dict[str, bool] = {}  # 追蹤等待輸入電子郵件的使用者
-        self._user_context_cache: Dict[str, Dict] = {}  # ✅ 用戶上下文快取
+        session_ttl = CONFIG.SESSION_IDLE_TTL_HOURS * 3600
+        self.shared_state = SharedStateDB(CONFIG.SHARED_STATE_PATH or None) if MULTI_WORKER else None
+        # 將電子郵件映射到 UserSession 以便於查找
+        self.email_sessions = SessionStore("email_sessions", session_ttl, CONFIG.SESSION_MAX_ENTRIES)
+        # 將 Teams 使用者 ID 映射到 UserSession；工作階段釋放時一併移除電子郵件索引
+        self.user_sessions = SessionStore(
+            "user_sessions", session_ttl, CONFIG.SESSION_MAX_ENTRIES, on_evict=self._on_session_evicted
+        )
+        # 追蹤每條訊息的回饋與等待輸入電子郵件的使用者（多工作行程模式下跨行程共用）
+        if self.shared_state is not None:
+            self.message_feedback = SharedMapping(
+                self.shared_state, "message_feedback", session_ttl, CONFIG.SESSION_MAX_ENTRIES
+            )
+            self.pending_email_input = SharedMapping(
+                self.shared_state,
+                "pending_email_input",
+                CONFIG.PENDING_EMAIL_TTL_MINUTES * 60,
+                CONFIG.SESSION_MAX_ENTRIES,
+            )
+        else:
+            self.message_feedback = SessionStore("message_feedback", session_ttl, CONFIG.SESSION_MAX_ENTRIES)
+            self.pending_email_input = SessionStore(
+                "pending_email_input", CONFIG.PENDING_EMAIL_TTL_MINUTES * 60, CONFIG.SESSION_MAX_ENTRIES
+            )
+        # Graph / Teams 身分資訊的快取（識別使用者與個人資料卡片共用，登出時個別失效）
+        self.user_context_cache = UserContextCache(
+            CONFIG.USER_CONTEXT_CACHE_TTL_MINUTES * 60, CONFIG.USER_CONTEXT_CACHE_MAX_ENTRIES
+        )
+        # 工作階段的持久化（write-behind 批次寫入，啟動時還原）
+        # 多工作行程模式下固定使用 SQLite 並立即寫入，讓其他行程讀得到最新狀態
+        self.session_persister = SessionPersister(
+            create_session_backend(
+                SQLITE_BACKEND if MULTI_WORKER else CONFIG.SESSION_STORE_BACKEND, CONFIG.SESSION_DB_PATH or None
+            ),
+            flush_interval=CONFIG.SESSION_FLUSH_INTERVAL_SECONDS,
+            write_through=MULTI_WORKER,
+        )
+        self.session_sweeper = SessionSweeper(
+            [
+                self.user_sessions,
+                self.email_sessions,
+                self.message_feedback,
+                self.pending_email_input,
+                self.user_context_cache,
+            ],
+            interval_seconds=CONFIG.SESSION_SWEEP_INTERVAL_SECONDS,
+        )
+        self.result_store = ResultStore(
+            memory_budget_bytes=CONFIG.RESULT_STORE_MEMORY_MB * 1024 * 1024,
+            disk_budget_bytes=CONFIG.RESULT_STORE_DISK_MB * 1024 * 1024,
+            spill_dir=CONFIG.RESULT_STORE_DIR or None,
+        )  # 分層壓縮的結果資料儲存區
+        self.result_cursors = ResultCursorStore(
+            ttl_seconds=CONFIG.RESULT_CURSOR_TTL_MINUTES * 60,
+            max_cursors=CONFIG.RESULT_CURSOR_MAX_ENTRIES,
+            result_store=self.result_store,
+            shared=(
+                SharedMapping(self.shared_state, "result_cursors", CONFIG.RESULT_CURSOR_TTL_MINUTES * 60)
+                if self.shared_state is not None
+                else None
+            ),
+        )  # 查詢結果分頁游標
+        if self.result_cursors.shared is not None:
+            self.session_sweeper.stores.append(self.result_cursors.shared)
+        self.result_exporter = ResultExporter(
+            export_dir=CONFIG.EXPORT_DIR or None,
+            max_concurrent_per_user=CONFIG.EXPORT_MAX_CONCURRENT_PER_USER,
+            max_concurrent_total=CONFIG.EXPORT_MAX_CONCURRENT,
+            ttl_seconds=CONFIG.EXPORT_TTL_MINUTES * 60,
+            cursor_store=self.result_cursors,
+            shared=(
+                SharedMapping(self.shared_state, "export_jobs", CONFIG.EXPORT_TTL_MINUTES * 60)
+                if self.shared_state is not None
+                else None
+            ),
+        )  # 完整結果的串流匯出
+        self.session_sweeper.stores.append(self.result_exporter)  # 定期刪除過期的匯出檔案
+        if self.result_exporter.shared is not None:
+            self.session_sweeper.stores.append(self.result_exporter.shared)
+        self.turn_scheduler = TurnScheduler(CONFIG.TURN_SCHEDULER_MODE)  # 每位使用者的 Genie 問題排程
+
+    def _on_session_evicted(self, user_id: str, session: UserSession) -> None:
+        if self.email_sessions.get(session.email) is session:
+            del self.email_sessions[session.email]
+        if self.session_persister.write_through:
+            # 本機淘汰不代表其他行程不再需要；登出另外處理，過期紀錄於啟動還原時清除
+            return
+        self.session_persister.mark_deleted(user_id)
+
+    async def session_stats(self) -> Dict[str, Dict]:
+        stats = {}
+        for store in self.session_sweeper.stores:
+            # 跨行程共用的儲存區需查詢 SQLite，在執行緒中進行
+            stats[store.name] = await asyncio.to_thread(store.stats) if getattr(store, "blocking", False) else store.stats()
+        stats["persistence"] = self.session_persister.stats()
+        return stats
 
     async def get_or_create_user_session(self, turn_context: TurnContext) -> UserSession:
+        session = await self._resolve_user_session(turn_context)
+        # 活動時間與對話狀態已更新，由背景工作批次寫入持久化儲存區
+        self.session_persister.mark_dirty(session)
+        return session
+
+    async def _resolve_user_session(self, turn_context: TurnContext) -> UserSession:
         # 根據 Teams 使用者資訊獲取或建立使用者工作階段
         user_id = turn_context.activity.from_property.id
+        # 多工作行程模式：上一個回合可能由其他行程處理，先讀取共用資料庫中的最新狀態
+        await self.session_persister.sync(user_id, self.user_sessions, self.email_sessions)
         
         # 檢查我們是否已經有此使用者的工作階段
         if user_id in self.user_sessions:
@@ -157,7 +380,7 @@ class MyBot(ActivityHandler):
                 logger.info(f"使用者 {session.get_display_name()} 的對話已超時，正在重置對話")
                 # 重置對話 ID 和使用者上下文以重新開始
                 session.conversation_id = None
-                session.user_context.pop('last_conversation_id', None)
+                session.user_context.reset_conversation()
                 # 更新活動時間
                 session.update_activity()
                 return session
@@ -169,8 +392,8 @@ class MyBot(ActivityHandler):
         # 如果啟用 Graph API，嘗試自動取得使用者資訊
         if self.graph_service:
             try:
-                user_info = await self.graph_service.get_user_email_and_id(turn_context)
-                if user_info and user_info.get('email'):
+                user_info = await load_graph_user_context(self.user_context_cache, self.graph_service, turn_context)
+                if user_info:
                     email = user_info['email']
                     name = user_info.get('name') or email.split('@')[0]
                     aad_object_id = user_info.get('id')
@@ -221,38 +444,158 @@ class MyBot(ActivityHandler):
         self.email_sessions[email] = session
         
         # 從待處理電子郵件輸入中移除
-        if user_id in self.pending_email_input:
-            del self.pending_email_input[user_id]
+        await self.pending_email_input.pop_async(user_id)
+        self.session_persister.mark_dirty(session)
         
         logger.info(f"已為 {session.get_display_name()} 建立帶有手動電子郵件的使用者工作階段")
         return session
 
-    @lru_cache(maxsize=1000)
-    def _get_cached_user_context(self, user_id: str, email: str) -> Dict:
-        """預載並快取用戶上下文（使用 LRU 快取提升性能）"""
-        cache_key = f"{user_id}:{email}"
-        if cache_key not in self._user_context_cache:
-            self._user_context_cache[cache_key] = {
-                'last_question': None,
-                'last_response_time': None,
-                'last_conversation_id': None,
-                'preferred_time_range': '7d',  # 預設偏好
-                'query_count': 0,
-                'cached_at': datetime.now(timezone.utc).isoformat()
-            }
-            logger.info(f"🔖 已快取用戶上下文: {email}")
-        return self._user_context_cache[cache_key]
-
-    def _invalidate_user_context_cache(self, user_id: str, email: str) -> None:
-        """清除特定用戶的上下文快取"""
-        cache_key = f"{user_id}:{email}"
-        if cache_key in self._user_context_cache:
-            del self._user_context_cache[cache_key]
-            logger.info(f"🗑️ 已清除用戶上下文快取: {email}")
-        # 清除 LRU 快取
-        self._get_cached_user_context.cache_clear()
+    async def _render_result_page(self, user_id: str, value: Dict) -> Dict:
+        """依分頁按鈕的資料產生對應頁面的結果卡片"""
+        cursor = await self.result_cursors.get(value.get("cursorId"))
+        if not cursor or cursor.user_id != user_id:
+            return create_expired_page_card()
+        try:
+            page = int(value.get("page", 0))
+        except (TypeError, ValueError):
+            page = 0
+        rows, page = await self.result_cursors.get_page_rows(
+            cursor, page, self.genie_service.get_result_chunk
+        )
+        return build_result_page_card(cursor, rows, page, build_export_actions(cursor))
+
+    async def _start_result_export(self, turn_context: TurnContext, value: Dict) -> str:
+        """開始匯出完整結果，回傳要顯示給使用者的訊息"""
+        user_id = turn_context.activity.from_property.id
+        cursor = await self.result_cursors.get(value.get("cursorId"))
+        if not cursor or cursor.user_id != user_id:
+            return "⌛ 此查詢結果已過期，請重新提問後再匯出。"
+
+        export_format = value.get("format", "csv")
+        reference = TurnContext.get_conversation_reference(turn_context.activity)
+        progress = {"activity_id": None, "bucket": 0}
+        # 進度訊息送出後才處理完成通知，避免完成卡片早於「0%」訊息
+        progress_sent = asyncio.Event()
+
+        async def on_progress(job: ExportJob) -> None:
+            # 每前進 25% 更新一次進度訊息，避免過多的 connector 呼叫
+            bucket = int(job.progress * 4)
+            if bucket <= progress["bucket"] or bucket >= 4 or not progress["activity_id"]:
+                return
+            progress["bucket"] = bucket
+            text = f"📤 正在匯出 {job.total_rows:,} 筆資料（{job.export_format.upper()}）... {job.progress:.0%}"
+            await update_proactive_activity(reference, progress["activity_id"], text)
+
+        async def on_complete(job: ExportJob) -> None:
+            await progress_sent.wait()
+            if job.status != ExportJob.COMPLETED:
+                failed_text = "❌ 匯出失敗，請稍後再試一次。"
+                if progress["activity_id"]:
+                    await update_proactive_activity(reference, progress["activity_id"], failed_text)
+                else:
+                    await send_proactive_activity(reference, failed_text)
+                return
+            if progress["activity_id"]:
+                await update_proactive_activity(
+                    reference, progress["activity_id"], f"📤 匯出完成：{job.rows_written:,} 筆資料"
+                )
+            download_url = build_public_url(f"/api/exports/{job.job_id}/{job.token}")
+            await send_proactive_activity(
+                reference,
+                Activity(
+                    type=ActivityTypes.message,
+                    attachments=[
+                        Attachment(
+                            content_type="application/vnd.microsoft.card.adaptive",
+                            content=create_export_ready_card(job, download_url),
+                        )
+                    ],
+                ),
+            )
+
+        try:
+            self.result_exporter.start_export(
+                user_id,
+                cursor,
+                export_format,
+                self.genie_service.get_result_chunk,
+                on_progress=on_progress,
+                on_complete=on_complete,
+            )
+        except ExportLimitExceeded:
+            return "⏳ 您已有匯出工作正在進行中，請等待完成後再試。"
+        except ValueError as e:
+            logger.warning(f"無法開始匯出: {str(e)}")
+            return "❌ 此結果無法匯出。"
+
+        try:
+            progress_response = await turn_context.send_activity(
+                f"📤 正在匯出 {cursor.total_rows:,} 筆資料（{export_format.upper()}）... 0%"
+            )
+            progress["activity_id"] = progress_response.id if progress_response else None
+        finally:
+            progress_sent.set()
+        return "📤 已開始匯出，完成後會傳送下載連結。"
+
+    async def _build_first_result_page_card(self, turn_context: TurnContext, answer_json: Dict) -> Optional[Dict]:
+        """結果超過單頁筆數時，建立第一頁的 Adaptive Card 表格
+
+        建立失敗（例如讀取結果區塊失敗）時只記錄錯誤並回傳 None，答案仍照常送出。
+        """
+        total_rows = answer_json.get("total_row_count")
+        if total_rows is None or total_rows <= CONFIG.RESULT_PAGE_SIZE:
+            return None
+        try:
+            cursor = await self.result_cursors.create(
+                turn_context.activity.from_property.id,
+                answer_json,
+                CONFIG.RESULT_PAGE_SIZE,
+            )
+            if not cursor:
+                return None
+            rows, page = await self.result_cursors.get_page_rows(
+                cursor, 0, self.genie_service.get_result_chunk
+            )
+            return build_result_page_card(cursor, rows, page, build_export_actions(cursor))
+        except Exception as e:
+            logger.error(f"建立分頁表格時發生錯誤: {str(e)}")
+            return None
+
+    async def _send_answer_followups(self, turn_context: TurnContext, answer_json: Dict, user_session: UserSession) -> None:
+        """送出文字答案之後的分頁表格與回饋卡（不合併回覆的頻道，各自以獨立訊息送出）"""
+        composer = ReplyComposer(turn_context, coalesce=False, metrics=REPLY_METRICS)
+        # 大型結果：以分頁表格送出第一頁，其餘頁面按需讀取
+        composer.add_card(await self._build_first_result_page_card(turn_context, answer_json))
+        composer.add_card(build_answer_feedback_card(user_session, CONFIG.ENABLE_FEEDBACK_CARDS))
+        await composer.flush()
+
+    async def _render_chart_reply(self, chart_info: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+        """繪製圖表，回傳 (圖表卡片, 文字圖表)；繪圖池飽和或逾時時改為文字圖表"""
+        try:
+            render = await CHART_RENDER_POOL.render(chart_info)
+            if render is None:
+                CHART_RENDER_POOL.record_text_fallback()
+                return None, render_text_chart(chart_info, max_rows=CONFIG.CHART_TOP_N + 1)
+            return build_chart_card(chart_info, build_chart_image_url(render)), None
+        except Exception as e:
+            logger.error(f"生成圖表圖片時發生錯誤: {e}")
+            return create_chart_error_card(e), None
+
+    async def _deliver_chart(self, turn_context: TurnContext, chart_task: asyncio.Task, turn_started: float) -> None:
+        """等待圖表繪製完成並以獨立訊息送出"""
+        chart_card, chart_text = await chart_task
+        composer = ReplyComposer(turn_context, coalesce=False, metrics=REPLY_METRICS)
+        if chart_text:
+            composer.add_text(chart_text)
+        composer.add_card(chart_card)
+        await composer.flush()
+        chart_seconds = time.perf_counter() - turn_started
+        DELIVERY_METRICS.record(DeliveryMetrics.CHART, chart_seconds)
+        logger.info(f"📊 圖表已送達（自收到訊息起 {chart_seconds * 1000:.0f}ms）")
 
     async def on_message_activity(self, turn_context: TurnContext):
+        # 背景處理的回合自放入佇列時起算，送達時間包含排隊等待
+        turn_started = turn_context.turn_state.get(TURN_RECEIVED_AT_KEY) or time.perf_counter()
         # 記錄所有訊息活動的除錯日誌
         logger.info(f"訊息活動類型: {turn_context.activity.type}")
         logger.info(f"訊息活動名稱: {turn_context.activity.name}")
@@ -276,6 +619,31 @@ class MyBot(ActivityHandler):
                         logger.error("建議問題點擊中缺少問題內容")
                         return
                 
+                # 處理結果分頁按鈕點擊（不支援 Action.Execute 的用戶端會退回 Submit）
+                elif action == RESULT_PAGE_ACTION:
+                    page_card = await self._render_result_page(
+                        turn_context.activity.from_property.id,
+                        turn_context.activity.value,
+                    )
+                    await turn_context.send_activity(
+                        Activity(
+                            type=ActivityTypes.message,
+                            attachments=[
+                                Attachment(
+                                    content_type="application/vnd.microsoft.card.adaptive",
+                                    content=page_card,
+                                )
+                            ],
+                        )
+                    )
+                    return
+
+                # 處理結果匯出按鈕點擊
+                elif action == EXPORT_RESULT_ACTION:
+                    message = await self._start_result_export(turn_context, turn_context.activity.value)
+                    await turn_context.send_activity(message)
+                    return
+
                 # 處理回饋按鈕點擊
                 elif action == "feedback":
                     logger.info("在訊息活動中偵測到 Adaptive Card 回饋按鈕點擊")
@@ -291,15 +659,16 @@ class MyBot(ActivityHandler):
                         
                         # 儲存回饋資料
                         feedback_key = f"{user_id}_{message_id}"
+                        await self.session_persister.sync(user_id, self.user_sessions, self.email_sessions)
                         user_session = self.user_sessions.get(user_id)
-                        self.message_feedback[feedback_key] = {
+                        await self.message_feedback.set_async(feedback_key, {
                             "message_id": message_id,
                             "user_id": user_id,
                             "feedback": feedback,
                             "conversation_id": user_session.conversation_id if user_session else None,
                             "timestamp": datetime.now(timezone.utc).isoformat(),
                             "user_session": user_session.to_dict() if user_session else None
-                        }
+                        })
                         
                         # 發送回饋到 Databricks Genie API
                         try:
@@ -359,15 +728,40 @@ class MyBot(ActivityHandler):
             self.user_sessions,
             self.email_sessions,
             self.graph_service,
+            self.user_context_cache,
         ):
+            # 指令可能重置對話、切換偏好、建立新的工作階段或登出
+            session = self.user_sessions.get(user_id)
+            if session is None:
+                self.session_persister.mark_deleted(user_id)
+            else:
+                self.session_persister.mark_dirty(session)
             return
         
-        # ✅ 發送 typing indicator
-        typing_activity = Activity(
-            type=ActivityTypes.typing,
-            relates_to=turn_context.activity.relates_to
+        # 同一位使用者同時最多一個進行中的 Genie 問題（依 TURN_SCHEDULER_MODE 排隊或取代先前的問題）
+        await self.turn_scheduler.run(
+            user_id,
+            lambda: self._answer_question(turn_context, question, user_session, turn_started),
+            on_superseded=lambda: turn_context.send_activity(
+                f"**👤 {user_session.name}**\n\n"
+                f"🔁 您先前的問題「{question[:80]}」已被較新的問題取代，將只回覆最新的問題。"
+            ),
         )
-        await turn_context.send_activity(typing_activity)
+
+    async def _answer_question(
+        self, turn_context: TurnContext, question: str, user_session: UserSession, turn_started: float
+    ) -> None:
+        """將問題送往 Genie，並送出答案、分頁表格與圖表（由 TurnScheduler 排程）"""
+        coalesce = self._can_coalesce_replies(turn_context)
+        # 合併回覆時不另外送出 typing：處理中訊息送出後頻道會立即清除輸入中指示
+        # （未合併任何內容，不計入 saved_calls）
+        if not coalesce:
+            # ✅ 發送 typing indicator
+            typing_activity = Activity(
+                type=ActivityTypes.typing,
+                relates_to=turn_context.activity.relates_to
+            )
+            await turn_context.send_activity(typing_activity)
         
         # ✅ 立即發送處理中訊息
         await turn_context.send_activity(
@@ -376,6 +770,7 @@ class MyBot(ActivityHandler):
         )
         
         # 使用使用者上下文處理訊息
+        chart_task: Optional[asyncio.Task] = None
         try:
             # ✅ 新增：45秒超時保護
             answer, new_conversation_id, genie_message_id = await asyncio.wait_for(
@@ -387,64 +782,128 @@ class MyBot(ActivityHandler):
                 ),
                 timeout=45.0
             )
+            # 已取得答案：之後的新問題排隊等待此回合送出回覆，不再取消此回合
+            self.turn_scheduler.mark_answered(user_session.user_id)
             
             # 更新使用者工作階段的新對話 ID 並儲存特定訊息 ID 以供回饋
             user_session.conversation_id = new_conversation_id
-            user_session.user_context['last_question'] = question
-            user_session.user_context['last_response_time'] = datetime.now(timezone.utc).isoformat()
-            user_session.user_context['last_genie_message_id'] = genie_message_id
+            context = user_session.user_context
+            context.last_question = question
+            context.last_response_at = time.time()
+            context.last_message_id = genie_message_id
+            context.query_count += 1
 
             answer_json = json.loads(answer)
-            response = process_query_results(answer_json)
+            context.last_sql = answer_json.get('sql')
+            self.session_persister.mark_dirty(user_session)
+            response = process_query_results(answer_json, max_table_rows=CONFIG.RESULT_PAGE_SIZE)
             
             # 將使用者上下文添加到回應中
             response = f"**👤 {user_session.name}**\n\n{response}"
 
-            # 發送主要回應
-            await turn_context.send_activity(response)
-            
-            # 如果有圖表信息，發送圖表卡片
-            if 'chart_info' in answer_json and answer_json['chart_info'].get('suitable'):
-                from chart_generator import create_chart_card_with_image
-                chart_card = create_chart_card_with_image(answer_json['chart_info'])
-                if chart_card:
-                    from botbuilder.schema import Attachment
-                    chart_attachment = Attachment(
-                        content_type="application/vnd.microsoft.card.adaptive",
-                        content=chart_card
-                    )
-                    chart_message = Activity(
-                        type=ActivityTypes.message,
-                        attachments=[chart_attachment]
-                    )
-                    await turn_context.send_activity(chart_message)
-            
-            # 作為單獨的訊息發送回饋卡
-            await send_feedback_card(turn_context, user_session, CONFIG.ENABLE_FEEDBACK_CARDS)
+            chart_info = answer_json.get('chart_info')
+            if not (chart_info and chart_info.get('suitable')):
+                chart_info = None
+            # 使用者偏好文字圖表或繪圖池過載時，直接將文字圖表嵌入回覆，不再排隊繪圖
+            text_chart_only = chart_info is not None and (
+                user_session.user_context.text_charts
+                or CHART_RENDER_POOL.is_overloaded(CONFIG.CHART_TEXT_FALLBACK_WAIT_MS)
+            )
+            if text_chart_only:
+                response = f"{response}\n\n{render_text_chart(chart_info, max_rows=CONFIG.CHART_TOP_N + 1)}"
+                CHART_RENDER_POOL.record_text_fallback()
+
+            # 圖表繪製與答案的組成同時進行
+            if chart_info is not None and not text_chart_only:
+                chart_task = asyncio.create_task(self._render_chart_reply(chart_info))
+            composer = ReplyComposer(turn_context, coalesce, metrics=REPLY_METRICS)
+            composer.add_text(response)
+
+            if coalesce:
+                # 答案、分頁表格與回饋卡合併為一個活動；圖表在短暫等待內完成（例如快取命中）時也一併合併
+                chart_merged = text_chart_only
+                composer.add_card(await self._build_first_result_page_card(turn_context, answer_json))
+                if chart_task is not None:
+                    done, _ = await asyncio.wait({chart_task}, timeout=CONFIG.REPLY_CHART_MERGE_WAIT_MS / 1000)
+                    if done:
+                        chart_card, chart_text = chart_task.result()
+                        chart_task = None
+                        if chart_text:
+                            composer.add_text(chart_text)
+                        composer.add_card(chart_card)
+                        chart_merged = True
+                composer.add_card(build_answer_feedback_card(user_session, CONFIG.ENABLE_FEEDBACK_CARDS))
+                await composer.flush()
+                answer_seconds = time.perf_counter() - turn_started
+                DELIVERY_METRICS.record(DeliveryMetrics.FIRST_ANSWER, answer_seconds)
+                if chart_merged:
+                    DELIVERY_METRICS.record(DeliveryMetrics.CHART, answer_seconds)
+                if chart_task is not None:
+                    await self._deliver_chart(turn_context, chart_task, turn_started)
+            else:
+                # 發送主要回應：格式化完成即送出，不等待圖表繪製
+                await composer.flush()
+                answer_seconds = time.perf_counter() - turn_started
+                DELIVERY_METRICS.record(DeliveryMetrics.FIRST_ANSWER, answer_seconds)
+                if text_chart_only:
+                    DELIVERY_METRICS.record(DeliveryMetrics.CHART, answer_seconds)
+
+                # 圖表繪製與分頁表格、回饋卡同時進行，圖表完成後以獨立訊息送出
+                deliveries = [self._send_answer_followups(turn_context, answer_json, user_session)]
+                if chart_task is not None:
+                    deliveries.append(self._deliver_chart(turn_context, chart_task, turn_started))
+                await asyncio.gather(*deliveries)
             
         except asyncio.TimeoutError:
             # ✅ 處理超時錯誤
             logger.warning(f"查詢超時，使用者: {user_session.get_display_name()}, 問題: {question}")
-            await turn_context.send_activity(
+            await self._send_error_reply(
+                turn_context,
+                user_session,
                 f"**👤 {user_session.name}**\n\n"
                 "⏱️ **查詢超時**\n\n"
                 "請嘗試：\n"
                 "• 更具體的篩選條件\n"
                 "• 較短的時間範圍\n"
-                "• 簡單的聚合（如總計）"
+                "• 簡單的聚合（如總計）",
+                coalesce,
             )
-            await send_feedback_card(turn_context, user_session, CONFIG.ENABLE_FEEDBACK_CARDS)
         except json.JSONDecodeError:
-            await turn_context.send_activity(
-                f"**👤 {user_session.name}**\n\n❌ 無法解碼伺服器的回應。"
+            await self._send_error_reply(
+                turn_context, user_session, f"**👤 {user_session.name}**\n\n❌ 無法解碼伺服器的回應。", coalesce
             )
-            await send_feedback_card(turn_context, user_session, CONFIG.ENABLE_FEEDBACK_CARDS)
         except Exception as e:
             logger.error(f"處理使用者 {user_session.get_display_name()} 的訊息時發生錯誤: {str(e)}")
-            await turn_context.send_activity(
-                f"**👤 {user_session.name}**\n\n❌ 處理您的請求時發生錯誤。"
+            await self._send_error_reply(
+                turn_context, user_session, f"**👤 {user_session.name}**\n\n❌ 處理您的請求時發生錯誤。", coalesce
             )
-            await send_feedback_card(turn_context, user_session, CONFIG.ENABLE_FEEDBACK_CARDS)
+        finally:
+            if chart_task is not None and not chart_task.done():
+                chart_task.cancel()
+
+    async def _send_error_reply(
+        self, turn_context: TurnContext, user_session: UserSession, text: str, coalesce: bool
+    ) -> None:
+        """送出錯誤訊息與回饋卡（頻道支援時合併為一個活動）"""
+        composer = ReplyComposer(turn_context, coalesce, metrics=REPLY_METRICS)
+        composer.add_text(text)
+        composer.add_card(build_answer_feedback_card(user_session, CONFIG.ENABLE_FEEDBACK_CARDS))
+        await composer.flush()
+
+    def _can_coalesce_replies(self, turn_context: TurnContext) -> bool:
+        """頻道支援單一活動附帶多張卡片時，將答案與卡片合併送出"""
+        channel_id = (turn_context.activity.channel_id or "").lower()
+        return CONFIG.REPLY_COALESCING and channel_id in REPLY_COALESCE_CHANNELS
+
+    async def on_turn(self, turn_context: TurnContext):
+        # 計算訊息回合送出的 Bot Connector 呼叫次數
+        if turn_context.activity.type != ActivityTypes.message:
+            return await super().on_turn(turn_context)
+        counter = REPLY_METRICS.track(turn_context)
+        try:
+            return await super().on_turn(turn_context)
+        finally:
+            REPLY_METRICS.finish(counter)
 
     async def on_invoke_activity(self, turn_context: TurnContext) -> InvokeResponse:
         # 處理調用活動（如 Adaptive Card 按鈕點擊）
@@ -470,7 +929,35 @@ class MyBot(ActivityHandler):
         # 處理 Adaptive Card 按鈕點擊（回饋提交）
         try:
             action = invoke_value.get("action")
-            
+            # Action.Execute（Universal Actions）將資料放在 action.data 中
+            if isinstance(action, dict):
+                invoke_value = action.get("data") or {}
+                action = invoke_value.get("action") or action.get("verb")
+
+            if action == RESULT_PAGE_ACTION:
+                page_card = await self._render_result_page(
+                    turn_context.activity.from_property.id, invoke_value
+                )
+                return InvokeResponse(
+                    status_code=200,
+                    body={
+                        "statusCode": 200,
+                        "type": "application/vnd.microsoft.card.adaptive",
+                        "value": page_card,
+                    },
+                )
+
+            if action == EXPORT_RESULT_ACTION:
+                message = await self._start_result_export(turn_context, invoke_value)
+                return InvokeResponse(
+                    status_code=200,
+                    body={
+                        "statusCode": 200,
+                        "type": "application/vnd.microsoft.activity.message",
+                        "value": message,
+                    },
+                )
+
             if action == "feedback":
                 message_id = invoke_value.get("messageId")
                 user_id = invoke_value.get("userId")
@@ -481,15 +968,16 @@ class MyBot(ActivityHandler):
                 
                 # 儲存回饋資料
                 feedback_key = f"{user_id}_{message_id}"
+                await self.session_persister.sync(user_id, self.user_sessions, self.email_sessions)
                 user_session = self.user_sessions.get(user_id)
-                self.message_feedback[feedback_key] = {
+                await self.message_feedback.set_async(feedback_key, {
                     "message_id": message_id,
                     "user_id": user_id,
                     "feedback": feedback,
                     "conversation_id": user_session.conversation_id if user_session else None,
                     "timestamp": datetime.now(timezone.utc).isoformat(),
                     "user_session": user_session.to_dict() if user_session else None
-                }
+                })
                 
                 # 發送回饋到 Databricks Genie API
                 try:
@@ -547,14 +1035,11 @@ class MyBot(ActivityHandler):
                 # 🎫 如果 Graph API 已啟用且成功取得使用者資訊，顯示用戶資料卡片
                 if user_session and self.graph_service and CONFIG.ENABLE_GRAPH_API_AUTO_LOGIN:
                     try:
-                        user_info = await self.graph_service.get_user_email_and_id(turn_context)
-                        if user_info and user_info.get('email'):
-                            # 取得完整的使用者資料（如果可用）
-                            token_response = await self.graph_service.get_user_token(turn_context)
-                            if token_response:
-                                full_profile = await self.graph_service.get_user_profile(token_response.token)
-                                user_info.update(full_profile)
-                            
+                        # 識別使用者時已快取完整的使用者資料，不需再次呼叫 Graph API
+                        user_info = await load_graph_user_context(
+                            self.user_context_cache, self.graph_service, turn_context
+                        )
+                        if user_info:
                             # 創建並發送使用者資料卡片
                             from graph_service import GraphService
                             user_card = GraphService.create_user_profile_card(user_info)
@@ -578,6 +1063,70 @@ class MyBot(ActivityHandler):
 
 BOT = MyBot(GENIE_SERVICE, GRAPH_SERVICE)
 
+# 背景回合在 turn_state 中記錄放入佇列的時間（time.perf_counter()）
+TURN_RECEIVED_AT_KEY = "genie_turn_received_at"
+
+
+async def authenticate_activity(activity: Activity, auth_header: str):
+    """驗證 Bot Connector 請求，回傳 (claims_identity, audience)；未授權時拋出 PermissionError"""
+    if hasattr(ADAPTER, 'process'):
+        # CloudAdapter
+        result = await ADAPTER.bot_framework_authentication.authenticate_request(activity, auth_header)
+        activity.caller_id = result.caller_id
+        return result.claims_identity, result.audience
+    # BotFrameworkAdapter
+    return await ADAPTER._authenticate_request(activity, auth_header), None
+
+
+async def process_queued_turn(item, received_at: float) -> None:
+    """以原始訊息的對話參考主動繼續對話，並在其中執行機器人回合"""
+    activity, claims_identity, audience = item
+
+    async def callback(turn_context: TurnContext):
+        # continue_conversation 建立的是 ContinueConversation 事件，改回原始訊息再交給機器人，
+        # 回覆仍以 reply_to_id 串接在使用者的訊息之後
+        turn_context.activity = activity
+        turn_context.turn_state[TURN_RECEIVED_AT_KEY] = received_at
+        await BOT.on_turn(turn_context)
+
+    await ADAPTER.continue_conversation(
+        TurnContext.get_conversation_reference(activity),
+        callback,
+        claims_identity=claims_identity,
+        audience=audience,
+    )
+
+
+# 背景回合佇列：/api/messages 驗證後立即回應，由工作者處理回合並主動送出回覆
+TURN_QUEUE = (
+    TurnQueue(process_queued_turn, CONFIG.TURN_QUEUE_WORKERS, CONFIG.TURN_QUEUE_MAX_DEPTH)
+    if CONFIG.ASYNC_TURN_PROCESSING
+    else None
+)
+
+
+# 以對話 ID + 活動 ID 去除 Bot Connector 重送的重複活動（多工作行程模式下跨行程共用）
+ACTIVITY_DEDUP = ActivityDeduplicator(
+    CONFIG.ACTIVITY_DEDUP_WINDOW_SECONDS,
+    CONFIG.ACTIVITY_DEDUP_MAX_ENTRIES,
+    shared=(
+        SharedMapping(BOT.shared_state, "activity_dedup", CONFIG.ACTIVITY_DEDUP_WINDOW_SECONDS)
+        if BOT.shared_state is not None
+        else None
+    ),
+)
+if ACTIVITY_DEDUP.shared is not None:
+    BOT.session_sweeper.stores.append(ACTIVITY_DEDUP.shared)
+
+
+def should_queue_activity(activity: Activity) -> bool:
+    """只有訊息活動改在背景處理；invoke 與 expectReplies 的回應必須放在 HTTP 回應本文中"""
+    return (
+        TURN_QUEUE is not None
+        and activity.type == ActivityTypes.message
+        and activity.delivery_mode != DeliveryModes.expect_replies
+    )
+
 
 async def health_check(req: Request) -> Response:
     """
@@ -601,8 +1150,11 @@ async def health_check(req: Request) -> Response:
         
         # 檢查 Databricks 連接
         try:
-            if GENIE_SERVICE and hasattr(GENIE_SERVICE, 'client'):
+            if GENIE_SERVICE and GENIE_SERVICE.client_ready:
                 health_status["checks"]["databricks"] = "connected"
+            elif GENIE_SERVICE:
+                # 客戶端仍在背景預熱中（或將於第一次查詢時建立）
+                health_status["checks"]["databricks"] = "initializing"
             else:
                 health_status["checks"]["databricks"] = "unavailable"
         except Exception as e:
@@ -631,48 +1183,244 @@ async def health_check(req: Request) -> Response:
         return json_response(data=error_response, status=503)
 
 
+async def metrics(req: Request) -> Response:
+    """回報各子系統的執行期統計"""
+    return json_response(
+        data={
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "worker_pid": os.getpid(),
+            "result_store": BOT.result_store.stats(),
+            "result_cursors": len(BOT.result_cursors),
+            "chart_render_pool": CHART_RENDER_POOL.stats(),
+            "chart_cache": CHART_CACHE.stats(),
+            "sessions": await BOT.session_stats(),
+            "delivery": DELIVERY_METRICS.summary(),
+            "turns": BOT.turn_scheduler.stats(),
+            "turn_queue": TURN_QUEUE.stats() if TURN_QUEUE is not None else None,
+            "activity_dedup": ACTIVITY_DEDUP.stats(),
+            "replies": REPLY_METRICS.summary(),
+        }
+    )
+
+
+async def download_export(req: Request) -> web.StreamResponse:
+    """提供已完成的匯出檔案下載"""
+    job = await BOT.result_exporter.get_job(req.match_info["job_id"], req.match_info["token"])
+    if not job or job.status != ExportJob.COMPLETED or not job.path.exists():
+        return Response(status=404, text="Export not found or expired")
+    return web.FileResponse(
+        job.path,
+        headers={
+            "Content-Type": job.content_type,
+            "Content-Disposition": f'attachment; filename="{job.filename}"',
+            "Cache-Control": "private, no-store",
+        },
+    )
+
+
+async def serve_chart(req: Request) -> Response:
+    """以簽章網址提供快取中的圖表圖片"""
+    key = req.match_info["key"]
+    if not chart_urls_enabled():
+        return Response(status=404, text="Chart not found")
+    if not verify_chart_signature(key, req.query.get("exp"), req.query.get("sig"), CONFIG.CHART_URL_SECRET):
+        return Response(status=403, text="Invalid or expired chart link")
+
+    etag = f'"{key}"'
+    # 內容以雜湊定址，同一網址的內容不會改變，快取期限與網址有效期相同
+    max_age = max(0, int(req.query["exp"]) - int(datetime.now(timezone.utc).timestamp()))
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, immutable",
+    }
+    if req.headers.get("If-None-Match") == etag:
+        return Response(status=304, headers=headers)
+
+    image = await CHART_CACHE.get_async(key, record=False)
+    if image is None or image.extension != req.match_info["ext"]:
+        return Response(status=404, text="Chart not found")
+    return Response(body=image.data, content_type=image.mime_type, headers=headers)
+
+
 async def messages(req: Request) -> Response:
-    if "application/json" in req.headers["Content-Type"]:
-        body = await req.json()
-    else:
+    if "application/json" not in req.headers.get("Content-Type", ""):
         return Response(status=415)
 
+    # 請求本文只讀取並解碼一次，之後兩種介面卡都直接使用解碼後的 Activity
+    # （超過 MAX_REQUEST_BODY_BYTES 時 aiohttp 回應 413）
+    try:
+        body = json_codec.loads(await req.read())
+    except ValueError:
+        return Response(status=400)
+    if not isinstance(body, dict):
+        return Response(status=400)
     activity = Activity().deserialize(body)
+    if not activity.type:
+        return Response(status=400)
     auth_header = req.headers.get("Authorization", "")
 
+    # 重送的活動不再處理：原始請求處理中時等待其結果，已完成時回傳原始的狀態碼與本文
+    async def handle() -> Tuple[int, Optional[bytes], Dict[str, str]]:
+        response = await process_activity_request(activity, auth_header)
+        return response.status, response.body, dict(response.headers)
+
+    status, body, headers = await ACTIVITY_DEDUP.process(
+        activity_dedup_key(activity),
+        handle,
+        status_of=lambda result: result[0],
+        duplicate=(DUPLICATE_STATUS, None, {}),
+        failed=(500, None, {}),
+        # 其他行程沒有 invoke 的回應本文（例如分頁卡片），invoke 只在本機去重複
+        local_only=activity.type == ActivityTypes.invoke,
+    )
+    return Response(status=status, body=body, headers=headers)
+
+
+def invoke_response_to_http(invoke_response: Optional[InvokeResponse]) -> Response:
+    if not invoke_response:
+        return Response(status=201)
+    body = invoke_response.body
+    if hasattr(body, "serialize"):
+        # Bot Framework 結構描述模型需轉為 camelCase 的 dict
+        body = serializer_helper(body)
+    # 以 status_code= 建立的 InvokeResponse 沒有 status（建構子會忽略該參數），視為 200
+    return json_response(data=body, status=invoke_response.status or 200)
+
+
+async def process_activity_request(activity: Activity, auth_header: str) -> Response:
     try:
+        if should_queue_activity(activity):
+            try:
+                claims_identity, audience = await authenticate_activity(activity, auth_header)
+            except PermissionError:
+                return Response(status=401)
+            if not TURN_QUEUE.submit((activity, claims_identity, audience)):
+                # 佇列已滿或關閉中：讓頻道稍後重送
+                return Response(status=503, headers={"Retry-After": "5"})
+            return Response(status=200)
+
         # 處理不同的介面卡類型
         if hasattr(ADAPTER, 'process'):
-            # CloudAdapter
-            response = await ADAPTER.process(req, BOT)
-            if response:
-                return json_response(data=response.body, status=response.status)
-            return Response(status=201)
+            # CloudAdapter - 不經過 ADAPTER.process(req)，避免重新讀取並解析請求本文
+            invoke_response = await ADAPTER.process_activity(auth_header, activity, BOT.on_turn)
         else:
             # BotFrameworkAdapter - 使用正確簽章的 process_activity 方法
-            response = await ADAPTER.process_activity(activity, auth_header, BOT.on_turn)
-            if response:
-                return json_response(data=response.body, status=response.status)
-            return Response(status=201)
+            invoke_response = await ADAPTER.process_activity(activity, auth_header, BOT.on_turn)
+        return invoke_response_to_http(invoke_response)
+    except PermissionError:
+        return Response(status=401)
     except Exception as e:
         logger.error(f"處理請求時發生錯誤: {str(e)}")
         return Response(status=500)
 
 
+async def warm_up_background_resources() -> None:
+    """在背景預熱 Databricks 客戶端與圖表繪圖池，不延遲 HTTP 端點開始接受請求"""
+    start = time.time()
+    results = await asyncio.gather(
+        GENIE_SERVICE.warm_up(),
+        CHART_RENDER_POOL.start(),
+        return_exceptions=True,
+    )
+    for name, result in zip(("Databricks 客戶端", "圖表繪圖池"), results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ {name}預熱失敗: {result}")
+    logger.info(f"🔥 背景預熱完成，耗時 {time.time() - start:.2f}s")
+
+
+async def on_app_startup(app: web.Application) -> None:
+    """應用程式啟動時還原工作階段，並在背景預熱重量級資源"""
+    # 在開始接受請求前還原，重新啟動後的第一則訊息不需重新識別使用者
+    try:
+        await asyncio.to_thread(BOT.session_persister.restore, BOT.user_sessions, BOT.email_sessions)
+    except Exception as e:
+        logger.error(f"❌ 還原工作階段失敗: {e}")
+    BOT.session_persister.start()
+    app["warm_up_task"] = asyncio.create_task(warm_up_background_resources())
+    BOT.session_sweeper.start()
+    if TURN_QUEUE is not None:
+        TURN_QUEUE.start()
+
+
+async def on_app_shutdown(app: web.Application) -> None:
+    """停止接受新請求後，在期限內處理完佇列中的回合"""
+    if TURN_QUEUE is not None:
+        await TURN_QUEUE.drain(CONFIG.TURN_QUEUE_DRAIN_SECONDS)
+
+
+async def on_app_cleanup(app: web.Application) -> None:
+    """應用程式關閉時釋放背景工作與連線"""
+    warm_up_task = app.get("warm_up_task")
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+    await BOT.result_exporter.close()
+    await BOT.session_sweeper.close()
+    await BOT.session_persister.close()
+    if BOT.shared_state is not None:
+        BOT.shared_state.close()
+    BOT.result_store.close()
+    CHART_RENDER_POOL.shutdown()
+
+
 def init_func(argv):
-    APP = web.Application(middlewares=[aiohttp_error_middleware])
+    APP = web.Application(middlewares=[aiohttp_error_middleware], client_max_size=CONFIG.MAX_REQUEST_BODY_BYTES)
+    APP.on_startup.append(on_app_startup)
+    APP.on_shutdown.append(on_app_shutdown)
+    APP.on_cleanup.append(on_app_cleanup)
     # 健康檢查端點
     APP.router.add_get("/api/health", health_check)
+    # 執行期統計端點
+    APP.router.add_get("/api/metrics", metrics)
     # Bot 訊息端點
     APP.router.add_post("/api/messages", messages)
+    # 查詢結果匯出下載端點
+    APP.router.add_get("/api/exports/{job_id}/{token}", download_export)
+    # 圖表圖片端點（以內容雜湊定址，需附帶簽章）
+    APP.router.add_get("/charts/{key:[0-9a-f]{64}}.{ext:png|webp|jpg}", serve_chart)
     return APP
 
 
-if __name__ == "__main__":
-    APP = init_func(None)
+def run_worker(host: str, port: int) -> None:
+    """多工作行程模式的單一行程：以 SO_REUSEPORT 與其他行程共用同一個埠"""
+    web.run_app(init_func(None), host=host, port=port, reuse_port=True)
+
+
+def serve_workers(workers: int, host: str, port: int) -> None:
+    """pre-fork 主行程：啟動 workers 個服務行程，結束時一併終止"""
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(host, port), name=f"web-worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"🚀 已啟動 {workers} 個服務行程，共用埠 {port}")
+    # 收到 SIGTERM（App Service 停止或部署）時結束等待並終止服務行程
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     try:
-        HOST = "0.0.0.0"
-        PORT = int(os.environ.get("PORT", CONFIG.PORT))
-        web.run_app(APP, host=HOST, port=PORT)
-    except Exception as error:
-        raise error
\ No newline at end of file
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        # 所有服務行程共用 10 秒的結束期限，逾時未結束者強制終止
+        deadline = time.monotonic() + 10
+        for process in processes:
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+        for process in processes:
+            if process.is_alive():
+                process.kill()
+
+
+if __name__ == "__main__":
+    HOST = "0.0.0.0"
+    PORT = int(os.environ.get("PORT", CONFIG.PORT))
+    if MULTI_WORKER and hasattr(socket, "SO_REUSEPORT"):
+        serve_workers(CONFIG.WEB_WORKERS, HOST, PORT)
+    else:
+        if MULTI_WORKER:
+            logger.warning("⚠️ 此平台不支援 SO_REUSEPORT，改以單一行程服務")
+        web.run_app(init_func(None), host=HOST, port=PORT)
@@ -0,0 +1,86 @@
+"""
+圖表編碼效能比較腳本
+
+比較舊的暫存檔路徑（savefig 到 NamedTemporaryFile → 讀回 → base64 → 刪檔）
+與目前的 render_chart_image 路徑（savefig 到重用的 BytesIO → base64）。
+兩者都包含建立圖表的時間。
+
+使用方法：
+    python bench_chart_encoding.py
+    python bench_chart_encoding.py --iterations 50
+"""
+
+import argparse
+import base64
+import statistics
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import chart_generator
+from test_chart_generation import test_bar_data, test_line_data, test_pie_data
+
+
+RENDERER = chart_generator.ChartRenderer()
+
+
+def encode_via_tempfile(chart_info) -> str:
+    """重現舊版的暫存檔編碼路徑"""
+    fig = RENDERER.build_figure(chart_info)
+    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
+        tmp_path = tmp.name
+    fig.savefig(tmp_path, format='png', dpi=100, bbox_inches='tight')
+    with open(tmp_path, 'rb') as image_file:
+        image_base64 = base64.b64encode(image_file.read()).decode('utf-8')
+    Path(tmp_path).unlink()
+    return image_base64
+
+
+def encode_in_memory(chart_info) -> str:
+    return chart_generator.render_chart_image(chart_info).to_base64()
+
+
+def run(encoder, iterations: int):
+    durations = []
+    sizes = []
+    charts = [test_bar_data, test_pie_data, test_line_data]
+    for idx in range(iterations):
+        start = time.perf_counter()
+        encoded = encoder(charts[idx % len(charts)])
+        durations.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(encoded))
+    return durations, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較圖表編碼路徑的效能")
+    parser.add_argument("--iterations", type=int, default=30, help="每種路徑的圖表數量")
+    args = parser.parse_args()
+
+    # 缺少 CJK 字型時 matplotlib 會對每張圖發出字形警告，略過以保持輸出可讀
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    # 預熱（字型快取、首次繪圖）
+    run(encode_in_memory, 3)
+
+    print("=" * 60)
+    print(f"📊 圖表編碼效能比較（每種路徑 {args.iterations} 張）")
+    print("=" * 60)
+    results = {}
+    for name, encoder in [("tempfile", encode_via_tempfile), ("in-memory", encode_in_memory)]:
+        durations, sizes = run(encoder, args.iterations)
+        total = sum(durations) / 1000
+        results[name] = statistics.mean(durations)
+        print(
+            f"{name:<10} 平均 {statistics.mean(durations):7.2f}ms  "
+            f"P95 {sorted(durations)[int(len(durations) * 0.95) - 1]:7.2f}ms  "
+            f"吞吐量 {args.iterations / total:6.1f} 張/秒  "
+            f"base64 平均 {statistics.mean(sizes) / 1024:.1f} KB"
+        )
+    print("-" * 60)
+    print(f"加速比: {results['tempfile'] / results['in-memory']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+/api/messages 進入路徑的每請求成本量測腳本
+
+比較舊版與目前的活動解碼方式（不含網路與機器人邏輯）：
+- 舊版 CloudAdapter：messages() 以 req.json() 解碼並建立 Activity 後，
+  ADAPTER.process(req) 再讀取並解碼一次
+- 舊版 BotFrameworkAdapter：以 req.json()（標準函式庫 json）解碼一次
+- 目前：讀取一次本文，以 json_codec（安裝 orjson 時使用 orjson）解碼一次
+
+另外比較 /api/metrics 等 JSON 回應的編碼成本。
+
+使用方法：
+    python bench_ingress.py
+    python bench_ingress.py --iterations 20000
+"""
+
+import argparse
+import json
+import time
+
+from botbuilder.schema import Activity
+
+import json_codec
+
+SAMPLE_ACTIVITY = {
+    "type": "message",
+    "id": "1718000000000",
+    "timestamp": "2024-06-10T08:00:00.000Z",
+    "localTimestamp": "2024-06-10T16:00:00.000+08:00",
+    "serviceUrl": "https://smba.trafficmanager.net/apac/",
+    "channelId": "msteams",
+    "from": {
+        "id": "29:1AbCdEfGhIjKlMnOpQrStUvWxYz",
+        "name": "王小明",
+        "aadObjectId": "00000000-0000-0000-0000-000000000001",
+    },
+    "conversation": {
+        "conversationType": "personal",
+        "tenantId": "00000000-0000-0000-0000-0000000000aa",
+        "id": "a:1XyZ-conversation-id-with-a-realistic-length-0123456789abcdef",
+    },
+    "recipient": {"id": "28:00000000-0000-0000-0000-0000000000bb", "name": "Genie Bot"},
+    "textFormat": "plain",
+    "locale": "zh-TW",
+    "text": "請列出本月各地區的營收，並與上個月比較成長率",
+    "entities": [
+        {"locale": "zh-TW", "country": "TW", "platform": "Windows", "timezone": "Asia/Taipei", "type": "clientInfo"}
+    ],
+    "channelData": {"tenant": {"id": "00000000-0000-0000-0000-0000000000aa"}},
+    "value": {"action": "feedback", "feedback": "positive", "message_id": "msg-0123456789", "details": "答案正確"},
+}
+
+SAMPLE_METRICS = {
+    "timestamp": "2024-06-10T08:00:00+00:00",
+    "worker_pid": 12345,
+    "sessions": {
+        name: {"entries": 1200, "max_entries": 50000, "ttl_seconds": 86400, "estimated_bytes": 480000}
+        for name in ("user_sessions", "email_sessions", "message_feedback", "pending_email_input")
+    },
+    "delivery": {kind: {"count": 500, "p50_ms": 820.5, "p95_ms": 2400.0} for kind in ("text", "chart")},
+    "turns": {"mode": "supersede", "active_users": 12, "started": 5000, "queued": 3, "superseded": 40},
+}
+
+
+def _per_request_us(func, payload, iterations: int) -> float:
+    for _ in range(min(iterations, 200)):
+        func(payload)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(payload)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def legacy_single(raw: bytes) -> Activity:
+    # aiohttp 的 req.json() 先解碼為 str，再以標準函式庫 json 解析
+    return Activity().deserialize(json.loads(raw.decode("utf-8")))
+
+
+def legacy_cloud_adapter(raw: bytes) -> Activity:
+    legacy_single(raw)
+    return legacy_single(raw)
+
+
+def current(raw: bytes) -> Activity:
+    return Activity().deserialize(json_codec.loads(raw))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測 /api/messages 每請求的解碼成本")
+    parser.add_argument("--iterations", type=int, default=10_000, help="每種方式的重複次數")
+    args = parser.parse_args()
+
+    raw = json.dumps(SAMPLE_ACTIVITY, ensure_ascii=False).encode("utf-8")
+    assert current(raw).text == legacy_single(raw).text
+
+    rows = [
+        ("舊版 CloudAdapter（解碼兩次）", _per_request_us(legacy_cloud_adapter, raw, args.iterations)),
+        ("舊版 BotFrameworkAdapter（json）", _per_request_us(legacy_single, raw, args.iterations)),
+        (f"目前（{json_codec.CODEC_NAME}，解碼一次）", _per_request_us(current, raw, args.iterations)),
+    ]
+    baseline = rows[0][1]
+
+    print("=" * 60)
+    print(f"📨 活動解碼成本（本文 {len(raw):,} bytes、{args.iterations:,} 次）")
+    print("=" * 60)
+    for label, micros in rows:
+        print(f"{label:<36} {micros:8.1f} µs/req  x{baseline / micros:4.2f}")
+
+    aiohttp_dumps = _per_request_us(json.dumps, SAMPLE_METRICS, args.iterations)
+    codec_dumps = _per_request_us(json_codec.dumps_bytes, SAMPLE_METRICS, args.iterations)
+    print()
+    print(f"{'JSON 回應（aiohttp json.dumps）':<36} {aiohttp_dumps:8.1f} µs/req")
+    print(f"{'JSON 回應（' + json_codec.CODEC_NAME + '）':<36} {codec_dumps:8.1f} µs/req")
+
+
+if __name__ == "__main__":
+    main()
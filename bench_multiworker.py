@@ -0,0 +1,241 @@
+"""
+多工作行程服務的吞吐量量測腳本
+
+以不同的 WEB_WORKERS 啟動 app.py（Genie API 以固定延遲的模擬回應取代，Bot Connector
+以本機的模擬服務取代），對 /api/messages 持續送出訊息活動，比較每秒可完成的訊息數。
+使用者工作階段事先寫入共用的 SQLite 資料庫，任何一個行程都能處理任何使用者的訊息。
+
+使用方法：
+    python bench_multiworker.py
+    python bench_multiworker.py --workers 1 2 4 --messages 2000 --concurrency 64 --genie-latency-ms 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+ROOT = Path(__file__).resolve().parent
+
+# 設定此環境變數時本檔以服務模式執行（spawn 出的服務行程重新匯入本檔時也會套用模擬）
+SERVE_ENV = "BENCH_MULTIWORKER_SERVE"
+GENIE_LATENCY_ENV = "BENCH_GENIE_LATENCY_MS"
+
+BENCH_ENV = {
+    "DATABRICKS_HOST": os.getenv("DATABRICKS_HOST", "https://example.cloud.databricks.com"),
+    "DATABRICKS_TOKEN": os.getenv("DATABRICKS_TOKEN", "bench-token"),
+    "DATABRICKS_SPACE_ID": os.getenv("DATABRICKS_SPACE_ID", "bench-space"),
+    "CHART_RENDER_EXECUTOR": "thread",
+    "ENABLE_FEEDBACK_CARDS": "False",
+}
+
+MOCK_ANSWER = {
+    "query_description": "各地區本月營收",
+    "columns": {
+        "columns": [
+            {"name": "region", "type_name": "STRING"},
+            {"name": "revenue", "type_name": "DOUBLE"},
+        ]
+    },
+    "data": {
+        "data_array": [
+            ["北區", "1250000.5"],
+            ["中區", "980000.0"],
+            ["南區", "1100000.25"],
+            ["東區", "450000.75"],
+            ["離島", "120000.0"],
+        ]
+    },
+    "sql": "SELECT region, SUM(amount) AS revenue FROM sales GROUP BY region",
+}
+
+if os.environ.get(SERVE_ENV):
+    import genie_service
+
+    async def _mock_ask(self, question, space_id, user_session, conversation_id=None):
+        await asyncio.sleep(float(os.environ.get(GENIE_LATENCY_ENV, "50")) / 1000)
+        answer = json.dumps(MOCK_ANSWER, ensure_ascii=False)
+        return answer, conversation_id or f"conv-{uuid.uuid4().hex[:8]}", uuid.uuid4().hex[:12]
+
+    genie_service.GenieService.ask = _mock_ask
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed_sessions(path: str, users: int) -> None:
+    """事先建立使用者工作階段（偏好文字圖表，量測不受 matplotlib 繪圖影響）"""
+    from session_persistence import SQLiteSessionBackend
+    from user_session import UserSession
+
+    sessions = []
+    for index in range(users):
+        session = UserSession(f"bench-user-{index}", f"user{index}@example.com")
+        session.user_context.text_charts = True
+        sessions.append(session)
+    backend = SQLiteSessionBackend(path)
+    backend.save_many(sessions)
+    backend.close()
+
+
+async def start_mock_connector() -> web.AppRunner:
+    """模擬 Bot Connector 服務，接受機器人送出的回覆"""
+
+    async def reply(request: web.Request) -> web.Response:
+        await request.read()
+        return web.json_response({"id": uuid.uuid4().hex})
+
+    connector = web.Application()
+    connector.router.add_post("/v3/conversations/{conversation_id}/activities", reply)
+    connector.router.add_post("/v3/conversations/{conversation_id}/activities/{activity_id}", reply)
+    runner = web.AppRunner(connector, access_log=None)
+    await runner.setup()
+    return runner
+
+
+def _activity(index: int, users: int, service_url: str) -> dict:
+    user = index % users
+    return {
+        "type": "message",
+        "id": uuid.uuid4().hex,
+        "text": "本月各地區的營收是多少？",
+        "channelId": "emulator",
+        "serviceUrl": service_url,
+        "from": {"id": f"bench-user-{user}", "name": f"user{user}"},
+        "recipient": {"id": "bench-bot"},
+        "conversation": {"id": f"bench-conversation-{user}"},
+    }
+
+
+async def _wait_until_ready(session: aiohttp.ClientSession, base_url: str, workers: int, timeout: float) -> None:
+    """等待所有服務行程都回應過 /api/metrics（每次使用新連線，由核心分配到不同行程）"""
+    deadline = time.perf_counter() + timeout
+    pids = set()
+    while len(pids) < workers:
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"only {len(pids)} of {workers} workers became ready")
+        try:
+            async with session.get(f"{base_url}/api/metrics", headers={"Connection": "close"}) as response:
+                pids.add((await response.json())["worker_pid"])
+        except aiohttp.ClientConnectionError:
+            await asyncio.sleep(0.1)
+
+
+async def measure_throughput(workers: int, args) -> tuple:
+    """以 workers 個服務行程啟動 app，回傳 (每秒訊息數, 失敗數)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        session_db = str(Path(tmp) / "sessions.db")
+        seed_sessions(session_db, args.users)
+
+        connector_runner = await start_mock_connector()
+        connector_port = _free_port()
+        await web.TCPSite(connector_runner, "127.0.0.1", connector_port).start()
+        service_url = f"http://127.0.0.1:{connector_port}"
+
+        port = _free_port()
+        env = dict(os.environ)
+        env.update(BENCH_ENV)
+        env.update(
+            {
+                SERVE_ENV: "1",
+                GENIE_LATENCY_ENV: str(args.genie_latency_ms),
+                "PYTHONPATH": str(ROOT),
+                "WEB_WORKERS": str(workers),
+                "SESSION_DB_PATH": session_db,
+                "SHARED_STATE_PATH": str(Path(tmp) / "shared_state.db"),
+                "CHART_CACHE_DIR": str(Path(tmp) / "charts"),
+            }
+        )
+        process = subprocess.Popen(
+            [sys.executable, __file__, "--serve", "--port", str(port)],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            connector = aiohttp.TCPConnector(limit=args.concurrency)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                await _wait_until_ready(session, base_url, workers, timeout=120)
+                counter = iter(range(args.messages))
+                failures = 0
+
+                async def client():
+                    nonlocal failures
+                    for index in counter:
+                        payload = _activity(index, args.users, service_url)
+                        async with session.post(f"{base_url}/api/messages", json=payload) as response:
+                            await response.read()
+                            if response.status >= 400:
+                                failures += 1
+
+                start = time.perf_counter()
+                await asyncio.gather(*(client() for _ in range(args.concurrency)))
+                elapsed = time.perf_counter() - start
+            return args.messages / elapsed, failures
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            await connector_runner.cleanup()
+
+
+def serve(port: int) -> None:
+    """服務模式：依 WEB_WORKERS 以單一行程或 pre-fork 多行程啟動 app"""
+    import app
+
+    if app.MULTI_WORKER:
+        app.serve_workers(app.CONFIG.WEB_WORKERS, "127.0.0.1", port)
+    else:
+        web.run_app(app.init_func(None), host="127.0.0.1", port=port, print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較不同服務行程數的訊息吞吐量")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="要比較的服務行程數")
+    parser.add_argument("--messages", type=int, default=2000, help="每次量測送出的訊息數")
+    parser.add_argument("--concurrency", type=int, default=64, help="同時進行中的請求數")
+    parser.add_argument("--users", type=int, default=500, help="模擬的使用者數")
+    parser.add_argument("--genie-latency-ms", type=float, default=50, help="模擬的 Genie API 延遲")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    print("=" * 60)
+    print(
+        f"📈 訊息吞吐量（{args.messages:,} 則訊息、{args.concurrency} 個並行請求、"
+        f"Genie 延遲 {args.genie_latency_ms:.0f}ms、CPU 核心數 {os.cpu_count()}）"
+    )
+    print("=" * 60)
+    baseline = None
+    for workers in args.workers:
+        throughput, failures = asyncio.run(measure_throughput(workers, args))
+        baseline = baseline or throughput
+        print(
+            f"{'WEB_WORKERS=' + str(workers):<20} {throughput:8.1f} msg/s  "
+            f"x{throughput / baseline:4.2f}  失敗 {failures}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+工作階段記憶體用量比較腳本
+
+比較舊版 UserSession（每個實例一個 __dict__、兩個含時區的 datetime、自由格式的
+user_context dict）與目前以 __slots__、epoch 浮點數時間戳與固定欄位 UserContext
+實作的 UserSession，以 tracemalloc 量測每個工作階段佔用的位元組數。
+
+使用方法：
+    python bench_session_memory.py
+    python bench_session_memory.py --sessions 200000
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Optional
+
+from user_session import UserSession
+
+SAMPLE_SQL = "SELECT region, SUM(amount) AS total FROM sales WHERE month = '2024-06' GROUP BY region"
+
+
+class LegacyUserSession:
+    """重現舊版的 UserSession 結構"""
+
+    def __init__(self, user_id: str, email: str, name: Optional[str] = None):
+        self.user_id = user_id
+        self.email = email
+        self.name = name or email.split('@')[0]
+        self.conversation_id: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.last_activity = datetime.now(timezone.utc)
+        self.is_authenticated = True
+        self.user_context: dict = {}
+        self.aad_object_id: Optional[str] = None
+        self.upn: Optional[str] = None
+
+
+def populate_legacy(index: int) -> LegacyUserSession:
+    session = LegacyUserSession(f"29:user-{index}", f"user{index}@example.com")
+    session.conversation_id = f"conv-{index:08d}"
+    session.aad_object_id = f"aad-{index:08d}"
+    session.user_context['last_question'] = "本月各地區的營收是多少？"
+    session.user_context['last_response_time'] = datetime.now(timezone.utc).isoformat()
+    session.user_context['last_genie_message_id'] = f"msg-{index:08d}"
+    session.user_context['last_sql'] = SAMPLE_SQL
+    session.user_context['query_count'] = 3
+    return session
+
+
+def populate_compact(index: int) -> UserSession:
+    session = UserSession(f"29:user-{index}", f"user{index}@example.com")
+    session.conversation_id = f"conv-{index:08d}"
+    session.aad_object_id = f"aad-{index:08d}"
+    context = session.user_context
+    context.last_question = "本月各地區的營收是多少？"
+    context.last_response_at = time.time()
+    context.last_message_id = f"msg-{index:08d}"
+    context.last_sql = SAMPLE_SQL
+    context.query_count = 3
+    return session
+
+
+def bytes_per_session(factory, count: int) -> float:
+    """建立 count 個工作階段，回傳每個工作階段增加的記憶體位元組數"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        sessions = {f"29:user-{index}": factory(index) for index in range(count)}
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert len(sessions) == count
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較工作階段的記憶體用量")
+    parser.add_argument("--sessions", type=int, default=100_000, help="建立的工作階段數")
+    args = parser.parse_args()
+
+    legacy = bytes_per_session(populate_legacy, args.sessions)
+    compact = bytes_per_session(populate_compact, args.sessions)
+
+    print("=" * 60)
+    print(f"🧠 每個工作階段的記憶體用量（{args.sessions:,} 個工作階段，含字串內容）")
+    print("=" * 60)
+    print(f"{'舊版（__dict__ + datetime + dict）':<36} {legacy:8.0f} bytes")
+    print(f"{'目前（__slots__ + float + UserContext）':<36} {compact:8.0f} bytes")
+    print(f"{'節省':<36} {1 - compact / legacy:8.1%}")
+    print(f"{'10 萬使用者合計':<36} {legacy * 1e5 / 2**20:6.1f}MB → {compact * 1e5 / 2**20:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+啟動時間量測腳本
+
+1. 在全新的直譯器中分別匯入各主要模組，回報每個模組的匯入耗時
+2. 以子行程啟動 app.py，量測從啟動到第一個 /api/health 與 /api/messages 請求被接受的時間
+
+未設定 Databricks 環境變數時會使用假值；Databricks 客戶端與圖表繪圖池
+在背景預熱，不影響端點開始接受請求的時間。
+
+使用方法：
+    python bench_startup.py
+    python bench_startup.py --runs 5
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parent
+
+MODULES = [
+    "botbuilder.core",
+    "botbuilder.integration.aiohttp",
+    "databricks.sdk",
+    "matplotlib",
+    "seaborn",
+    "chart_generator",
+    "genie_service",
+    "app",
+]
+
+BENCH_ENV = {
+    "DATABRICKS_HOST": os.getenv("DATABRICKS_HOST", "https://example.cloud.databricks.com"),
+    "DATABRICKS_TOKEN": os.getenv("DATABRICKS_TOKEN", "bench-token"),
+    "DATABRICKS_SPACE_ID": os.getenv("DATABRICKS_SPACE_ID", "bench-space"),
+}
+
+# 不需要回覆的 typing 活動，只用來確認訊息端點已可處理請求
+TYPING_ACTIVITY = {
+    "type": "typing",
+    "id": "bench-1",
+    "channelId": "emulator",
+    "serviceUrl": "http://localhost:9",
+    "from": {"id": "bench-user"},
+    "recipient": {"id": "bench-bot"},
+    "conversation": {"id": "bench-conversation"},
+}
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.update(BENCH_ENV)
+    env["PYTHONPATH"] = str(ROOT)
+    return env
+
+
+def measure_import(module: str) -> float:
+    """在全新的直譯器中匯入模組並回傳耗時（毫秒）"""
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print((time.perf_counter() - start) * 1000)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=_env(), capture_output=True, text=True, timeout=120
+    )
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1])
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_until_accepted(session: aiohttp.ClientSession, method: str, url: str, start: float, **kwargs):
+    while True:
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                return (time.perf_counter() - start) * 1000, response.status
+        except aiohttp.ClientConnectionError:
+            await asyncio.sleep(0.01)
+
+
+async def measure_time_to_first_request(timeout: float = 60.0):
+    """啟動 app.py，回傳 (health 就緒毫秒, health 狀態碼, messages 接受毫秒, messages 狀態碼)"""
+    port = _free_port()
+    env = _env()
+    env["PORT"] = str(port)
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "app.py"], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            health_ms, health_status = await asyncio.wait_for(
+                _wait_until_accepted(session, "GET", f"{base_url}/api/health", start), timeout
+            )
+            messages_ms, messages_status = await _wait_until_accepted(
+                session, "POST", f"{base_url}/api/messages", start, json=TYPING_ACTIVITY
+            )
+        return health_ms, health_status, messages_ms, messages_status
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測模組匯入與應用程式啟動時間")
+    parser.add_argument("--runs", type=int, default=3, help="每項量測的重複次數（取中位數）")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"📦 模組匯入耗時（全新直譯器，{args.runs} 次中位數）")
+    print("=" * 60)
+    for module in MODULES:
+        try:
+            durations = [measure_import(module) for _ in range(args.runs)]
+            print(f"{module:<32} {statistics.median(durations):8.1f}ms")
+        except Exception as exc:
+            print(f"{module:<32} 匯入失敗: {exc}")
+
+    print("=" * 60)
+    print(f"🚀 啟動到第一個請求被接受（{args.runs} 次中位數）")
+    print("=" * 60)
+    results = [asyncio.run(measure_time_to_first_request()) for _ in range(args.runs)]
+    health_ms = statistics.median(result[0] for result in results)
+    messages_ms = statistics.median(result[2] for result in results)
+    print(f"{'/api/health':<32} {health_ms:8.1f}ms  (HTTP {results[-1][1]})")
+    print(f"{'/api/messages':<32} {messages_ms:8.1f}ms  (HTTP {results[-1][3]})")
+
+
+if __name__ == "__main__":
+    main()
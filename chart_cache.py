@@ -0,0 +1,287 @@
+"""Content-addressed cache for rendered chart images.
+
+相同的查詢結果（重複提問、重新整理、多位使用者問同一個問題）會產生位元組完全相同的
+圖表。此模組以正規化後 chart_info 的雜湊值作為鍵，將已編碼的圖片保存在有記憶體預算的
+LRU 中，並可選擇持久化到本機磁碟，讓重複的圖表只需一次雜湊查詢而不必重新繪圖。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from chart_image import EXTENSION_MIME_TYPES, ChartImage
+
+logger = logging.getLogger(__name__)
+
+# 圖表樣式（顏色、字型、尺寸等）變更時遞增，使舊的快取圖片失效
+CHART_STYLE_VERSION = 1
+
+# 影響繪圖結果的 chart_info 欄位；其餘欄位（例如 suitable、reason）不納入雜湊
+_RENDER_KEYS = (
+    "chart_type",
+    "category_column",
+    "value_column",
+    "data_for_chart",
+    "categories",
+    "series",
+    "bar_mode",
+    "series_column",
+)
+
+
+def _normalize_value(value: Any) -> Any:
+    # 1000 與 1000.0 繪出的圖相同，統一為 float 避免產生不同的鍵
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    return value
+
+
+def chart_cache_key(chart_info: Dict[str, Any], variant: str = "") -> str:
+    """計算 chart_info 的內容雜湊（十六進位 sha256）
+
+    variant 為影響輸出的其他設定（例如編碼預算與允許的格式）。
+    """
+    normalized = {key: chart_info.get(key) for key in _RENDER_KEYS}
+    normalized["data_for_chart"] = [
+        {name: _normalize_value(value) for name, value in point.items()}
+        for point in normalized["data_for_chart"] or []
+    ]
+    if normalized["series"]:
+        normalized["series"] = [
+            {"name": item.get("name"), "values": [_normalize_value(value) for value in item.get("values") or []]}
+            for item in normalized["series"]
+        ]
+    normalized["style_version"] = CHART_STYLE_VERSION
+    normalized["variant"] = variant
+    canonical = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _chart_signature(key: str, expires: int, secret: str) -> str:
+    message = f"{key}:{expires}".encode("utf-8")
+    return hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()[:32]
+
+
+def sign_chart_path(key: str, secret: str, ttl_seconds: float, extension: str = "png", now: Optional[float] = None) -> str:
+    """產生帶有到期時間與 HMAC 簽章的圖表路徑（/charts/{key}.{ext}?exp=...&sig=...）"""
+    expires = int((now if now is not None else time.time()) + ttl_seconds)
+    return f"/charts/{key}.{extension}?exp={expires}&sig={_chart_signature(key, expires, secret)}"
+
+
+def verify_chart_signature(key: str, expires: str, signature: str, secret: str, now: Optional[float] = None) -> bool:
+    """驗證圖表路徑的簽章且尚未過期"""
+    try:
+        expires_at = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires_at < (now if now is not None else time.time()):
+        return False
+    return hmac.compare_digest(_chart_signature(key, expires_at, secret), signature or "")
+
+
+class ChartImageCache:
+    """以內容雜湊為鍵、具記憶體預算的圖表圖片 LRU 快取（可選擇磁碟持久化）
+
+    shared_disk 為 True 時磁碟目錄由多個行程共用：索引中找不到的鍵仍會檢查磁碟，
+    讓由其他行程繪製的圖表也能從 /charts 端點提供。
+    """
+
+    def __init__(
+        self,
+        memory_budget_bytes: int = 32 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_budget_bytes: int = 256 * 1024 * 1024,
+        shared_disk: bool = False,
+    ):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.disk_budget_bytes = disk_budget_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.shared_disk = shared_disk and self.disk_dir is not None
+        self._memory: "OrderedDict[str, ChartImage]" = OrderedDict()
+        # 磁碟索引：key -> (檔案大小, 副檔名)
+        self._disk: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._render_ms_saved = 0.0
+        self._render_ms_total = 0.0
+        self._renders = 0
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._load_disk_index()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._memory or key in self._disk
+
+    def __len__(self) -> int:
+        return len(self._memory.keys() | self._disk.keys())
+
+    def get(self, key: str, record: bool = True) -> Optional[ChartImage]:
+        """讀取快取圖片；未命中時回傳 None
+
+        record 為 False 時不計入命中率（例如 HTTP 端點提供已發送的圖片）。
+        """
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                if record:
+                    self._hits += 1
+                    self._render_ms_saved += image.render_ms + image.encode_ms
+                return image
+            if key not in self._disk and not (self.shared_disk and self._discover_disk_locked(key)):
+                if record:
+                    self._misses += 1
+                return None
+
+        loaded = self._read_disk(key)
+        with self._lock:
+            if loaded is None:
+                if record:
+                    self._misses += 1
+                return None
+            # 磁碟上只保存圖片位元組，以目前的平均繪圖耗時估算節省的時間
+            data, extension = loaded
+            image = ChartImage(
+                data,
+                mime_type=EXTENSION_MIME_TYPES.get(extension, "image/png"),
+                render_ms=self._average_render_ms(),
+            )
+            if record:
+                self._hits += 1
+                self._disk_hits += 1
+                self._render_ms_saved += image.render_ms
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._put_memory_locked(key, image)
+            return image
+
+    async def get_async(self, key: str, record: bool = True) -> Optional[ChartImage]:
+        """同 get；記憶體未命中而需查詢或讀取磁碟時在執行緒中進行，不阻塞事件迴圈"""
+        if key in self._memory or self.disk_dir is None:
+            return self.get(key, record)
+        return await asyncio.to_thread(self.get, key, record)
+
+    def put(self, key: str, image: ChartImage) -> None:
+        """保存新繪製的圖片，並記錄其繪圖耗時作為日後命中時節省的時間"""
+        if self._put_memory(key, image):
+            self._write_disk(key, image.data, image.extension)
+
+    async def put_async(self, key: str, image: ChartImage) -> None:
+        """同 put；磁碟寫入在執行緒中進行，不阻塞事件迴圈"""
+        if self._put_memory(key, image):
+            await asyncio.to_thread(self._write_disk, key, image.data, image.extension)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "render_ms_saved": round(self._render_ms_saved, 1),
+            }
+
+    def _average_render_ms(self) -> float:
+        return self._render_ms_total / self._renders if self._renders else 0.0
+
+    def _put_memory(self, key: str, image: ChartImage) -> bool:
+        """記錄繪圖耗時並放入記憶體層，回傳是否還需寫入磁碟"""
+        with self._lock:
+            self._renders += 1
+            self._render_ms_total += image.render_ms + image.encode_ms
+            self._put_memory_locked(key, image)
+            return self.disk_dir is not None and key not in self._disk
+
+    def _put_memory_locked(self, key: str, image: ChartImage) -> None:
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.byte_size
+        if image.byte_size > self.memory_budget_bytes:
+            return
+        self._memory[key] = image
+        self._memory_bytes += image.byte_size
+        while self._memory_bytes > self.memory_budget_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.byte_size
+            self._evictions += 1
+
+    def _disk_path(self, key: str, extension: str) -> Path:
+        return self.disk_dir / f"{key}.{extension}"
+
+    def _load_disk_index(self) -> None:
+        """啟動時掃描磁碟快取目錄，依修改時間由舊到新建立 LRU 索引"""
+        files = sorted(
+            (path for path in self.disk_dir.iterdir() if path.suffix[1:] in EXTENSION_MIME_TYPES),
+            key=lambda path: path.stat().st_mtime,
+        )
+        for path in files:
+            size = path.stat().st_size
+            self._disk[path.stem] = (size, path.suffix[1:])
+            self._disk_bytes += size
+        if files:
+            logger.info(f"🗂️ 已載入 {len(files)} 張磁碟快取圖表（{self._disk_bytes} bytes）")
+
+    def _discover_disk_locked(self, key: str) -> bool:
+        """檢查其他行程是否已將此鍵寫入共用的磁碟目錄，找到時加入索引"""
+        for extension in EXTENSION_MIME_TYPES:
+            try:
+                size = self._disk_path(key, extension).stat().st_size
+            except OSError:
+                continue
+            self._disk[key] = (size, extension)
+            self._disk_bytes += size
+            return True
+        return False
+
+    def _read_disk(self, key: str) -> Optional[Tuple[bytes, str]]:
+        try:
+            extension = self._disk[key][1]
+            return self._disk_path(key, extension).read_bytes(), extension
+        except (KeyError, OSError):
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, (0, ""))[0]
+            return None
+
+    def _write_disk(self, key: str, data: bytes, extension: str) -> None:
+        path = self._disk_path(key, extension)
+        # 暫存檔名包含行程 ID，共用目錄時多個行程同時寫入同一張圖也不會互相覆蓋
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            # 先寫入暫存檔再改名，避免其他讀取者看到寫到一半的圖片
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning(f"⚠️ 無法寫入圖表磁碟快取: {exc}")
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk.pop(key, (0, ""))[0]
+            self._disk[key] = (len(data), extension)
+            while self._disk_bytes > self.disk_budget_bytes and self._disk:
+                evicted, (size, evicted_extension) = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self._disk_path(evicted, evicted_extension).unlink(missing_ok=True)
@@ -0,0 +1,157 @@
+"""Adaptive Card builders for chart images.
+
+此模組不依賴 matplotlib，主行程只需以已繪製好的圖片網址組出卡片，
+不必為了建立卡片而載入繪圖庫。
+"""
+
+
+def create_chart_error_card(error: Exception) -> dict:
+    """圖表生成失敗時顯示的 Adaptive Card"""
+    return {
+        "type": "AdaptiveCard",
+        "version": "1.5",
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "body": [
+            {
+                "type": "TextBlock",
+                "text": "⚠️ 圖表生成失敗",
+                "weight": "Bolder",
+                "color": "Warning"
+            },
+            {
+                "type": "TextBlock",
+                "text": f"錯誤訊息: {str(error)}",
+                "wrap": True,
+                "isSubtle": True
+            }
+        ]
+    }
+
+
+def chart_title(chart_info: dict) -> str:
+    """圖表標題（類別欄位 vs 數值欄位；多系列時列出所有量值或拆分欄位）"""
+    category_col = chart_info['category_column']
+    series = chart_info.get('series') or []
+    if chart_info.get('series_column'):
+        return f"{category_col} vs {chart_info['value_column']}（依 {chart_info['series_column']}）"
+    if len(series) > 1:
+        return f"{category_col} vs {', '.join(item['name'] for item in series)}"
+    return f"{category_col} vs {chart_info['value_column']}"
+
+
+def chart_sample_note(chart_info: dict) -> str:
+    """圖表只使用結果的前幾筆資料時的提示，否則為空字串"""
+    sample = chart_info.get('sample')
+    if not sample:
+        return ""
+    return f"⚠️ 圖表僅依前 {sample['rows']:,} 筆資料繪製（共 {sample['total_rows']:,} 筆）"
+
+
+def _data_summary(chart_info: dict, chart_name: str) -> str:
+    """圖表下方的資料摘要；資料經過縮減或只使用前幾筆時一併說明"""
+    summary = _reduction_summary(chart_info, chart_name)
+    note = chart_sample_note(chart_info)
+    return f"{note}\n\n{summary}" if note else summary
+
+
+def _reduction_summary(chart_info: dict, chart_name: str) -> str:
+    chart_data = chart_info['data_for_chart']
+    reduction = chart_info.get('reduction')
+    if reduction and reduction.get('method') == 'top_n':
+        return (
+            f"📊 共 {reduction['original_points']:,} 筆數據，顯示前 {len(chart_data) - 1} 項"
+            f"，其餘合併為「其他」 | {chart_name}"
+        )
+    if reduction and reduction.get('method') == 'lttb':
+        return f"📊 共 {reduction['original_points']:,} 筆數據，降採樣為 {len(chart_data)} 點 | {chart_name}"
+    series = chart_info.get('series') or []
+    if len(series) > 1:
+        return f"📊 共 {len(chart_info['categories'])} 個類別 × {len(series)} 個系列 | {chart_name}"
+    return f"📊 共 {len(chart_data)} 筆數據 | {chart_name}"
+
+
+def build_chart_card(chart_info: dict, image_url: str) -> dict:
+    """以已生成的圖表圖片 URL 建立 Adaptive Card
+    
+    Args:
+        chart_info: 圖表信息字典
+        image_url: 圖片 URL（data URI 或 HTTP URL）
+    
+    Returns:
+        Adaptive Card JSON 結構
+    """
+    chart_type = chart_info['chart_type']
+    
+    # 圖表類型對應的中文名稱和圖示
+    chart_names = {
+        'bar': ('長條圖', '📊'),
+        'pie': ('圓餅圖', '🥧'),
+        'line': ('折線圖', '📈')
+    }
+    chart_name, chart_icon = chart_names.get(chart_type, ('圖表', '📊'))
+    
+    card = {
+        "type": "AdaptiveCard",
+        "version": "1.5",
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "body": [
+            {
+                "type": "Container",
+                "style": "emphasis",
+                "items": [
+                    {
+                        "type": "ColumnSet",
+                        "columns": [
+                            {
+                                "type": "Column",
+                                "width": "auto",
+                                "items": [
+                                    {
+                                        "type": "TextBlock",
+                                        "text": chart_icon,
+                                        "size": "Large"
+                                    }
+                                ]
+                            },
+                            {
+                                "type": "Column",
+                                "width": "stretch",
+                                "items": [
+                                    {
+                                        "type": "TextBlock",
+                                        "text": f"數據視覺化 - {chart_name}",
+                                        "weight": "Bolder",
+                                        "size": "Medium",
+                                        "color": "Accent"
+                                    },
+                                    {
+                                        "type": "TextBlock",
+                                        "text": chart_title(chart_info),
+                                        "isSubtle": True,
+                                        "spacing": "None"
+                                    }
+                                ]
+                            }
+                        ]
+                    }
+                ]
+            },
+            {
+                "type": "Image",
+                "url": image_url,
+                "size": "Stretch",
+                "spacing": "Medium"
+            },
+            {
+                "type": "TextBlock",
+                "text": _data_summary(chart_info, chart_name),
+                "wrap": True,
+                "isSubtle": True,
+                "size": "Small",
+                "horizontalAlignment": "Center",
+                "spacing": "Small"
+            }
+        ]
+    }
+    
+    return card
@@ -0,0 +1,138 @@
+"""Size-budgeted image encoding for rendered chart figures.
+
+圖表原本固定以 dpi=100 的全彩 PNG 輸出。此模組在繪圖之後加入一個編碼階段：
+在每個 DPI 等級下嘗試全彩 PNG、調色盤量化 PNG 以及（允許時）WebP / JPEG，
+取最小的輸出；若仍超出位元組預算則降低 DPI 重試，但不低於可辨識的最低 DPI。
+選用的格式、DPI、大小與編碼耗時都記錄在 ChartImage.encoding 中。
+"""
+
+from __future__ import annotations
+
+import io
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from chart_image import ChartImage
+
+SUPPORTED_FORMATS = ("png", "webp", "jpeg")
+
+# 調色盤量化的顏色數；圖表多為少量純色，64 色以上肉眼難以分辨差異
+PALETTE_COLORS = 128
+# 有損格式的品質下限，低於此值文字邊緣會出現明顯雜訊
+LOSSY_QUALITY = 85
+
+
+class ChartEncodeOptions:
+    """圖表編碼設定（需可序列化，以便傳給繪圖子行程）"""
+
+    def __init__(
+        self,
+        byte_budget: int = 64 * 1024,
+        formats: Tuple[str, ...] = ("png",),
+        base_dpi: int = 100,
+        min_dpi: int = 72,
+        dpi_step: int = 14,
+    ):
+        unknown = [fmt for fmt in formats if fmt not in SUPPORTED_FORMATS]
+        if unknown:
+            raise ValueError(f"unsupported chart image format(s): {', '.join(unknown)}")
+        self.byte_budget = byte_budget
+        self.formats = tuple(formats) or ("png",)
+        self.base_dpi = base_dpi
+        self.min_dpi = min(min_dpi, base_dpi)
+        self.dpi_step = max(1, dpi_step)
+
+    @classmethod
+    def from_config(cls, config) -> "ChartEncodeOptions":
+        formats = tuple(fmt.strip().lower() for fmt in config.CHART_IMAGE_FORMATS.split(",") if fmt.strip())
+        return cls(
+            byte_budget=config.CHART_IMAGE_BUDGET_KB * 1024,
+            formats=formats,
+            min_dpi=config.CHART_IMAGE_MIN_DPI,
+        )
+
+    def dpi_levels(self) -> List[int]:
+        levels = list(range(self.base_dpi, self.min_dpi, -self.dpi_step))
+        return levels + [self.min_dpi]
+
+    def fingerprint(self) -> str:
+        """編碼設定摘要，納入圖表快取鍵，設定變更時不會取到舊的圖片"""
+        return f"{self.byte_budget}:{','.join(self.formats)}:{self.base_dpi}:{self.min_dpi}:{self.dpi_step}"
+
+
+class _Candidate:
+    __slots__ = ("data", "mime_type", "settings")
+
+    def __init__(self, data: bytes, mime_type: str, settings: Dict[str, Any]):
+        self.data = data
+        self.mime_type = mime_type
+        self.settings = settings
+
+
+def _save_png(fig, buffer: io.BytesIO, dpi: int) -> bytes:
+    buffer.seek(0)
+    buffer.truncate(0)
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def _alternatives(png: bytes, dpi: int, formats: Tuple[str, ...]) -> List[_Candidate]:
+    """由全彩 PNG 產生調色盤量化 PNG 與其他允許格式的候選輸出"""
+    from PIL import Image  # Pillow 為 matplotlib 的相依套件
+
+    candidates = []
+    with Image.open(io.BytesIO(png)) as source:
+        rgb = source.convert("RGB")
+
+    quantized = rgb.quantize(colors=PALETTE_COLORS, method=Image.Quantize.FASTOCTREE)
+    out = io.BytesIO()
+    quantized.save(out, format="PNG", optimize=True)
+    candidates.append(_Candidate(out.getvalue(), "image/png", {"format": "png", "dpi": dpi, "colors": PALETTE_COLORS}))
+
+    for fmt in formats:
+        if fmt == "png":
+            continue
+        out = io.BytesIO()
+        rgb.save(out, format=fmt.upper(), quality=LOSSY_QUALITY)
+        candidates.append(
+            _Candidate(out.getvalue(), f"image/{fmt}", {"format": fmt, "dpi": dpi, "quality": LOSSY_QUALITY})
+        )
+    return candidates
+
+
+def encode_figure(
+    fig,
+    options: Optional[ChartEncodeOptions] = None,
+    buffer: Optional[io.BytesIO] = None,
+) -> ChartImage:
+    """依位元組預算編碼圖表，回傳最小且可辨識的輸出"""
+    options = options or ChartEncodeOptions()
+    buffer = buffer if buffer is not None else io.BytesIO()
+    start = time.perf_counter()
+    attempts = 0
+    best: Optional[_Candidate] = None
+
+    for dpi in options.dpi_levels():
+        png = _save_png(fig, buffer, dpi)
+        candidates = [_Candidate(png, "image/png", {"format": "png", "dpi": dpi, "colors": None})]
+        candidates.extend(_alternatives(png, dpi, options.formats))
+        attempts += len(candidates)
+
+        smallest = min(candidates, key=lambda candidate: len(candidate.data))
+        if best is None or len(smallest.data) < len(best.data):
+            best = smallest
+        # 高 DPI 的輸出已符合預算時不再降低解析度
+        if len(best.data) <= options.byte_budget:
+            break
+
+    encode_ms = (time.perf_counter() - start) * 1000
+    image = ChartImage(best.data, mime_type=best.mime_type, encode_ms=encode_ms)
+    image.encoding = dict(
+        best.settings,
+        bytes=len(best.data),
+        budget=options.byte_budget,
+        within_budget=len(best.data) <= options.byte_budget,
+        attempts=attempts,
+        encode_ms=round(encode_ms, 1),
+    )
+    return image
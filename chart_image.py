@@ -0,0 +1,40 @@
+"""Lightweight container for encoded chart images.
+
+此模組不依賴 matplotlib，讓主行程可以接收子行程繪製好的圖片而不必匯入繪圖庫。
+"""
+
+import base64
+
+# 圖片 MIME 類型對應的副檔名（/charts 端點的網址與磁碟快取檔名使用）
+IMAGE_EXTENSIONS = {
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/jpeg": "jpg",
+}
+EXTENSION_MIME_TYPES = {extension: mime_type for mime_type, extension in IMAGE_EXTENSIONS.items()}
+
+
+class ChartImage:
+    """已編碼的圖表圖片與其大小、耗時資訊"""
+
+    def __init__(self, data: bytes, mime_type: str = "image/png", render_ms: float = 0.0, encode_ms: float = 0.0):
+        self.data = data
+        self.mime_type = mime_type
+        self.render_ms = render_ms
+        self.encode_ms = encode_ms
+        # 編碼階段選用的設定（格式、DPI、顏色數、大小等）
+        self.encoding = {}
+
+    @property
+    def byte_size(self) -> int:
+        return len(self.data)
+
+    @property
+    def extension(self) -> str:
+        return IMAGE_EXTENSIONS.get(self.mime_type, "png")
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode('ascii')
+
+    def data_uri(self) -> str:
+        return f"data:{self.mime_type};base64,{self.to_base64()}"
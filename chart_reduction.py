@@ -0,0 +1,187 @@
+"""Data reduction for charting large query results.
+
+大型結果原本完全不繪圖。此模組在繪圖前將資料縮減到適合圖表的點數：
+類別圖表保留數值最大的前 N 個類別並將其餘合併為「其他」；
+時間序列折線圖以 LTTB（Largest-Triangle-Three-Buckets）降採樣到與圖寬相符的點數。
+兩者都以 numpy 對數值欄位做向量化運算，十萬筆資料也能快速處理。
+"""
+
+from __future__ import annotations
+
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+OTHER_CATEGORY = "其他"
+
+
+def to_numeric(raw_values: List[Any]) -> np.ndarray:
+    """將欄位值轉為 float 陣列，None 或無法轉換的值為 NaN"""
+    values = np.array(raw_values, dtype=object)
+    values[values == None] = np.nan  # noqa: E711 - 物件陣列需以 == 逐元素比較
+    try:
+        return values.astype(np.float64)
+    except (TypeError, ValueError):
+        # 混有非數值字串時才逐一轉換
+        def _to_float(value: Any) -> float:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return np.nan
+
+        return np.fromiter((_to_float(value) for value in values), dtype=np.float64, count=len(values))
+
+
+def top_n_rows(
+    categories: np.ndarray,
+    matrix: np.ndarray,
+    top_n: int,
+    other_label: str = OTHER_CATEGORY,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """依各列總和保留前 top_n 個類別（遞減），其餘逐欄加總為「其他」
+
+    matrix 為 (類別數, 系列數) 的陣列；單一系列時只有一欄。
+    """
+    if len(matrix) <= top_n:
+        return categories, matrix
+
+    totals = np.nansum(matrix, axis=1)
+    # argpartition 只做部分排序（O(n)），再對前 N 個排序
+    top = np.argpartition(-totals, top_n - 1)[:top_n]
+    top = top[np.argsort(-totals[top], kind="stable")]
+    rest = np.ones(len(matrix), dtype=bool)
+    rest[top] = False
+
+    labels = np.append(categories[top], other_label)
+    reduced = np.vstack([matrix[top], np.nansum(matrix[rest], axis=0)])
+    return labels, reduced
+
+
+def lttb_indices(values: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets 降採樣，回傳保留點的索引（已排序）
+
+    x 軸為資料點的順序位置。每個 bucket 內以向量化方式計算三角形面積，
+    僅依序迭代 bucket（數量等於輸出點數）。
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.arange(n, dtype=np.float64)
+    y = values
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # 第一個與最後一個點固定保留，其餘點平均分配到 threshold - 2 個 bucket
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < threshold - 1:
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+            next_x = x[next_start:next_end].mean()
+            next_y = y[next_start:next_end].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs(
+            (x[previous] - next_x) * (bucket_y - y[previous])
+            - (x[previous] - bucket_x) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def multi_series_lttb_indices(matrix: np.ndarray, threshold: int) -> np.ndarray:
+    """多條折線共用的 LTTB 索引：各系列分配 threshold / 系列數 個點後取聯集"""
+    n, series_count = matrix.shape
+    if threshold >= n:
+        return np.arange(n)
+    if series_count == 1:
+        return lttb_indices(matrix[:, 0], threshold)
+    per_series = max(3, threshold // series_count)
+    keep = [lttb_indices(np.nan_to_num(matrix[:, idx]), per_series) for idx in range(series_count)]
+    return np.unique(np.concatenate(keep))
+
+
+def pivot_series(
+    categories: List[Any],
+    series_keys: List[Any],
+    raw_values: List[Any],
+) -> Tuple[List[str], List[str], np.ndarray]:
+    """將長格式（類別, 系列, 數值）轉為寬格式 (類別數, 系列數) 矩陣，缺值為 NaN
+
+    類別與系列皆依第一次出現的順序排列；同一格有多筆時加總。
+    """
+    category_index: dict = {}
+    series_index: dict = {}
+    rows = np.fromiter(
+        (category_index.setdefault(_label(category), len(category_index)) for category in categories),
+        dtype=np.int64,
+        count=len(categories),
+    )
+    cols = np.fromiter(
+        (series_index.setdefault(_label(key), len(series_index)) for key in series_keys),
+        dtype=np.int64,
+        count=len(series_keys),
+    )
+    values = to_numeric(raw_values)
+    valid = ~np.isnan(values)
+
+    matrix = np.zeros((len(category_index), len(series_index)), dtype=np.float64)
+    seen = np.zeros_like(matrix, dtype=bool)
+    np.add.at(matrix, (rows[valid], cols[valid]), values[valid])
+    seen[rows[valid], cols[valid]] = True
+    matrix[~seen] = np.nan
+    return list(category_index), list(series_index), matrix
+
+
+def _label(value: Any) -> str:
+    return "N/A" if value is None else str(value)
+
+
+def reduce_series(
+    categories: List[Any],
+    matrix: np.ndarray,
+    chart_type: str,
+    top_n: int,
+    max_line_points: int,
+) -> Tuple[List[str], List[List[Optional[float]]], Optional[dict]]:
+    """將一或多個系列縮減到適合繪圖的點數
+
+    Args:
+        categories: 類別（或時間）標籤
+        matrix: (類別數, 系列數) 的數值陣列，缺值為 NaN
+
+    Returns:
+        (類別標籤, 各系列的數值（缺值為 None）, reduction)；未縮減時 reduction 為 None
+    """
+    labels = np.array([_label(category) for category in categories], dtype=object)
+    # 所有系列皆無數值的類別不繪製
+    valid = ~np.all(np.isnan(matrix), axis=1)
+    labels, matrix = labels[valid], matrix[valid]
+    original_points = len(labels)
+
+    reduction = None
+    if chart_type == "line":
+        if original_points > max_line_points:
+            keep = multi_series_lttb_indices(matrix, max_line_points)
+            labels, matrix = labels[keep], matrix[keep]
+            reduction = {"method": "lttb", "original_points": original_points, "points": len(keep)}
+    else:
+        # 長條圖的缺值視為 0
+        matrix = np.nan_to_num(matrix)
+        labels, matrix = top_n_rows(labels, matrix, top_n)
+        if original_points > top_n:
+            reduction = {"method": "top_n", "original_points": original_points, "points": len(labels)}
+
+    series = [
+        [None if np.isnan(value) else value for value in matrix[:, idx].tolist()]
+        for idx in range(matrix.shape[1])
+    ]
+    return [str(label) for label in labels], series, reduction
+
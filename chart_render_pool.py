@@ -0,0 +1,282 @@
+"""Bounded process / thread pool for chart rendering.
+
+Matplotlib 繪圖是同步且 CPU 密集的工作，若直接在 on_message_activity 中執行，
+會阻塞 aiohttp 事件迴圈並拖慢所有使用者的回合。此模組將繪圖交給預先啟動、
+已匯入 matplotlib 的子行程執行，並提供單次繪圖逾時、佇列深度上限，
+以及忙碌時跳過圖表的降級行為。
+
+chart_generator 的繪製器不使用 pyplot 全域狀態，因此也可以選擇以執行緒池繪圖
+（executor="thread"），省去跨行程傳輸與子行程的記憶體成本。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from chart_cache import ChartImageCache, chart_cache_key
+from chart_encoder import ChartEncodeOptions
+
+logger = logging.getLogger(__name__)
+
+PROCESS_EXECUTOR = "process"
+THREAD_EXECUTOR = "thread"
+
+
+def _init_worker(font_path: Optional[str] = None, encode_options: Optional[ChartEncodeOptions] = None) -> None:
+    """worker 初始化：匯入 matplotlib / seaborn、註冊中文字型並繪製預熱圖表，
+    讓第一張使用者圖表與之後的圖表一樣快"""
+    import chart_generator
+
+    try:
+        chart_generator.warm_up(font_path, encode_options)
+    except Exception as e:  # 預熱失敗不影響 worker 之後的正常繪圖
+        logger.warning(f"⚠️ 圖表 worker 預熱失敗: {e}")
+
+
+def _warm_up_worker() -> float:
+    """確認 worker 已啟動並完成初始化，回傳本次呼叫的時間戳"""
+    return time.time()
+
+
+def _render_in_worker(
+    chart_info: Dict[str, Any],
+    submitted_at: float,
+    encode_options: Optional[ChartEncodeOptions] = None,
+) -> Tuple[Any, float, float]:
+    """在子行程中繪圖，回傳 (ChartImage, 佇列等待秒數, 繪圖秒數)
+
+    回傳原始 PNG 位元組而非 base64 字串，跨行程傳輸的資料量少約 25%。
+    """
+    import chart_generator
+
+    started_at = time.time()
+    image = chart_generator.render_chart_image(chart_info, encode_options)
+    return image, started_at - submitted_at, time.time() - started_at
+
+
+class ChartRenderResult:
+    """單張圖表的繪圖結果與耗時"""
+
+    def __init__(
+        self,
+        image: Any,
+        render_ms: float,
+        queue_wait_ms: float,
+        cache_key: Optional[str] = None,
+        cached: bool = False,
+    ):
+        self.image = image
+        self.render_ms = render_ms
+        self.queue_wait_ms = queue_wait_ms
+        self.cache_key = cache_key
+        self.cached = cached
+
+
+class ChartRenderPool:
+    """有界的圖表繪圖行程池（或執行緒池）"""
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_queue_depth: int = 8,
+        render_timeout: float = 15.0,
+        executor: str = PROCESS_EXECUTOR,
+        cache: Optional[ChartImageCache] = None,
+        encode_options: Optional[ChartEncodeOptions] = None,
+        font_path: Optional[str] = None,
+    ):
+        if executor not in (PROCESS_EXECUTOR, THREAD_EXECUTOR):
+            raise ValueError(f"unsupported chart render executor: {executor}")
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.render_timeout = render_timeout
+        self.executor_kind = executor
+        self.cache = cache
+        self.encode_options = encode_options
+        self.font_path = font_path
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._render_ms = deque(maxlen=200)
+        self._queue_wait_ms = deque(maxlen=200)
+        self._encode_ms = deque(maxlen=200)
+        self._image_bytes = deque(maxlen=200)
+        self._rendered = 0
+        self._saturated = 0
+        self._timeouts = 0
+        self._failures = 0
+        self._restarts = 0
+        self._formats: Dict[str, int] = {}
+        self._over_budget = 0
+        self._text_fallbacks = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def estimated_wait_ms(self) -> float:
+        """估計新提交的圖表需等待多久才能開始繪製
+
+        佇列中超出 worker 數的工作需依序等待，以近期平均繪圖耗時推算。
+        """
+        queued = self._pending - self.max_workers + 1
+        if queued <= 0 or not self._render_ms:
+            return 0.0
+        average_ms = sum(self._render_ms) / len(self._render_ms)
+        return -(-queued // self.max_workers) * average_ms
+
+    def is_overloaded(self, wait_threshold_ms: float) -> bool:
+        """佇列已滿或預估等待時間超過門檻時視為過載"""
+        return self._pending >= self.max_queue_depth or self.estimated_wait_ms() > wait_threshold_ms
+
+    def record_text_fallback(self) -> None:
+        """記錄一次以文字圖表取代圖片的回覆"""
+        self._text_fallbacks += 1
+
+    async def start(self) -> None:
+        """建立行程池（或執行緒池）並預先啟動所有 worker"""
+        if self._executor is not None:
+            return
+        start = time.time()
+        if self.executor_kind == THREAD_EXECUTOR:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="chart-render",
+                initializer=_init_worker,
+                initargs=(self.font_path, self.encode_options),
+            )
+        else:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.font_path, self.encode_options),
+            )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self._executor, _warm_up_worker) for _ in range(self.max_workers))
+        )
+        logger.info(
+            f"🎨 圖表繪圖池已啟動（{self.executor_kind}，{self.max_workers} 個 worker，"
+            f"耗時 {time.time() - start:.2f}s）"
+        )
+
+    async def render(self, chart_info: Dict[str, Any]) -> Optional[ChartRenderResult]:
+        """繪製圖表；行程池飽和或逾時時回傳 None，由呼叫端降級為純文字回覆
+
+        設定了快取時先以內容雜湊查詢，相同的圖表不會重新繪製。
+        """
+        cache_key = None
+        if self.cache is not None:
+            variant = self.encode_options.fingerprint() if self.encode_options else ""
+            cache_key = chart_cache_key(chart_info, variant)
+        if cache_key is not None:
+            cached = await self.cache.get_async(cache_key)
+            if cached is not None:
+                logger.info(f"🎨 圖表快取命中（{chart_info.get('chart_type')}, {cached.byte_size} bytes）")
+                return ChartRenderResult(cached, 0.0, 0.0, cache_key=cache_key, cached=True)
+
+        if self._executor is None:
+            await self.start()
+
+        if self._pending >= self.max_queue_depth:
+            self._saturated += 1
+            logger.warning(f"⚠️ 圖表繪圖佇列已滿（{self._pending}/{self.max_queue_depth}），略過圖表")
+            return None
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            future = loop.run_in_executor(executor, _render_in_worker, chart_info, time.time(), self.encode_options)
+        except BrokenExecutor:
+            self._reset_broken_executor(executor)
+            return None
+        # 逾時後 worker 仍在繪圖，佇列深度在工作實際結束時才減少
+        self._pending += 1
+        future.add_done_callback(self._on_render_done)
+        try:
+            image, queue_wait, render_time = await asyncio.wait_for(
+                asyncio.shield(future), timeout=self.render_timeout
+            )
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            logger.warning(f"⏱️ 圖表繪圖逾時（>{self.render_timeout}s），略過圖表")
+            return None
+        except BrokenExecutor:
+            self._reset_broken_executor(executor)
+            return None
+        except Exception:
+            self._failures += 1
+            raise
+
+        result = ChartRenderResult(image, render_time * 1000, max(0.0, queue_wait) * 1000, cache_key=cache_key)
+        if cache_key is not None:
+            await self.cache.put_async(cache_key, image)
+        self._rendered += 1
+        self._render_ms.append(result.render_ms)
+        self._queue_wait_ms.append(result.queue_wait_ms)
+        self._encode_ms.append(image.encode_ms)
+        self._image_bytes.append(image.byte_size)
+        encoding = image.encoding or {}
+        encoded_as = f"{encoding.get('format', image.extension)}@{encoding.get('dpi', '-')}dpi"
+        self._formats[encoded_as] = self._formats.get(encoded_as, 0) + 1
+        if encoding and not encoding.get("within_budget", True):
+            self._over_budget += 1
+        logger.info(
+            f"🎨 圖表已生成\n"
+            f"  類型:         {chart_info.get('chart_type')}\n"
+            f"  繪圖耗時:     {result.render_ms:.0f}ms\n"
+            f"  編碼耗時:     {image.encode_ms:.0f}ms\n"
+            f"  編碼設定:     {encoded_as}, colors={encoding.get('colors')}, quality={encoding.get('quality')}\n"
+            f"  圖片大小:     {image.byte_size} bytes（預算 {encoding.get('budget', '-')}）\n"
+            f"  佇列等待:     {result.queue_wait_ms:.0f}ms"
+        )
+        return result
+
+    def _on_render_done(self, future: asyncio.Future) -> None:
+        self._pending -= 1
+        if not future.cancelled():
+            future.exception()  # 逾時後才結束的工作不會有人讀取結果，避免未讀取例外的警告
+
+    def _reset_broken_executor(self, executor: Optional[Executor]) -> None:
+        """worker 異常終止（例如 OOM）後行程池無法再使用，捨棄並於下一張圖表重新建立"""
+        self._failures += 1
+        if executor is not None and self._executor is executor:
+            self._restarts += 1
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.error("❌ 圖表繪圖池的 worker 異常終止，將於下一張圖表重新建立繪圖池")
+
+    def stats(self) -> Dict[str, Any]:
+        def _avg(values) -> float:
+            return round(sum(values) / len(values), 1) if values else 0.0
+
+        return {
+            "executor": self.executor_kind,
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "max_queue_depth": self.max_queue_depth,
+            "rendered": self._rendered,
+            "saturated": self._saturated,
+            "timeouts": self._timeouts,
+            "failures": self._failures,
+            "restarts": self._restarts,
+            "avg_render_ms": _avg(self._render_ms),
+            "avg_queue_wait_ms": _avg(self._queue_wait_ms),
+            "avg_encode_ms": _avg(self._encode_ms),
+            "avg_image_bytes": _avg(self._image_bytes),
+            "encodings": dict(self._formats),
+            "over_budget": self._over_budget,
+            "estimated_wait_ms": round(self.estimated_wait_ms(), 1),
+            "text_fallbacks": self._text_fallbacks,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -2,11 +2,12 @@
 
 from __future__ import annotations
 
-from typing import Dict
+from typing import MutableMapping, Optional
 
 from botbuilder.core import TurnContext
 from botbuilder.schema import Activity, ActivityTypes
 
+from user_context_cache import UserContextCache, load_graph_user_context
 from user_session import UserSession
 
 
@@ -16,9 +17,10 @@ async def handle_special_commands(
     user_session: UserSession,
     config,
     format_timestamp,
-    user_sessions: Dict[str, UserSession],
-    email_sessions: Dict[str, UserSession],
+    user_sessions: MutableMapping[str, UserSession],
+    email_sessions: MutableMapping[str, UserSession],
     graph_service=None,
+    user_context_cache: Optional[UserContextCache] = None,
 ) -> bool:
     lowered = question.lower()
 
@@ -28,6 +30,8 @@ async def handle_special_commands(
             email = parts[1]
             name = parts[2] if len(parts) > 2 else email.split('@')[0]
             session = UserSession(turn_context.activity.from_property.id, email, name)
+            if user_context_cache is not None:
+                user_context_cache.invalidate(session.user_id)
             user_sessions[session.user_id] = session
             email_sessions[email] = session
             await turn_context.send_activity(
@@ -54,6 +58,7 @@ async def handle_special_commands(
             "**使用者指令：**\n"
             "- `whoami` 或 `/me` - 顯示您的使用者資訊（包括 Graph API 資料卡片）\n"
             "- `help` - 顯示詳細的機器人資訊\n"
+            "- `textchart` - 切換圖表以文字（Unicode 長條 / sparkline）或圖片呈現\n"
             "- `logout` - 清除您的工作階段（您將在下一條訊息中重新識別）"
         )
         if is_emulator:
@@ -94,14 +99,14 @@ async def handle_special_commands(
             try:
                 from botbuilder.schema import Attachment
                 
-                # 取得完整的使用者資料
-                user_detail = await graph_service.get_user_email_and_id(turn_context)
-                token_response = await graph_service.get_user_token(turn_context)
+                # 取得完整的使用者資料（識別使用者時已快取，不需再次呼叫 Graph API）
+                if user_context_cache is not None:
+                    user_detail = await load_graph_user_context(user_context_cache, graph_service, turn_context)
+                else:
+                    user_detail = await graph_service.get_user_email_and_id(turn_context)
                 
-                if token_response and user_detail:
-                    full_profile = await graph_service.get_user_profile(token_response.token)
-                    user_detail.update(full_profile)
-                    
+                # 只有透過 OAuth 取得 Graph 個人資料時才顯示資料卡片
+                if user_detail and user_detail.get('source') == 'graph':
                     # 創建用戶資料卡片
                     from graph_service import GraphService
                     user_card = GraphService.create_user_profile_card(user_detail)
@@ -127,6 +132,8 @@ async def handle_special_commands(
     if lowered in ["logout", "/logout", "sign out", "disconnect"]:
         user_id = user_session.user_id
         email = user_session.email
+        if user_context_cache is not None:
+            user_context_cache.invalidate(user_id)
         user_sessions.pop(user_id, None)
         email_sessions.pop(email, None)
         await turn_context.send_activity(
@@ -135,6 +142,16 @@ async def handle_special_commands(
         )
         return True
 
+    if lowered in ["textchart", "/textchart", "text chart"]:
+        enabled = not user_session.user_context.text_charts
+        user_session.user_context.text_charts = enabled
+        await turn_context.send_activity(
+            "📊 **圖表將以文字呈現**\n\n回覆會直接附上 Unicode 長條圖或 sparkline，不再等待圖片繪製。"
+            if enabled
+            else "🖼️ **圖表將以圖片呈現**"
+        )
+        return True
+
     if lowered in ["help", "/help", "commands", "/commands", "information", "about", "what is this"]:
         await turn_context.send_activity(
             "🤖 **Databricks Genie 機器人資訊**\n\n"
@@ -152,6 +169,7 @@ async def handle_special_commands(
             "    • `help` - 顯示此資訊\n\n"
             "    • `info` - 獲取入門協助\n\n"
             "    • `whoami` 或 `/me` - 顯示您的使用者資訊和 Graph API 資料\n\n"
+            "    • `textchart` - 切換圖表以文字或圖片呈現\n\n"
             "    • `reset` - 開始新的對話\n\n"
             "    • `new chat` - 開始新的對話\n\n"
             "    • `logout` - 清除您的工作階段\n\n"
@@ -175,7 +193,7 @@ async def handle_special_commands(
     ]
     if lowered in [trigger.lower() for trigger in new_conversation_triggers]:
         user_session.conversation_id = None
-        user_session.user_context.pop('last_conversation_id', None)
+        user_session.user_context.reset_conversation()
         await turn_context.send_activity(
             f"🔄 **正在開始新對話，{user_session.name}！**\n\n"
             "您現在可以詢問我任何有關您關心的資料問題。"
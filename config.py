@@ -59,4 +59,104 @@ class DefaultConfig:
     
     # Feedback settings
     ENABLE_FEEDBACK_CARDS = os.getenv("ENABLE_FEEDBACK_CARDS", "True").lower() == "true"
-    ENABLE_GENIE_FEEDBACK_API = os.getenv("ENABLE_GENIE_FEEDBACK_API", "True").lower() == "true"
\ No newline at end of file
+    ENABLE_GENIE_FEEDBACK_API = os.getenv("ENABLE_GENIE_FEEDBACK_API", "True").lower() == "true"
+
+    # Session store settings
+    # 工作階段閒置超過 SESSION_IDLE_TTL_HOURS 後釋放（對話本身仍在閒置 4 小時後重置）
+    SESSION_IDLE_TTL_HOURS = float(os.getenv("SESSION_IDLE_TTL_HOURS", "24"))
+    SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "50000"))
+    SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300"))
+    PENDING_EMAIL_TTL_MINUTES = float(os.getenv("PENDING_EMAIL_TTL_MINUTES", "30"))
+    # Graph / Teams 身分資訊快取（自寫入起算的存活時間，登出時個別清除）
+    USER_CONTEXT_CACHE_TTL_MINUTES = float(os.getenv("USER_CONTEXT_CACHE_TTL_MINUTES", "60"))
+    USER_CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("USER_CONTEXT_CACHE_MAX_ENTRIES", "10000"))
+    # 工作階段持久化：sqlite（預設，重新啟動後還原）或 memory（不持久化）
+    SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "sqlite")
+    SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "")
+    SESSION_FLUSH_INTERVAL_SECONDS = float(os.getenv("SESSION_FLUSH_INTERVAL_SECONDS", "5"))
+
+    # Turn scheduling
+    # 同一位使用者同時最多一個進行中的 Genie 問題：supersede（新問題取代並取消先前的問題）或 queue（排隊）
+    TURN_SCHEDULER_MODE = os.getenv("TURN_SCHEDULER_MODE", "supersede").lower()
+
+    # HTTP ingress
+    # /api/messages 請求本文的大小上限（位元組），超過時回應 413
+    MAX_REQUEST_BODY_BYTES = int(os.getenv("MAX_REQUEST_BODY_BYTES", str(1024 * 1024)))
+
+    # Background turn processing
+    # 啟用時 /api/messages 驗證後立即回應，訊息回合由背景工作者處理並主動送出回覆
+    ASYNC_TURN_PROCESSING = os.getenv("ASYNC_TURN_PROCESSING", "False").lower() == "true"
+    TURN_QUEUE_WORKERS = int(os.getenv("TURN_QUEUE_WORKERS", "32"))
+    TURN_QUEUE_MAX_DEPTH = int(os.getenv("TURN_QUEUE_MAX_DEPTH", "1000"))
+    TURN_QUEUE_DRAIN_SECONDS = float(os.getenv("TURN_QUEUE_DRAIN_SECONDS", "30"))
+
+    # Connector retry de-duplication
+    # 同一個活動（對話 ID + 活動 ID）在時間窗內只處理一次
+    ACTIVITY_DEDUP_WINDOW_SECONDS = float(os.getenv("ACTIVITY_DEDUP_WINDOW_SECONDS", "600"))
+    ACTIVITY_DEDUP_MAX_ENTRIES = int(os.getenv("ACTIVITY_DEDUP_MAX_ENTRIES", "10000"))
+
+    # Multi-process serving
+    # WEB_WORKERS > 1 時以 SO_REUSEPORT 啟動多個行程共用同一個埠，
+    # 工作階段、回饋與分頁游標改存放在同一台機器上共用的 SQLite 資料庫
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+    SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "")
+
+    # Result pagination settings
+    # 結果超過 RESULT_PAGE_SIZE 筆時改以分頁的 Adaptive Card 表格呈現
+    RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "20"))
+    RESULT_CURSOR_TTL_MINUTES = int(os.getenv("RESULT_CURSOR_TTL_MINUTES", "30"))
+    RESULT_CURSOR_MAX_ENTRIES = int(os.getenv("RESULT_CURSOR_MAX_ENTRIES", "1000"))
+
+    # Result export settings
+    # PUBLIC_BASE_URL 為機器人對外的網址（例如 https://your-app.azurewebsites.net），用於產生下載連結
+    PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")
+    EXPORT_DIR = os.getenv("EXPORT_DIR", "")
+    EXPORT_MAX_CONCURRENT_PER_USER = int(os.getenv("EXPORT_MAX_CONCURRENT_PER_USER", "1"))
+    EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "4"))
+    EXPORT_TTL_MINUTES = int(os.getenv("EXPORT_TTL_MINUTES", "60"))
+
+    # Result store settings (memory tier budget, disk spill budget and directory)
+    RESULT_STORE_MEMORY_MB = int(os.getenv("RESULT_STORE_MEMORY_MB", "64"))
+    RESULT_STORE_DISK_MB = int(os.getenv("RESULT_STORE_DISK_MB", "512"))
+    RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR", "")
+
+    # Chart data reduction settings
+    # 大型結果繪圖前的縮減：類別圖表保留前 N 項，折線圖降採樣的最大點數
+    CHART_TOP_N = int(os.getenv("CHART_TOP_N", "15"))
+    CHART_MAX_LINE_POINTS = int(os.getenv("CHART_MAX_LINE_POINTS", "200"))
+    # 同一張圖最多繪製的系列數（多個數值欄位或依字串欄位拆分的系列）
+    CHART_MAX_SERIES = int(os.getenv("CHART_MAX_SERIES", "6"))
+
+    # Chart rendering pool settings
+    # 圖表在獨立的子行程中繪製，佇列已滿或逾時時僅發送文字回覆
+    CHART_RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", "2"))
+    CHART_RENDER_QUEUE_DEPTH = int(os.getenv("CHART_RENDER_QUEUE_DEPTH", "8"))
+    CHART_RENDER_TIMEOUT_SECONDS = float(os.getenv("CHART_RENDER_TIMEOUT_SECONDS", "15"))
+    CHART_RENDER_EXECUTOR = os.getenv("CHART_RENDER_EXECUTOR", "process")
+    # 預估繪圖等待超過此毫秒數時改以文字圖表（Unicode 長條 / sparkline）嵌入回覆
+    CHART_TEXT_FALLBACK_WAIT_MS = float(os.getenv("CHART_TEXT_FALLBACK_WAIT_MS", "3000"))
+    # 可顯示中文的字型檔路徑（例如 NotoSansCJK），未設定時自動尋找已安裝的中文字型
+    CHART_FONT_PATH = os.getenv("CHART_FONT_PATH", "")
+
+    # Reply composition
+    # 頻道支援時，答案、分頁表格、圖表與回饋卡合併為一個含多個附件的活動，減少 Bot Connector 呼叫
+    REPLY_COALESCING = os.getenv("REPLY_COALESCING", "True").lower() == "true"
+    REPLY_COALESCE_CHANNELS = os.getenv("REPLY_COALESCE_CHANNELS", "msteams,emulator,webchat,directline")
+    # 圖表在此毫秒數內繪製完成（例如快取命中）時與答案合併，否則答案先送出、圖表另外送出
+    REPLY_CHART_MERGE_WAIT_MS = float(os.getenv("REPLY_CHART_MERGE_WAIT_MS", "250"))
+
+    # Chart image cache settings (content-addressed; CHART_CACHE_DIR enables disk persistence)
+    CHART_CACHE_MEMORY_MB = int(os.getenv("CHART_CACHE_MEMORY_MB", "32"))
+    CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", "")
+    CHART_CACHE_DISK_MB = int(os.getenv("CHART_CACHE_DISK_MB", "256"))
+
+    # Chart image encoding settings
+    # 依位元組預算選擇調色盤 PNG、較低 DPI 或（允許時）WebP / JPEG
+    CHART_IMAGE_BUDGET_KB = int(os.getenv("CHART_IMAGE_BUDGET_KB", "64"))
+    CHART_IMAGE_FORMATS = os.getenv("CHART_IMAGE_FORMATS", "png")
+    CHART_IMAGE_MIN_DPI = int(os.getenv("CHART_IMAGE_MIN_DPI", "72"))
+
+    # Chart image URL settings
+    # 同時設定 PUBLIC_BASE_URL、CHART_CACHE_DIR 與 CHART_URL_SECRET 時，圖表卡片改以簽章網址引用 /charts 端點，而非內嵌 base64 圖片
+    CHART_URL_SECRET = os.getenv("CHART_URL_SECRET", "")
+    CHART_URL_TTL_HOURS = float(os.getenv("CHART_URL_TTL_HOURS", "24"))
@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Optional
 
 from botbuilder.core import TurnContext
 from botbuilder.schema import Activity, ActivityTypes
@@ -78,21 +78,29 @@ def create_error_card(error_message: str) -> Dict:
     }
 
 
-async def send_feedback_card(
-    turn_context: TurnContext,
-    user_session: UserSession,
-    enable_feedback_cards: bool,
-) -> None:
+def build_answer_feedback_card(user_session: UserSession, enable_feedback_cards: bool) -> Optional[Dict]:
+    """為使用者最近一次的 Genie 答案建立回饋卡；停用回饋卡時回傳 None"""
     if not enable_feedback_cards:
-        return
+        return None
 
-    genie_message_id = user_session.user_context.get('last_genie_message_id')
+    genie_message_id = user_session.user_context.last_message_id
     if genie_message_id:
         message_id = genie_message_id
     else:
         message_id = f"msg_{int(datetime.now().timestamp() * 1000)}"
 
-    feedback_card = create_feedback_card(message_id, user_session.user_id)
+    return create_feedback_card(message_id, user_session.user_id)
+
+
+async def send_feedback_card(
+    turn_context: TurnContext,
+    user_session: UserSession,
+    enable_feedback_cards: bool,
+) -> None:
+    feedback_card = build_answer_feedback_card(user_session, enable_feedback_cards)
+    if feedback_card is None:
+        return
+
     activity = Activity(
         type=ActivityTypes.message,
         attachments=[
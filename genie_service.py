@@ -8,16 +8,29 @@ import time
 import uuid
 import io
 import base64
+import threading
 from asyncio.log import logger
 from contextlib import asynccontextmanager
-from typing import Any, Dict, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
 
 import aiohttp
-from databricks.sdk import WorkspaceClient
-from databricks.sdk.service.dashboards import GenieAPI
 
 from config import DefaultConfig
-from chart_generator import create_chart_card_with_image
+
+if TYPE_CHECKING:  # Databricks SDK 匯入成本高，僅在第一次呼叫 API 時載入
+    from databricks.sdk import WorkspaceClient
+    from databricks.sdk.service.dashboards import GenieAPI
+
+
+# 輪詢 Genie 訊息狀態的上限時間與間隔（間隔隨次數遞增，最長 GENIE_POLL_MAX_INTERVAL 秒）
+GENIE_MESSAGE_TIMEOUT_SECONDS = 20 * 60
+GENIE_POLL_INTERVAL_SECONDS = 0.5
+GENIE_POLL_MAX_INTERVAL_SECONDS = 5.0
+_GENIE_FAILED_STATES = ("FAILED", "CANCELLED", "QUERY_RESULT_EXPIRED")
+
+
+def _status_name(status: Any) -> str:
+    return getattr(status, "value", status) or ""
 
 
 class QueryMetrics:
@@ -74,13 +87,47 @@ class GenieService:
 
     def __init__(self, config: Any, workspace_client: WorkspaceClient | None = None):
         self._config = config
-        self._workspace_client = workspace_client or self._create_workspace_client()
-        self._genie_api = GenieAPI(self._workspace_client.api_client)
+        # Databricks 客戶端於第一次使用（或背景預熱）時才建立，避免拖慢啟動
+        self._client: WorkspaceClient | None = workspace_client
+        self._genie: GenieAPI | None = None
+        self._client_lock = threading.Lock()
         # HTTP 連接池
         self._http_session = None
         # 性能指標收集器
         self.metrics = QueryMetrics()
 
+    @property
+    def client_ready(self) -> bool:
+        return self._genie is not None
+
+    @property
+    def _workspace_client(self) -> WorkspaceClient:
+        if self._client is None:
+            self._initialize_client()
+        return self._client
+
+    @property
+    def _genie_api(self) -> GenieAPI:
+        if self._genie is None:
+            self._initialize_client()
+        return self._genie
+
+    def _initialize_client(self) -> None:
+        with self._client_lock:
+            if self._genie is not None:
+                return
+            from databricks.sdk.service.dashboards import GenieAPI
+
+            if self._client is None:
+                self._client = self._create_workspace_client()
+            self._genie = GenieAPI(self._client.api_client)
+
+    async def warm_up(self) -> None:
+        """在背景執行緒中載入 Databricks SDK 並建立客戶端（應用程式啟動後調用）"""
+        start = time.time()
+        await asyncio.get_running_loop().run_in_executor(None, self._initialize_client)
+        logger.info(f"✅ Databricks 客戶端預熱完成，耗時 {time.time() - start:.2f}s")
+
     def _create_workspace_client(self) -> WorkspaceClient:
         logger.info(
             "\n" + "="*80 + "\n"
@@ -96,6 +143,8 @@ class GenieService:
         if not self._config.DATABRICKS_TOKEN:
             raise ValueError("DATABRICKS_TOKEN environment variable is not set")
 
+        from databricks.sdk import WorkspaceClient
+
         try:
             client = WorkspaceClient(
                 host=self._config.DATABRICKS_HOST,
@@ -178,6 +227,55 @@ class GenieService:
                 f"        Row Count:     {qr.row_count if hasattr(qr, 'row_count') else 0}"
             )
 
+    async def _wait_for_message(
+        self,
+        space_id: str,
+        conversation_id: str,
+        message_id: str,
+        statement_ids: list,
+        timeout: float = GENIE_MESSAGE_TIMEOUT_SECONDS,
+    ) -> Any:
+        """以可取消的方式輪詢 Genie 訊息直到完成
+
+        取代 SDK 的 *_and_wait（在執行緒中以 time.sleep 輪詢最久 20 分鐘，無法取消）：
+        每次只在執行緒中進行單一 HTTP 請求，等待改用 asyncio.sleep，回合被取消或逾時時
+        立即停止輪詢。輪詢期間出現的 statement ID 會加入 statement_ids，供取消時一併停止查詢。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.time() + timeout
+        attempt = 1
+        while True:
+            message = await loop.run_in_executor(
+                None, self._genie_api.get_message, space_id, conversation_id, message_id
+            )
+            query_result = getattr(message, "query_result", None)
+            statement_id = getattr(query_result, "statement_id", None)
+            if statement_id and statement_id not in statement_ids:
+                statement_ids.append(statement_id)
+
+            status = _status_name(message.status)
+            if status == "COMPLETED":
+                return message
+            if status in _GENIE_FAILED_STATES:
+                raise RuntimeError(f"Genie message {message_id} ended with status {status}")
+            if time.time() >= deadline:
+                raise TimeoutError(f"Genie message {message_id} did not complete within {timeout:.0f}s (status {status})")
+            await asyncio.sleep(min(GENIE_POLL_INTERVAL_SECONDS * attempt, GENIE_POLL_MAX_INTERVAL_SECONDS))
+            attempt += 1
+
+    def _cancel_statements(self, request_id: str, statement_ids: list) -> None:
+        """回合被取消時停止仍在 SQL warehouse 上執行的查詢（不等待完成）"""
+        def cancel(statement_id: str) -> None:
+            try:
+                self._workspace_client.statement_execution.cancel_execution(statement_id)
+                logger.info(f"[{request_id}] 🛑 已取消查詢 {statement_id}")
+            except Exception as exc:
+                logger.warning(f"[{request_id}] ⚠️ 無法取消查詢 {statement_id}: {exc}")
+
+        loop = asyncio.get_running_loop()
+        for statement_id in statement_ids:
+            loop.run_in_executor(None, cancel, statement_id)
+
     async def ask(
         self,
         question: str,
@@ -191,6 +289,8 @@ class GenieService:
         request_id = str(uuid.uuid4())[:8]
         query_start_time = time.time()
         success = False
+        # 本次問題觸發的 SQL statement，回合被取消時一併停止
+        statement_ids: list = []
         
         logger.info(
             f"\n{'='*80}\n"
@@ -209,12 +309,15 @@ class GenieService:
 
             if conversation_id is None:
                 logger.info(f"[{request_id}] 🆕 啟動新對話...")
-                initial_message = await loop.run_in_executor(
+                waiter = await loop.run_in_executor(
                     None,
-                    self._genie_api.start_conversation_and_wait,
+                    self._genie_api.start_conversation,
                     space_id,
                     contextual_question,
                 )
+                initial_message = await self._wait_for_message(
+                    space_id, waiter.conversation_id, waiter.message_id, statement_ids
+                )
                 conversation_id = initial_message.conversation_id
                 logger.info(
                     f"[{request_id}] ✅ 對話已創建\n"
@@ -229,13 +332,16 @@ class GenieService:
                 self._log_message_attachments(request_id, initial_message)
             else:
                 logger.info(f"[{request_id}] 💬 在現有對話中發送訊息: {conversation_id}")
-                initial_message = await loop.run_in_executor(
+                waiter = await loop.run_in_executor(
                     None,
-                    self._genie_api.create_message_and_wait,
+                    self._genie_api.create_message,
                     space_id,
                     conversation_id,
                     contextual_question,
                 )
+                initial_message = await self._wait_for_message(
+                    space_id, conversation_id, waiter.message_id, statement_ids
+                )
                 logger.info(
                     f"[{request_id}] ✅ 訊息已發送\n"
                     f"  訊息 ID:      {initial_message.message_id}\n"
@@ -408,13 +514,34 @@ class GenieService:
                             suggested_questions = list(attachment.suggested_questions.questions)
                             break
                 
+                # 分頁所需的 statement 與 chunk 配置（後續頁面按需透過 chunk API 取得）
+                chunks = []
+                if results.manifest and results.manifest.chunks:
+                    chunks = [
+                        {
+                            "chunk_index": chunk.chunk_index,
+                            "row_offset": chunk.row_offset or 0,
+                            "row_count": chunk.row_count or 0,
+                        }
+                        for chunk in results.manifest.chunks
+                    ]
+                total_row_count = (
+                    results.manifest.total_row_count
+                    if results.manifest and results.manifest.total_row_count is not None
+                    else row_count
+                )
+
                 result = (
                     json.dumps(
                         {
                             "columns": results.manifest.schema.as_dict(),
                             "data": results.result.as_dict(),
                             "query_description": query_description,
+                            "sql": sql_query,
                             "suggested_questions": suggested_questions,
+                            "statement_id": results.statement_id,
+                            "total_row_count": total_row_count,
+                            "chunks": chunks,
                         }
                     ),
                     conversation_id,
@@ -506,6 +633,12 @@ class GenieService:
                 self.metrics.log_stats()
             
             return result
+        except asyncio.CancelledError:
+            # 回合被新的問題取代或逾時：停止輪詢並取消仍在執行的查詢
+            logger.info(f"[{request_id}] 🛑 查詢已取消，耗時 {time.time() - query_start_time:.2f}s")
+            if statement_ids:
+                self._cancel_statements(request_id, statement_ids)
+            raise
         except Exception as exc:
             total_elapsed = time.time() - query_start_time
             
@@ -646,6 +779,26 @@ class GenieService:
                     )
                     raise Exception(f"HTTP {response.status}: {response_text}")
 
+    async def get_result_chunk(self, statement_id: str, chunk_index: int) -> Dict[str, Any]:
+        """取得已完成 statement 的指定結果 chunk（供分頁按需讀取）"""
+        loop = asyncio.get_running_loop()
+        fetch_start = time.time()
+        chunk = await loop.run_in_executor(
+            None,
+            self._workspace_client.statement_execution.get_statement_result_chunk_n,
+            statement_id,
+            chunk_index,
+        )
+        chunk_dict = chunk.as_dict() if chunk else {}
+        logger.info(
+            f"📦 已取得結果 chunk\n"
+            f"  Statement ID: {statement_id}\n"
+            f"  Chunk Index:  {chunk_index}\n"
+            f"  Row Count:    {len(chunk_dict.get('data_array') or [])}\n"
+            f"  耗時:         {time.time() - fetch_start:.2f}s"
+        )
+        return chunk_dict
+
     async def get_last_message_id(self, conversation_id: Optional[str]) -> Optional[str]:
         if not conversation_id:
             return None
@@ -701,16 +854,43 @@ class GenieService:
         logger.warning("無法從類型為 %s 的回應中提取訊息", type(messages))
         return None
 
-def _analyze_chart_suitability(columns: dict, data: dict) -> dict:
+# 欄位型別與名稱的判斷關鍵字
+_NUMERIC_TYPES = ['int', 'long', 'double', 'float', 'decimal', 'bigint']
+_DIMENSION_TYPES = ['string', 'varchar', 'char', 'date', 'timestamp']
+_TIME_TYPES = ['date', 'timestamp']
+_TIME_KEYWORDS = ['date', 'time', 'month', 'year', 'day', '日期', '時間', '月份', '年']
+
+
+def _analyze_chart_suitability(
+    columns: dict,
+    data: dict,
+    total_rows: Optional[int] = None,
+    top_n: int = DefaultConfig.CHART_TOP_N,
+    max_line_points: int = DefaultConfig.CHART_MAX_LINE_POINTS,
+    max_series: int = DefaultConfig.CHART_MAX_SERIES,
+) -> dict:
     """分析數據是否適合繪製圖表並返回建議的圖表類型
-    
+
+    一次走訪欄位結構與資料：找出所有數值欄位（多個量值各成一個系列）與合適的
+    類別 / 時間維度；只有單一量值但另有低基數的字串欄位時，依該欄位拆成多個系列。
+    資料點過多時先縮減：類別圖表保留前 top_n 項並合併其餘為「其他」，
+    時間序列折線圖以 LTTB 降採樣到 max_line_points 點。
+    data 只含第一個結果 chunk 而 total_rows 較多時，圖表僅代表前幾筆資料，
+    以 sample 標示供圖表說明文字提示使用者，且不使用圓餅圖（占比會失真）。
+
     Returns:
         dict: {
             'suitable': bool,
             'chart_type': str,  # 'bar', 'pie', 'line'
             'category_column': str,
-            'value_column': str,
-            'data_for_chart': list
+            'value_column': str,  # 第一個系列
+            'data_for_chart': list,  # 第一個系列（單一系列的相容格式）
+            'categories': list,
+            'series': list,  # [{'name': str, 'values': list}]
+            'bar_mode': str,  # 'grouped' 或 'stacked'
+            'series_column': str | None,  # 拆分系列的字串欄位
+            'reduction': dict | None,  # 縮減方式與原始點數
+            'sample': dict | None  # {'rows': 繪圖使用的筆數, 'total_rows': 結果總筆數}
         }
     """
     try:
@@ -724,76 +904,116 @@ def _analyze_chart_suitability(columns: dict, data: dict) -> dict:
         
         # 獲取數據行
         data_array = data.get('data_array', [])
-        if not data_array or len(data_array) < 2 or len(data_array) > 20:
-            # 太少或太多數據都不適合圖表
+        if not data_array or len(data_array) < 2:
+            # 太少數據不適合圖表
             return {'suitable': False}
         
-        # 分析列類型
-        category_col = None
-        value_col = None
-        category_idx = None
-        value_idx = None
-        
+        # 分析列類型：所有數值欄位為量值，字串 / 日期欄位為維度
+        dimensions = []
+        measures = []
         for idx, col in enumerate(col_list):
             col_name = col.get('name', '')
             col_type = col.get('type_text', '').lower()
-            
-            # 尋找類別列（字串類型）
-            if not category_col and ('string' in col_type or 'varchar' in col_type):
-                category_col = col_name
-                category_idx = idx
-            
-            # 尋找數值列
-            if not value_col and any(t in col_type for t in ['int', 'long', 'double', 'float', 'decimal', 'bigint']):
-                value_col = col_name
-                value_idx = idx
+            if any(t in col_type for t in _NUMERIC_TYPES):
+                measures.append((idx, col_name))
+            elif any(t in col_type for t in _DIMENSION_TYPES):
+                is_time = (
+                    any(t in col_type for t in _TIME_TYPES)
+                    or any(keyword in col_name.lower() for keyword in _TIME_KEYWORDS)
+                )
+                dimensions.append((idx, col_name, is_time))
         
-        if not category_col or not value_col:
+        if not dimensions or not measures:
             return {'suitable': False}
         
-        # 準備圖表數據
-        chart_data = []
-        has_negative = False
-        total_value = 0
-        
-        for row in data_array:
-            if len(row) > max(category_idx, value_idx):
-                category = str(row[category_idx]) if row[category_idx] is not None else 'N/A'
-                value = row[value_idx]
-                
-                # 跳過 None 值
-                if value is None:
-                    continue
-                
-                try:
-                    value = float(value)
-                    if value < 0:
-                        has_negative = True
-                    total_value += abs(value)
-                    chart_data.append({'category': category, 'value': value})
-                except (ValueError, TypeError):
-                    continue
+        # 時間維度優先作為 X 軸，否則使用第一個字串欄位
+        category_idx, category_col, is_time_series = next(
+            (dim for dim in dimensions if dim[2]), dimensions[0]
+        )
+        # 如果類別看起來像時間序列（日期型別或包含日期、月份等關鍵字），用折線圖
+        chart_type = 'line' if is_time_series else 'bar'
+        measures = measures[:max_series]
+
+        # 匯入 numpy 的縮減模組只在需要繪圖時載入
+        import numpy as np
+        from chart_reduction import pivot_series, reduce_series, to_numeric
+
+        width = max([category_idx] + [idx for idx, _ in measures] + [dim[0] for dim in dimensions])
+        rows = [row for row in data_array if len(row) > width]
+        categories = [row[category_idx] for row in rows]
+        bar_mode = 'grouped'
+
+        series_dim = next((dim for dim in dimensions if dim[0] != category_idx), None)
+        pivoted = None
+        if len(measures) == 1 and series_dim is not None:
+            # 長格式：單一量值 + 另一個字串欄位，拆成多個系列並以堆疊長條圖呈現
+            candidate = pivot_series(
+                categories,
+                [row[series_dim[0]] for row in rows],
+                [row[measures[0][0]] for row in rows],
+            )
+            if 2 <= len(candidate[1]) <= max_series and len(candidate[0]) < len(rows):
+                pivoted = candidate
+
+        if pivoted is not None:
+            categories, series_names, matrix = pivoted
+            bar_mode = 'stacked'
+        else:
+            series_names = [name for _, name in measures]
+            matrix = np.column_stack([to_numeric([row[idx] for row in rows]) for idx, _ in measures])
+
+        labels, series_values, reduction = reduce_series(
+            categories, matrix, chart_type, top_n=top_n, max_line_points=max_line_points
+        )
         
-        if len(chart_data) < 2:
+        if len(labels) < 2:
             return {'suitable': False}
         
-        # 決定圖表類型
-        chart_type = 'bar'  # 默認使用長條圖
+        # 單一系列時以第一個系列保留原本的 data_for_chart 格式，缺值不繪製
+        chart_data = [
+            {'category': label, 'value': value}
+            for label, value in zip(labels, series_values[0])
+            if value is not None
+        ]
+        if len(series_values) == 1 and len(chart_data) < 2:
+            return {'suitable': False}
         
-        # 如果沒有負值且類別數量適中（2-8個），可以用圓餅圖
-        if not has_negative and 2 <= len(chart_data) <= 8:
+        sample = (
+            {'rows': len(data_array), 'total_rows': total_rows}
+            if total_rows is not None and total_rows > len(data_array)
+            else None
+        )
+
+        # 單一系列、沒有負值且類別數量適中（2-8個，未經合併），可以用圓餅圖
+        has_negative = any(value is not None and value < 0 for values in series_values for value in values)
+        if (
+            chart_type == 'bar'
+            and sample is None
+            and len(series_values) == 1
+            and not has_negative
+            and reduction is None
+            and len(chart_data) <= 8
+        ):
             chart_type = 'pie'
-        
-        # 如果類別看起來像時間序列（包含日期、月份等關鍵字），用折線圖
-        if any(keyword in category_col.lower() for keyword in ['date', 'time', 'month', 'year', 'day', '日期', '時間', '月份', '年']):
-            chart_type = 'line'
+        # 堆疊長條圖需要全為非負值
+        if has_negative:
+            bar_mode = 'grouped'
         
         return {
             'suitable': True,
             'chart_type': chart_type,
             'category_column': category_col,
-            'value_column': value_col,
-            'data_for_chart': chart_data
+            'value_column': series_names[0] if pivoted is None else measures[0][1],
+            'data_for_chart': chart_data,
+            'categories': labels,
+            'series': [
+                {'name': str(name), 'values': values}
+                for name, values in zip(series_names, series_values)
+            ],
+            'bar_mode': bar_mode,
+            'series_column': series_dim[1] if pivoted is not None else None,
+            'reduction': reduction,
+            'sample': sample,
         }
         
     except Exception as e:
@@ -801,7 +1021,25 @@ def _analyze_chart_suitability(columns: dict, data: dict) -> dict:
         return {'suitable': False}
 
 
-def process_query_results(answer_json: Dict) -> str:
+def format_result_value(value: Any, col: Dict) -> str:
+    """依欄位型別格式化單一儲存格的顯示值"""
+    if value is None:
+        return "NULL"
+    if col["type_name"] in ["DECIMAL", "DOUBLE", "FLOAT"]:
+        return f"{float(value):,.2f}"
+    if col["type_name"] in ["INT", "BIGINT", "LONG"]:
+        return f"{int(value):,}"
+    return str(value)
+
+
+def process_query_results(answer_json: Dict, max_table_rows: Optional[int] = None) -> str:
+    """將 Genie 回應轉為 Markdown 文字
+
+    Args:
+        answer_json: GenieService.ask 回傳的 JSON 內容
+        max_table_rows: 結果總筆數超過此值時不輸出 Markdown 表格，
+            改由分頁的 Adaptive Card 呈現（None 表示不限制）
+    """
     response = ""
     if "query_description" in answer_json and answer_json["query_description"]:
         response += f"## 查詢說明\n\n{answer_json['query_description']}\n\n"
@@ -811,27 +1049,25 @@ def process_query_results(answer_json: Dict) -> str:
         data = answer_json["data"]
         
         # 分析數據是否適合繪製圖表
-        chart_info = _analyze_chart_suitability(columns, data)
+        chart_info = _analyze_chart_suitability(columns, data, answer_json.get("total_row_count"))
         if chart_info.get('suitable'):
             answer_json['chart_info'] = chart_info
         
         response += "## 查詢結果\n\n"
-        if isinstance(columns, dict) and "columns" in columns:
+        total_rows = answer_json.get("total_row_count")
+        if total_rows is None:
+            total_rows = len(data.get("data_array") or [])
+        if isinstance(columns, dict) and "columns" in columns and max_table_rows is not None and total_rows > max_table_rows:
+            response += f"共 **{total_rows:,}** 筆資料，請使用下方的分頁表格瀏覽。\n\n"
+        elif isinstance(columns, dict) and "columns" in columns:
             header = "| " + " | ".join(col["name"] for col in columns["columns"]) + " |"
             separator = "|" + "|".join(["---" for _ in columns["columns"]]) + "|"
             response += header + "\n" + separator + "\n"
-            for row in data["data_array"]:
-                formatted_row = []
-                for value, col in zip(row, columns["columns"]):
-                    if value is None:
-                        formatted_value = "NULL"
-                    elif col["type_name"] in ["DECIMAL", "DOUBLE", "FLOAT"]:
-                        formatted_value = f"{float(value):,.2f}"
-                    elif col["type_name"] in ["INT", "BIGINT", "LONG"]:
-                        formatted_value = f"{int(value):,}"
-                    else:
-                        formatted_value = str(value)
-                    formatted_row.append(formatted_value)
+            for row in data.get("data_array") or []:
+                formatted_row = [
+                    format_result_value(value, col)
+                    for value, col in zip(row, columns["columns"])
+                ]
                 response += "| " + " | ".join(formatted_row) + " |\n"
         else:
             response += f"非預期的欄位格式: {columns}\n\n"
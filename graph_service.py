@@ -311,7 +311,8 @@ class GraphService:
             turn_context: Bot Framework 的 TurnContext
             
         Returns:
-            包含 'email', 'id', 'name', 'upn' 的字典或 None
+            包含 'email', 'id', 'name', 'upn' 的字典或 None；'source' 為 'graph'（OAuth 個人資料）
+            或 'teams'（僅 Teams 提供的基本資訊）
         """
         from_property = turn_context.activity.from_property
         channel_data = turn_context.activity.channel_data
@@ -352,7 +353,8 @@ class GraphService:
                     'phone_numbers': user_profile.get('mobilePhone'),
                     'office_location': user_profile.get('officeLocation'),
                     'job_title': user_profile.get('jobTitle'),
-                    'department': user_profile.get('department')
+                    'department': user_profile.get('department'),
+                    'source': 'graph',
                 }
         else:
             logger.warning(
@@ -374,7 +376,8 @@ class GraphService:
             'phone_numbers': None,
             'office_location': None,
             'job_title': None,
-            'department': None
+            'department': None,
+            'source': 'teams',
         }
     
     async def sign_out_user(self, turn_context: TurnContext) -> bool:
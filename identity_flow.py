@@ -2,28 +2,32 @@
 
 from __future__ import annotations
 
-from typing import Awaitable, Callable, Dict, List
+from typing import Awaitable, Callable, List, Union
 
 from botbuilder.core import TurnContext
 
+from session_store import SessionStore
+from shared_state import SharedMapping
 from user_session import UserSession
 
+PendingEmailStore = Union[SessionStore, SharedMapping]
+
 
 async def handle_pending_email_input(
     user_id: str,
     question: str,
     turn_context: TurnContext,
-    pending_email_input: Dict[str, bool],
+    pending_email_input: PendingEmailStore,
     create_session_func: Callable[[TurnContext, str], Awaitable[UserSession]],
     is_valid_email_func: Callable[[str], bool],
     sample_questions: List[str],
 ) -> bool:
-    if user_id not in pending_email_input:
+    if not await pending_email_input.contains_async(user_id):
         return False
 
     lowered = question.lower()
     if lowered == "cancel":
-        del pending_email_input[user_id]
+        await pending_email_input.pop_async(user_id)
         await turn_context.send_activity(
             "❌ **電子郵件輸入已取消**\n\n"
             "您可以稍後輸入任何訊息再試一次。如果需要，我會再次詢問您的電子郵件。"
@@ -53,7 +57,7 @@ async def handle_user_identification(
     turn_context: TurnContext,
     question: str,
     config,
-    pending_email_input: Dict[str, bool],
+    pending_email_input: PendingEmailStore,
 ) -> None:
     user_id = turn_context.activity.from_property.id
     lowered = question.lower()
@@ -102,7 +106,7 @@ async def handle_user_identification(
         return
 
     if lowered in ["email", "provide email", "enter email"]:
-        pending_email_input[user_id] = True
+        await pending_email_input.set_async(user_id, True)
         await turn_context.send_activity(
             "📧 **Genie 使用者登入**\n\n"
             "請提供您的電子郵件地址（例如：somebody@fareastone.com.tw）。\n\n"
@@ -0,0 +1,47 @@
+"""JSON codec for the HTTP ingress / egress path.
+
+/api/messages 每個請求都要解碼一次活動 JSON，/api/metrics 等端點也以 JSON 回應。
+安裝 orjson 時改用 orjson 編解碼（速度約為標準函式庫的數倍），否則使用標準函式庫的 json；
+兩者的輸入與輸出格式相同，呼叫端不需區分。
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Mapping, Optional, Union
+
+from aiohttp import web
+
+try:  # orjson 為選用套件，未安裝時使用標準函式庫
+    import orjson
+except ImportError:  # pragma: no cover - 取決於部署環境
+    orjson = None
+
+CODEC_NAME = "orjson" if orjson is not None else "json"
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """解碼 JSON，格式錯誤時拋出 ValueError"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """編碼為 UTF-8 JSON（非 ASCII 字元不跳脫）"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(
+    data: Any, status: int = 200, headers: Optional[Mapping[str, str]] = None
+) -> web.Response:
+    """與 aiohttp.web.json_response 相同，但使用此模組的編碼器"""
+    return web.Response(
+        body=dumps_bytes(data),
+        status=status,
+        headers=headers,
+        content_type="application/json",
+        charset="utf-8",
+    )
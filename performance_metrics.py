@@ -1,7 +1,11 @@
 # 新增 performance_metrics.py
 from collections import deque
+import logging
 import statistics
 from datetime import datetime, timedelta
+from typing import Dict
+
+logger = logging.getLogger(__name__)
 
 class PerformanceMetrics:
     def __init__(self):
@@ -31,5 +35,41 @@ class PerformanceMetrics:
             'error_rate': len(self.error_rates) / len(self.query_times)
         }
 
+
+class DeliveryMetrics:
+    """回覆各部分的送達時間（自收到使用者訊息起算）
+
+    文字答案與圖表分開送出，分別記錄「第一個答案」與「圖表」的送達時間，
+    圖表繪製不再計入使用者看到答案前的等待。
+    """
+
+    FIRST_ANSWER = "first_answer"
+    CHART = "chart"
+
+    def __init__(self, window: int = 1000):
+        self._samples = {
+            self.FIRST_ANSWER: deque(maxlen=window),
+            self.CHART: deque(maxlen=window),
+        }
+
+    def record(self, stage: str, seconds: float) -> None:
+        self._samples[stage].append(seconds * 1000)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            if not ordered:
+                result[stage] = {"count": 0}
+                continue
+            result[stage] = {
+                "count": len(ordered),
+                "p50_ms": round(statistics.median(ordered), 1),
+                "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))], 1),
+                "max_ms": round(ordered[-1], 1),
+            }
+        return result
+
+
 # 全域實例
 metrics = PerformanceMetrics()
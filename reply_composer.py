@@ -0,0 +1,145 @@
+"""Reply composition and connector call accounting.
+
+一個已回答的問題原本會分別送出最多五到六個活動（輸入中指示、「正在分析您的問題」、
+Markdown 答案、分頁表格、圖表卡片與回饋卡），每個活動都是一次 Bot Connector HTTP 呼叫。
+Bot Connector 沒有批次端點（send_activities 仍是逐一呼叫），因此 ReplyComposer 在頻道支援時
+把答案文字與各張卡片合併為一個含多個附件的活動；不支援時依序逐一送出，行為與原本相同。
+
+ReplyMetrics 以 TurnContext.on_send_activities 計算每個回合實際的 Connector 呼叫次數，
+並以合併減少的呼叫數乘上平均呼叫延遲，估計每個回合省下的時間。
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from botbuilder.core import TurnContext
+from botbuilder.schema import Activity, ActivityTypes, Attachment, AttachmentLayoutTypes
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_CARD_CONTENT_TYPE = "application/vnd.microsoft.card.adaptive"
+
+# 不經過 Connector 的活動類型（trace 僅在模擬器顯示，invokeResponse 放在 HTTP 回應本文中）
+_LOCAL_ACTIVITY_TYPES = (ActivityTypes.trace, ActivityTypes.invoke_response)
+
+
+def parse_channels(value: str) -> frozenset:
+    return frozenset(channel.strip().lower() for channel in value.split(",") if channel.strip())
+
+
+class TurnCallCounter:
+    """單一回合送出的 Connector 呼叫次數"""
+
+    __slots__ = ("calls",)
+
+    def __init__(self):
+        self.calls = 0
+
+    async def on_send(self, context: TurnContext, activities: List[Activity], next_send) -> Any:
+        self.calls += sum(1 for activity in activities if activity.type not in _LOCAL_ACTIVITY_TYPES)
+        return await next_send()
+
+
+class ReplyMetrics:
+    """每個回合的 Connector 呼叫次數、合併省下的呼叫數與估計省下的延遲"""
+
+    def __init__(self, window: int = 500):
+        self._calls_per_turn = deque(maxlen=window)
+        self._call_ms = deque(maxlen=window)
+        self._turns = 0
+        self._calls = 0
+        self._saved_calls = 0
+        self._coalesced_replies = 0
+
+    def track(self, turn_context: TurnContext) -> TurnCallCounter:
+        """開始計算回合的 Connector 呼叫；回合結束時以 finish 記錄"""
+        counter = TurnCallCounter()
+        turn_context.on_send_activities(counter.on_send)
+        return counter
+
+    def finish(self, counter: TurnCallCounter) -> None:
+        self._turns += 1
+        self._calls += counter.calls
+        self._calls_per_turn.append(counter.calls)
+
+    def record_call(self, seconds: float) -> None:
+        self._call_ms.append(seconds * 1000)
+
+    def record_saved(self, calls: int) -> None:
+        if calls > 0:
+            self._saved_calls += calls
+            self._coalesced_replies += 1
+
+    def summary(self) -> Dict[str, Any]:
+        avg_call_ms = sum(self._call_ms) / len(self._call_ms) if self._call_ms else 0.0
+        saved_per_turn = self._saved_calls / self._turns if self._turns else 0.0
+        return {
+            "turns": self._turns,
+            "connector_calls": self._calls,
+            "avg_calls_per_turn": (
+                round(sum(self._calls_per_turn) / len(self._calls_per_turn), 2) if self._calls_per_turn else 0.0
+            ),
+            "max_calls_per_turn": max(self._calls_per_turn, default=0),
+            "coalesced_replies": self._coalesced_replies,
+            "saved_calls": self._saved_calls,
+            "avg_call_ms": round(avg_call_ms, 1),
+            # 合併的活動若分開送出，每個都需要一次完整的 Connector 往返
+            "estimated_saved_ms_per_turn": round(saved_per_turn * avg_call_ms, 1),
+        }
+
+
+class ReplyComposer:
+    """將答案文字與卡片組成盡可能少的活動送出"""
+
+    def __init__(self, turn_context: TurnContext, coalesce: bool, metrics: Optional[ReplyMetrics] = None):
+        self.turn_context = turn_context
+        self.coalesce = coalesce
+        self.metrics = metrics
+        self._text: Optional[str] = None
+        self._cards: List[Dict[str, Any]] = []
+
+    def add_text(self, text: str) -> None:
+        self._text = f"{self._text}\n\n{text}" if self._text else text
+
+    def add_card(self, card: Optional[Dict[str, Any]]) -> None:
+        if card:
+            self._cards.append(card)
+
+    @property
+    def parts(self) -> int:
+        return (1 if self._text else 0) + len(self._cards)
+
+    def build_activities(self) -> List[Activity]:
+        attachments = [Attachment(content_type=ADAPTIVE_CARD_CONTENT_TYPE, content=card) for card in self._cards]
+        if self.coalesce:
+            if not self.parts:
+                return []
+            return [
+                Activity(
+                    type=ActivityTypes.message,
+                    text=self._text,
+                    attachments=attachments or None,
+                    attachment_layout=AttachmentLayoutTypes.list if len(attachments) > 1 else None,
+                )
+            ]
+        activities = [Activity(type=ActivityTypes.message, text=self._text)] if self._text else []
+        activities.extend(Activity(type=ActivityTypes.message, attachments=[attachment]) for attachment in attachments)
+        return activities
+
+    async def flush(self) -> None:
+        """送出累積的內容並清空"""
+        activities = self.build_activities()
+        parts = self.parts
+        self._text = None
+        self._cards = []
+        for activity in activities:
+            started = time.perf_counter()
+            await self.turn_context.send_activity(activity)
+            if self.metrics is not None:
+                self.metrics.record_call(time.perf_counter() - started)
+        if self.metrics is not None:
+            self.metrics.record_saved(parts - len(activities))
@@ -0,0 +1,382 @@
+"""Streaming export of full Genie query results to CSV / XLSX files.
+
+匯出時逐一讀取 statement 的每個結果 chunk 並立即附加寫入磁碟檔案，
+記憶體用量只與單一 chunk 的大小有關，不會在記憶體中組出完整表格。
+
+多工作行程模式下下載請求可能由任何一個行程處理：匯出檔案寫在所有行程共用的目錄，
+完成的工作中繼資料寫入跨行程共用的字典，其他行程由此重建工作並提供下載。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import csv
+import logging
+import os
+import secrets
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from collections.abc import MutableMapping
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from result_pagination import ChunkFetcher, ResultCursor, ResultCursorStore
+
+try:  # XLSX 為選用功能，需要安裝 openpyxl
+    import openpyxl
+except ImportError:  # pragma: no cover - 取決於部署環境
+    openpyxl = None
+
+logger = logging.getLogger(__name__)
+
+# 匯出按鈕送出的 action / verb 名稱
+EXPORT_RESULT_ACTION = "export_result"
+
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def supported_export_formats() -> List[str]:
+    formats = ["csv"]
+    if openpyxl is not None:
+        formats.append("xlsx")
+    return formats
+
+
+class ExportLimitExceeded(Exception):
+    """使用者已達同時匯出數量上限"""
+
+
+class ExportJob:
+    """單一匯出工作的狀態"""
+
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    def __init__(self, user_id: str, cursor: ResultCursor, export_format: str, path: Path):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.token = secrets.token_urlsafe(16)
+        self.user_id = user_id
+        self.statement_id = cursor.statement_id
+        self.export_format = export_format
+        self.path = path
+        self.total_rows = cursor.total_rows
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.status = ExportJob.RUNNING
+        self.error: Optional[str] = None
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """下載所需的中繼資料，供多工作行程模式下的其他行程重建工作"""
+        return {
+            "job_id": self.job_id,
+            "token": self.token,
+            "user_id": self.user_id,
+            "statement_id": self.statement_id,
+            "export_format": self.export_format,
+            "path": str(self.path),
+            "total_rows": self.total_rows,
+            "rows_written": self.rows_written,
+            "bytes_written": self.bytes_written,
+            "status": self.status,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ExportJob":
+        job = cls.__new__(cls)
+        job.job_id = data["job_id"]
+        job.token = data["token"]
+        job.user_id = data["user_id"]
+        job.statement_id = data.get("statement_id")
+        job.export_format = data["export_format"]
+        job.path = Path(data["path"])
+        job.total_rows = data["total_rows"]
+        job.rows_written = data["rows_written"]
+        job.bytes_written = data["bytes_written"]
+        job.status = data["status"]
+        job.error = None
+        job.created_at = job.finished_at = time.monotonic()
+        return job
+
+    @property
+    def progress(self) -> float:
+        if self.total_rows <= 0:
+            return 1.0 if self.status == ExportJob.COMPLETED else 0.0
+        return min(1.0, self.rows_written / self.total_rows)
+
+    @property
+    def filename(self) -> str:
+        return f"genie_result_{self.job_id}.{self.export_format}"
+
+    @property
+    def content_type(self) -> str:
+        return EXPORT_CONTENT_TYPES[self.export_format]
+
+
+ProgressCallback = Callable[[ExportJob], Awaitable[None]]
+
+
+class _CsvSink:
+    def __init__(self, path: Path, header: List[str]):
+        # utf-8-sig 讓 Excel 能正確辨識中文欄位
+        self._file = open(path, "w", newline="", encoding="utf-8-sig")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(header)
+
+    def write_rows(self, rows: List[List[Any]]) -> None:
+        self._writer.writerows(["" if value is None else value for value in row] for row in rows)
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _XlsxSink:
+    def __init__(self, path: Path, header: List[str]):
+        # write_only 模式逐列串流寫入，不在記憶體中保留整個工作表
+        self._path = path
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("result")
+        self._sheet.append(header)
+
+    def write_rows(self, rows: List[List[Any]]) -> None:
+        for row in rows:
+            self._sheet.append(list(row))
+
+    def close(self) -> None:
+        self._workbook.save(self._path)
+
+
+class ResultExporter:
+    """管理結果匯出工作：串流寫檔、進度回報與每位使用者的並發上限"""
+
+    def __init__(
+        self,
+        export_dir: Optional[str] = None,
+        max_concurrent_per_user: int = 1,
+        max_concurrent_total: int = 4,
+        ttl_seconds: float = 3600,
+        cursor_store: Optional[ResultCursorStore] = None,
+        shared: Optional[MutableMapping] = None,
+    ):
+        self.cursor_store = cursor_store
+        # 多工作行程模式：已完成工作的中繼資料（檔案位於共用的 export_dir）
+        self.shared = shared
+        self.export_dir = Path(export_dir or os.path.join(tempfile.gettempdir(), "genie_exports"))
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        self.max_concurrent_per_user = max_concurrent_per_user
+        self.ttl_seconds = ttl_seconds
+        self._global_slots = asyncio.Semaphore(max_concurrent_total)
+        self._jobs: Dict[str, ExportJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def active_jobs(self, user_id: str) -> int:
+        return sum(
+            1 for job in self._jobs.values()
+            if job.user_id == user_id and job.status == ExportJob.RUNNING
+        )
+
+    async def get_job(self, job_id: str, token: str) -> Optional[ExportJob]:
+        """依 ID 與下載權杖取得工作；本機找不到時查詢其他行程建立的工作"""
+        job = self._jobs.get(job_id)
+        if job is None and self.shared is not None:
+            data = await asyncio.to_thread(self.shared.get, job_id)
+            job = ExportJob.from_dict(data) if data else None
+        if not job or not secrets.compare_digest(job.token, token):
+            return None
+        return job
+
+    def start_export(
+        self,
+        user_id: str,
+        cursor: ResultCursor,
+        export_format: str,
+        fetch_chunk: ChunkFetcher,
+        on_progress: Optional[ProgressCallback] = None,
+        on_complete: Optional[ProgressCallback] = None,
+    ) -> ExportJob:
+        """建立並在背景執行匯出工作"""
+        if export_format not in supported_export_formats():
+            raise ValueError(f"unsupported export format: {export_format}")
+        if not cursor.statement_id:
+            raise ValueError("result has no statement to export")
+
+        self.cleanup_expired()
+        if self.active_jobs(user_id) >= self.max_concurrent_per_user:
+            raise ExportLimitExceeded(
+                f"user {user_id} already has {self.max_concurrent_per_user} export(s) running"
+            )
+
+        job = ExportJob(user_id, cursor, export_format, self.export_dir / f"{uuid.uuid4().hex}.{export_format}")
+        self._jobs[job.job_id] = job
+        self._tasks[job.job_id] = asyncio.create_task(
+            self._run(job, cursor, fetch_chunk, on_progress, on_complete)
+        )
+        logger.info(
+            f"📤 匯出工作已建立\n"
+            f"  Job ID:       {job.job_id}\n"
+            f"  Statement ID: {job.statement_id}\n"
+            f"  格式:         {export_format}\n"
+            f"  總筆數:       {job.total_rows}"
+        )
+        return job
+
+    async def _run(
+        self,
+        job: ExportJob,
+        cursor: ResultCursor,
+        fetch_chunk: ChunkFetcher,
+        on_progress: Optional[ProgressCallback],
+        on_complete: Optional[ProgressCallback],
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        header = [col["name"] for col in cursor.columns]
+        sink = None
+        start = time.time()
+        try:
+            async with self._global_slots:
+                sink_cls = _XlsxSink if job.export_format == "xlsx" else _CsvSink
+                sink = await loop.run_in_executor(None, sink_cls, job.path, header)
+
+                for chunk in sorted(cursor.chunks, key=lambda c: c["chunk_index"]):
+                    # 一次只持有單一 chunk 的資料列；已保存在 ResultStore 的 chunk 不重新讀取
+                    rows = (
+                        await self.cursor_store.cached_chunk(cursor, chunk["chunk_index"])
+                        if self.cursor_store
+                        else None
+                    )
+                    if rows is None:
+                        rows = (await fetch_chunk(job.statement_id, chunk["chunk_index"])).get("data_array") or []
+                    await loop.run_in_executor(None, sink.write_rows, rows)
+                    job.rows_written += len(rows)
+                    del rows
+                    if on_progress:
+                        await on_progress(job)
+
+                await loop.run_in_executor(None, sink.close)
+                sink = None
+                job.bytes_written = job.path.stat().st_size
+                job.status = ExportJob.COMPLETED
+                if self.shared is not None:
+                    await asyncio.to_thread(self.shared.__setitem__, job.job_id, job.to_dict())
+                logger.info(
+                    f"✅ 匯出完成\n"
+                    f"  Job ID:       {job.job_id}\n"
+                    f"  資料筆數:     {job.rows_written}\n"
+                    f"  檔案大小:     {job.bytes_written} bytes\n"
+                    f"  耗時:         {time.time() - start:.2f}s"
+                )
+        except asyncio.CancelledError:
+            # 應用程式關閉或工作被取消：不留下不完整的檔案，並釋放使用者的匯出名額
+            self._discard(job, sink, "export cancelled")
+            logger.warning(f"⚠️ 匯出已取消 [{job.job_id}]")
+            raise
+        except Exception as exc:
+            self._discard(job, sink, str(exc))
+            logger.error(f"❌ 匯出失敗 [{job.job_id}]: {str(exc)[:200]}")
+        finally:
+            job.finished_at = time.monotonic()
+            self._tasks.pop(job.job_id, None)
+
+        if on_complete:
+            try:
+                await on_complete(job)
+            except Exception as exc:
+                logger.warning(f"⚠️ 匯出完成通知失敗 [{job.job_id}]: {str(exc)}")
+
+    @staticmethod
+    def _discard(job: ExportJob, sink: Any, error: str) -> None:
+        """將工作標記為失敗並刪除寫到一半的檔案"""
+        job.status = ExportJob.FAILED
+        job.error = error
+        if sink is not None:
+            try:
+                sink.close()
+            except Exception:
+                pass
+        job.path.unlink(missing_ok=True)
+
+    def cleanup_expired(self) -> int:
+        """移除已過期的匯出檔案，回傳移除的筆數"""
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.ttl_seconds
+        ]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            job.path.unlink(missing_ok=True)
+        return len(expired)
+
+    # 與 SessionStore 相同的介面，讓 SessionSweeper 定期清除過期的匯出檔案
+    name = "result_exports"
+
+    def sweep(self) -> int:
+        return self.cleanup_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._jobs),
+            "running": len(self._tasks),
+            "ttl_seconds": self.ttl_seconds,
+            "estimated_bytes": sum(job.bytes_written for job in self._jobs.values()),
+        }
+
+    async def close(self) -> None:
+        """取消進行中的匯出工作（應用程式關閉時調用）"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+def build_export_actions(cursor: ResultCursor) -> List[Dict[str, Any]]:
+    """分頁結果卡片上的匯出按鈕"""
+    return [
+        {
+            "type": "Action.Execute",
+            "title": f"⬇️ 匯出 {export_format.upper()}",
+            "verb": EXPORT_RESULT_ACTION,
+            "data": {
+                "action": EXPORT_RESULT_ACTION,
+                "cursorId": cursor.cursor_id,
+                "format": export_format,
+            },
+        }
+        for export_format in supported_export_formats()
+    ]
+
+
+def create_export_ready_card(job: ExportJob, download_url: str) -> Dict[str, Any]:
+    return {
+        "type": "AdaptiveCard",
+        "version": "1.3",
+        "body": [
+            {
+                "type": "TextBlock",
+                "text": "✅ 匯出完成",
+                "weight": "Bolder",
+                "color": "Good",
+            },
+            {
+                "type": "TextBlock",
+                "text": f"{job.filename} · {job.rows_written:,} 筆 · {job.bytes_written / 1024:,.1f} KB",
+                "wrap": True,
+                "isSubtle": True,
+                "size": "Small",
+            },
+        ],
+        "actions": [
+            {
+                "type": "Action.OpenUrl",
+                "title": "下載檔案",
+                "url": download_url,
+            }
+        ],
+    }
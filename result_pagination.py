@@ -0,0 +1,352 @@
+"""Server-side pagination of Genie query results.
+
+每則查詢結果訊息對應一個短期游標（statement ID、chunk 配置與目前頁碼），
+第一頁以 Adaptive Card 表格送出，上一頁 / 下一頁按鈕由 on_adaptive_card_invoke
+處理；後續頁面只在被請求時才透過 statement result chunk API 讀取。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from genie_service import format_result_value
+from result_store import ResultStore
+
+logger = logging.getLogger(__name__)
+
+# 分頁按鈕送出的 action / verb 名稱
+RESULT_PAGE_ACTION = "result_page"
+
+ChunkFetcher = Callable[[str, int], Awaitable[Dict[str, Any]]]
+
+
+class ResultCursor:
+    """單則結果訊息的分頁游標"""
+
+    def __init__(
+        self,
+        user_id: str,
+        statement_id: Optional[str],
+        columns: List[Dict[str, Any]],
+        chunks: List[Dict[str, int]],
+        total_rows: int,
+        page_size: int,
+    ):
+        self.cursor_id = uuid.uuid4().hex[:12]
+        self.user_id = user_id
+        self.statement_id = statement_id
+        self.columns = columns
+        self.chunks = chunks
+        self.total_rows = total_rows
+        self.page_size = page_size
+        self.created_at = time.monotonic()
+        self.last_access = self.created_at
+        # 已寫入 ResultStore 的 chunk 索引
+        self.stored_chunks: set = set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """游標的中繼資料（不含資料列），供多工作行程模式下的其他行程重建游標"""
+        return {
+            "cursor_id": self.cursor_id,
+            "user_id": self.user_id,
+            "statement_id": self.statement_id,
+            "columns": self.columns,
+            "chunks": self.chunks,
+            "total_rows": self.total_rows,
+            "page_size": self.page_size,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ResultCursor":
+        cursor = cls(
+            user_id=data["user_id"],
+            statement_id=data.get("statement_id"),
+            columns=data["columns"],
+            chunks=data["chunks"],
+            total_rows=data["total_rows"],
+            page_size=data["page_size"],
+        )
+        cursor.cursor_id = data["cursor_id"]
+        return cursor
+
+    def chunk_key(self, chunk_index: int) -> str:
+        """此游標的 chunk 在 ResultStore 中的 key"""
+        return f"{self.cursor_id}:{chunk_index}"
+
+    @property
+    def page_count(self) -> int:
+        if self.total_rows <= 0:
+            return 1
+        return (self.total_rows + self.page_size - 1) // self.page_size
+
+    def clamp_page(self, page: int) -> int:
+        return max(0, min(page, self.page_count - 1))
+
+    def chunk_for_row(self, row: int) -> Dict[str, int]:
+        """找出包含指定列的 chunk 描述"""
+        for chunk in self.chunks:
+            if chunk["row_offset"] <= row < chunk["row_offset"] + chunk["row_count"]:
+                return chunk
+        raise IndexError(f"row {row} is outside of statement {self.statement_id}")
+
+
+class ResultCursorStore:
+    """短期分頁游標的儲存區（TTL + 數量上限），資料列保存在共用的 ResultStore 中
+
+    shared 為跨行程共用的字典（多工作行程模式）時，建立游標會一併寫入其中繼資料；
+    本機找不到的游標由中繼資料重建，資料列再依 statement_id 重新讀取對應的 chunk。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 1800,
+        max_cursors: int = 1000,
+        result_store: Optional[ResultStore] = None,
+        shared: Optional[MutableMapping] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_cursors = max_cursors
+        self.result_store = result_store or ResultStore()
+        self.shared = shared
+        self._cursors: "OrderedDict[str, ResultCursor]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._cursors)
+
+    async def create(self, user_id: str, answer_json: Dict[str, Any], page_size: int) -> Optional[ResultCursor]:
+        """由 GenieService.ask 的查詢結果建立游標，非表格結果回傳 None"""
+        columns = (answer_json.get("columns") or {}).get("columns")
+        data = answer_json.get("data") or {}
+        if not columns:
+            return None
+
+        first_rows = data.get("data_array") or []
+        total_rows = answer_json.get("total_row_count")
+        if total_rows is None:
+            total_rows = len(first_rows)
+
+        chunks = answer_json.get("chunks") or []
+        if not chunks:
+            # 沒有 manifest chunk 資訊時，視為只有一個已載入的 chunk
+            chunks = [{"chunk_index": 0, "row_offset": 0, "row_count": len(first_rows)}]
+            total_rows = len(first_rows)
+
+        cursor = ResultCursor(
+            user_id=user_id,
+            statement_id=answer_json.get("statement_id"),
+            columns=columns,
+            chunks=chunks,
+            total_rows=total_rows,
+            page_size=page_size,
+        )
+        first_chunk_index = data.get("chunk_index", chunks[0]["chunk_index"])
+        await self._store_chunk(cursor, first_chunk_index, first_rows)
+        self._add(cursor)
+        if self.shared is not None and cursor.statement_id:
+            await asyncio.to_thread(self.shared.__setitem__, cursor.cursor_id, cursor.to_dict())
+        return cursor
+
+    def _add(self, cursor: ResultCursor) -> None:
+        self._purge_expired()
+        self._cursors[cursor.cursor_id] = cursor
+        while len(self._cursors) > self.max_cursors:
+            _, evicted = self._cursors.popitem(last=False)
+            self._release(evicted)
+
+    async def get(self, cursor_id: Optional[str]) -> Optional[ResultCursor]:
+        if not cursor_id:
+            return None
+        self._purge_expired()
+        cursor = self._cursors.get(cursor_id)
+        if cursor:
+            cursor.last_access = time.monotonic()
+            self._cursors.move_to_end(cursor_id)
+        elif self.shared is not None:
+            # 游標可能由其他行程建立（共用資料庫的查詢在執行緒中進行）
+            data = await asyncio.to_thread(self.shared.get, cursor_id)
+            cursor = self._cursors.get(cursor_id)
+            if cursor is None and data:
+                cursor = ResultCursor.from_dict(data)
+                self._add(cursor)
+        return cursor
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        expired = [
+            cursor_id for cursor_id, cursor in self._cursors.items()
+            if now - cursor.last_access > self.ttl_seconds
+        ]
+        for cursor_id in expired:
+            self._release(self._cursors.pop(cursor_id))
+
+    async def _store_chunk(self, cursor: ResultCursor, chunk_index: int, rows: List[List[Any]]) -> None:
+        # 壓縮與可能發生的溢出寫檔在執行緒中進行，不佔用事件迴圈
+        await asyncio.to_thread(self.result_store.put, cursor.chunk_key(chunk_index), rows)
+        cursor.stored_chunks.add(chunk_index)
+
+    def _release(self, cursor: ResultCursor) -> None:
+        for chunk_index in cursor.stored_chunks:
+            self.result_store.discard(cursor.chunk_key(chunk_index))
+        cursor.stored_chunks.clear()
+
+    async def cached_chunk(self, cursor: ResultCursor, chunk_index: int) -> Optional[List[List[Any]]]:
+        """讀取已保存的 chunk（不改變 LRU 順序），未保存時回傳 None"""
+        if chunk_index not in cursor.stored_chunks:
+            return None
+        return await asyncio.to_thread(self.result_store.get, cursor.chunk_key(chunk_index), False)
+
+    async def _load_chunk(self, cursor: ResultCursor, chunk_index: int, fetch_chunk: ChunkFetcher) -> List[List[Any]]:
+        if chunk_index in cursor.stored_chunks:
+            # 解壓縮與可能的磁碟讀取在執行緒中進行
+            rows = await asyncio.to_thread(self.result_store.get, cursor.chunk_key(chunk_index))
+            if rows is not None:
+                return rows
+            # 已被 ResultStore 淘汰，重新讀取
+            cursor.stored_chunks.discard(chunk_index)
+
+        if not cursor.statement_id:
+            raise LookupError("result cursor has no statement to fetch chunks from")
+
+        chunk = await fetch_chunk(cursor.statement_id, chunk_index)
+        rows = chunk.get("data_array") or []
+        await self._store_chunk(cursor, chunk_index, rows)
+        return rows
+
+    async def get_page_rows(
+        self, cursor: ResultCursor, page: int, fetch_chunk: ChunkFetcher
+    ) -> Tuple[List[List[Any]], int]:
+        """取得指定頁的資料列，僅在需要時讀取對應的 chunk
+
+        Returns:
+            (資料列, 實際的頁碼)；超出範圍的頁碼會調整到第一頁或最後一頁。
+            頁碼不保存在游標上，同一個游標的並行請求不會互相影響。
+        """
+        page = cursor.clamp_page(page)
+        start = page * cursor.page_size
+        end = min(start + cursor.page_size, cursor.total_rows)
+
+        rows: List[List[Any]] = []
+        row = start
+        while row < end:
+            chunk = cursor.chunk_for_row(row)
+            chunk_rows = await self._load_chunk(cursor, chunk["chunk_index"], fetch_chunk)
+            local_start = row - chunk["row_offset"]
+            local_end = min(end, chunk["row_offset"] + chunk["row_count"]) - chunk["row_offset"]
+            rows.extend(chunk_rows[local_start:local_end])
+            row = chunk["row_offset"] + local_end
+
+        return rows, page
+
+
+def _page_action(cursor: ResultCursor, title: str, page: int) -> Dict[str, Any]:
+    return {
+        "type": "Action.Execute",
+        "title": title,
+        "verb": RESULT_PAGE_ACTION,
+        "data": {
+            "action": RESULT_PAGE_ACTION,
+            "cursorId": cursor.cursor_id,
+            "page": page,
+        },
+    }
+
+
+def build_result_page_card(
+    cursor: ResultCursor,
+    rows: List[List[Any]],
+    page: int,
+    extra_actions: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """建立單頁結果的 Adaptive Card 表格
+
+    Args:
+        cursor: 結果游標
+        rows: 目前頁面的資料列
+        page: 目前的頁碼（由 get_page_rows 回傳，從 0 開始）
+        extra_actions: 附加在分頁按鈕之後的其他動作（例如匯出）
+    """
+    columns = cursor.columns
+    header_row = {
+        "type": "TableRow",
+        "style": "accent",
+        "cells": [
+            {
+                "type": "TableCell",
+                "items": [{"type": "TextBlock", "text": col["name"], "weight": "Bolder", "wrap": True}],
+            }
+            for col in columns
+        ],
+    }
+    data_rows = [
+        {
+            "type": "TableRow",
+            "cells": [
+                {
+                    "type": "TableCell",
+                    "items": [{"type": "TextBlock", "text": format_result_value(value, col), "wrap": True}],
+                }
+                for value, col in zip(row, columns)
+            ],
+        }
+        for row in rows
+    ]
+
+    first_row = page * cursor.page_size + 1 if rows else 0
+    last_row = page * cursor.page_size + len(rows)
+    actions = []
+    if page > 0:
+        actions.append(_page_action(cursor, "⬅️ 上一頁", page - 1))
+    if page < cursor.page_count - 1:
+        actions.append(_page_action(cursor, "下一頁 ➡️", page + 1))
+    actions.extend(extra_actions or [])
+
+    card = {
+        "type": "AdaptiveCard",
+        "version": "1.5",
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "body": [
+            {
+                "type": "Table",
+                "gridStyle": "accent",
+                "firstRowAsHeader": True,
+                "columns": [{"width": 1} for _ in columns],
+                "rows": [header_row] + data_rows,
+            },
+            {
+                "type": "TextBlock",
+                "text": (
+                    f"第 {page + 1} / {cursor.page_count} 頁 · "
+                    f"第 {first_row:,}-{last_row:,} 筆，共 {cursor.total_rows:,} 筆"
+                ),
+                "isSubtle": True,
+                "size": "Small",
+                "horizontalAlignment": "Center",
+                "spacing": "Small",
+            },
+        ],
+    }
+    if actions:
+        card["actions"] = actions
+    return card
+
+
+def create_expired_page_card() -> Dict[str, Any]:
+    return {
+        "type": "AdaptiveCard",
+        "version": "1.5",
+        "body": [
+            {
+                "type": "TextBlock",
+                "text": "⌛ 此查詢結果的分頁已過期，請重新提問以取得最新資料。",
+                "wrap": True,
+                "size": "Small",
+                "color": "Warning",
+            }
+        ],
+    }
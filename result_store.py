@@ -0,0 +1,318 @@
+"""Tiered, compressed storage for query result rows.
+
+結果資料以欄式（columnar）區塊壓縮後保存：熱資料留在記憶體中，
+超出記憶體預算時依 LRU 順序溢出到本機磁碟檔案，讀取時以 mmap 映射；
+磁碟層也超出預算時再依 LRU 順序淘汰。記憶體預算有空間時，磁碟層命中的區塊會移回記憶體。
+
+溢出檔案在鎖外寫入，put 可由 asyncio.to_thread 呼叫，磁碟 I/O 不會佔用事件迴圈。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MEMORY_TIER = "memory"
+DISK_TIER = "disk"
+
+
+class _Codec:
+    """壓縮編解碼器，依可用套件選擇 zstd > lz4 > zlib"""
+
+    def __init__(self, name: str, compress, decompress):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+
+def _default_codec() -> _Codec:
+    try:
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor(level=3)
+        decompressor = zstandard.ZstdDecompressor()
+        return _Codec("zstd", compressor.compress, decompressor.decompress)
+    except ImportError:
+        pass
+    try:
+        import lz4.frame
+
+        return _Codec("lz4", lz4.frame.compress, lz4.frame.decompress)
+    except ImportError:
+        pass
+    return _Codec("zlib", lambda data: zlib.compress(data, 3), zlib.decompress)
+
+
+def encode_rows(rows: List[List[Any]]) -> bytes:
+    """將資料列轉為欄式 JSON 區塊（同欄位的值相鄰，壓縮率較高）"""
+    width = max((len(row) for row in rows), default=0)
+    columns = [[row[idx] if idx < len(row) else None for row in rows] for idx in range(width)]
+    return json.dumps(columns, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_rows(block: bytes) -> List[List[Any]]:
+    columns = json.loads(block)
+    if not columns:
+        return []
+    return [list(row) for row in zip(*columns)]
+
+
+class _Entry:
+    __slots__ = ("key", "tier", "data", "path", "raw_bytes", "stored_bytes", "row_count", "spilling")
+
+    def __init__(self, key: str, data: bytes, raw_bytes: int, row_count: int):
+        self.key = key
+        self.tier = MEMORY_TIER
+        self.data: Optional[bytes] = data
+        self.path: Optional[Path] = None
+        self.raw_bytes = raw_bytes
+        self.stored_bytes = len(data)
+        self.row_count = row_count
+        self.spilling = False  # 已選為溢出對象，檔案尚在寫入中
+
+
+class ResultStore:
+    """具記憶體預算的兩層結果儲存區（記憶體壓縮區塊 + mmap 磁碟溢出）"""
+
+    def __init__(
+        self,
+        memory_budget_bytes: int = 64 * 1024 * 1024,
+        disk_budget_bytes: int = 512 * 1024 * 1024,
+        spill_dir: Optional[str] = None,
+    ):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.disk_budget_bytes = disk_budget_bytes
+        # 每個行程使用獨立的子目錄：多工作行程模式下由共用中繼資料重建的游標沿用相同的 cursor_id，
+        # 共用目錄會讓兩個行程寫入並刪除同一個溢出檔案
+        base_dir = Path(spill_dir or os.path.join(tempfile.gettempdir(), "genie_result_store"))
+        self.spill_dir = base_dir / str(os.getpid())
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._codec = _default_codec()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory_bytes = 0
+        self._spilling_bytes = 0
+        self._disk_bytes = 0
+        self._raw_bytes = 0
+        self._hits = {MEMORY_TIER: 0, DISK_TIER: 0}
+        self._misses = 0
+        self._spills = 0
+        self._spill_seq = 0
+        self._promotions = 0
+        self._evictions = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, key: str, rows: List[List[Any]]) -> None:
+        """壓縮並保存一個資料區塊（已存在的 key 會被取代）"""
+        raw = encode_rows(rows)
+        data = self._codec.compress(raw)
+        with self._lock:
+            self._discard_locked(key)
+            entry = _Entry(key, data, len(raw), len(rows))
+            self._entries[key] = entry
+            self._memory_bytes += entry.stored_bytes
+            self._raw_bytes += entry.raw_bytes
+            spills = self._select_spills_locked()
+        # 溢出檔案在鎖外寫入，其他執行緒的讀取不需等待磁碟 I/O
+        self._write_spills(spills)
+
+    def get(self, key: str, promote: bool = True) -> Optional[List[List[Any]]]:
+        """讀取資料區塊；promote 為 True 時將其標記為最近使用，記憶體預算足夠時並移回記憶體
+
+        磁碟層的檔案在鎖外讀取，其他執行緒的讀寫不需等待磁碟 I/O。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            path = entry.path
+            if path is None:
+                data = entry.data
+                self._hits[MEMORY_TIER] += 1
+                if promote:
+                    self._entries.move_to_end(key)
+            else:
+                promote_to_memory = promote and self._memory_bytes + entry.stored_bytes <= self.memory_budget_bytes
+        if path is None:
+            return decode_rows(self._codec.decompress(data))
+
+        try:
+            if promote_to_memory:
+                data = path.read_bytes()
+                rows = decode_rows(self._codec.decompress(data))
+            else:
+                rows = decode_rows(self._read_spilled(path))
+        except FileNotFoundError:
+            with self._lock:
+                moved = self._entries.get(key) is entry and entry.path != path
+                if not moved:
+                    if self._entries.get(key) is entry:
+                        self._discard_locked(key)
+                    self._misses += 1
+            if moved:
+                # 讀取期間已由其他執行緒移回記憶體
+                return self.get(key, promote)
+            # 溢出檔案已被外部清除（例如暫存目錄清理）：視為未命中，由呼叫端重新讀取
+            logger.warning(f"⚠️ 找不到結果溢出檔案，視為未命中: {path}")
+            return None
+
+        with self._lock:
+            self._hits[DISK_TIER] += 1
+            current = self._entries.get(key) is entry
+            if current and promote:
+                self._entries.move_to_end(key)
+            promoted = (
+                current
+                and promote_to_memory
+                and entry.path == path
+                and self._memory_bytes + entry.stored_bytes <= self.memory_budget_bytes
+            )
+            if promoted:
+                self._promote_locked(entry, data)
+        if promoted:
+            path.unlink(missing_ok=True)
+        return rows
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._discard_locked(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stored = self._memory_bytes + self._disk_bytes
+            lookups = self._hits[MEMORY_TIER] + self._hits[DISK_TIER] + self._misses
+            tiers = {MEMORY_TIER: 0, DISK_TIER: 0}
+            for entry in self._entries.values():
+                tiers[entry.tier] += 1
+            return {
+                "codec": self._codec.name,
+                "entries": len(self._entries),
+                "memory_entries": tiers[MEMORY_TIER],
+                "disk_entries": tiers[DISK_TIER],
+                "memory_bytes": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "disk_bytes": self._disk_bytes,
+                "disk_budget_bytes": self.disk_budget_bytes,
+                "raw_bytes": self._raw_bytes,
+                "compression_ratio": round(self._raw_bytes / stored, 2) if stored else 0.0,
+                "memory_hits": self._hits[MEMORY_TIER],
+                "disk_hits": self._hits[DISK_TIER],
+                "misses": self._misses,
+                "memory_hit_rate": round(self._hits[MEMORY_TIER] / lookups, 4) if lookups else 0.0,
+                "disk_hit_rate": round(self._hits[DISK_TIER] / lookups, 4) if lookups else 0.0,
+                "spills": self._spills,
+                "promotions": self._promotions,
+                "evictions": self._evictions,
+            }
+
+    def close(self) -> None:
+        """刪除所有溢出檔案與此行程的溢出目錄"""
+        with self._lock:
+            for key in list(self._entries):
+                self._discard_locked(key)
+        try:
+            self.spill_dir.rmdir()
+        except OSError:
+            pass
+
+    def _spill_path(self, key: str) -> Path:
+        # 加上序號：同一個 key 被取代時，舊版本的檔案可能仍在寫入
+        self._spill_seq += 1
+        return self.spill_dir / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}-{self._spill_seq}.blk"
+
+    def _read_spilled(self, path: Path) -> bytes:
+        """以 mmap 映射溢出檔案並直接解壓縮，不先將檔案內容複製到記憶體"""
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return self._codec.decompress(mapped)
+
+    def _promote_locked(self, entry: _Entry, data: bytes) -> None:
+        """將已讀回的溢出區塊移回記憶體層（溢出檔案由呼叫端在鎖外刪除）"""
+        entry.path = None
+        entry.data = data
+        entry.tier = MEMORY_TIER
+        self._disk_bytes -= entry.stored_bytes
+        self._memory_bytes += entry.stored_bytes
+        self._promotions += 1
+
+    def _discard_locked(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._raw_bytes -= entry.raw_bytes
+        if entry.tier == MEMORY_TIER:
+            self._memory_bytes -= entry.stored_bytes
+            if entry.spilling:
+                # 檔案仍在寫入：完成時發現區塊已不在儲存區，會刪除該檔案
+                entry.spilling = False
+                self._spilling_bytes -= entry.stored_bytes
+        else:
+            self._disk_bytes -= entry.stored_bytes
+            entry.path.unlink(missing_ok=True)
+
+    def _select_spills_locked(self) -> List[Tuple[_Entry, Path]]:
+        """記憶體超出預算時，由最久未使用的區塊開始選出要溢出到磁碟的區塊"""
+        spills = []
+        for entry in self._entries.values():
+            if self._memory_bytes - self._spilling_bytes <= self.memory_budget_bytes:
+                break
+            if entry.tier != MEMORY_TIER or entry.spilling:
+                continue
+            entry.spilling = True
+            self._spilling_bytes += entry.stored_bytes
+            spills.append((entry, self._spill_path(entry.key)))
+        return spills
+
+    def _write_spills(self, spills: List[Tuple[_Entry, Path]]) -> None:
+        """在鎖外寫入溢出檔案，再於鎖內將區塊移到磁碟層"""
+        for entry, path in spills:
+            try:
+                path.write_bytes(entry.data)
+                written = True
+            except OSError as e:
+                logger.warning(f"⚠️ 無法寫入結果溢出檔案，區塊保留在記憶體中: {e}")
+                written = False
+            with self._lock:
+                if not entry.spilling:
+                    # 寫入期間區塊已被取代或刪除
+                    path.unlink(missing_ok=True)
+                    continue
+                entry.spilling = False
+                self._spilling_bytes -= entry.stored_bytes
+                if not written:
+                    continue
+                entry.path = path
+                entry.data = None
+                entry.tier = DISK_TIER
+                self._memory_bytes -= entry.stored_bytes
+                self._disk_bytes += entry.stored_bytes
+                self._spills += 1
+                self._evict_disk_locked()
+
+    def _evict_disk_locked(self) -> None:
+        # 磁碟超出預算：淘汰最久未使用的溢出區塊
+        if self._disk_bytes <= self.disk_budget_bytes:
+            return
+        for entry in list(self._entries.values()):
+            if self._disk_bytes <= self.disk_budget_bytes:
+                break
+            if entry.tier != DISK_TIER:
+                continue
+            self._discard_locked(entry.key)
+            self._evictions += 1
@@ -0,0 +1,337 @@
+"""Persistent session backend with write-behind batching.
+
+App Service 重新啟動或部署時，記憶體中的工作階段會全部消失，每位使用者都得重新經過
+Graph 查詢或手動輸入電子郵件，並失去 Genie conversation_id。此模組提供可替換的
+持久化後端（預設為 SQLite WAL），工作階段的變更先標記為 dirty，由背景工作批次寫入；
+啟動時一次載入所有未過期的工作階段，重新啟動對使用者而言是無感的。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from session_store import SessionStore
+from user_session import UserSession
+
+logger = logging.getLogger(__name__)
+
+SQLITE_BACKEND = "sqlite"
+MEMORY_BACKEND = "memory"
+
+
+class SessionBackend(ABC):
+    """工作階段持久化後端的介面"""
+
+    @abstractmethod
+    def load_all(self, max_idle_seconds: float) -> List[UserSession]:
+        """載入閒置時間未超過 max_idle_seconds 的工作階段（依最後活動時間由舊到新）"""
+
+    @abstractmethod
+    def load(self, user_id: str) -> Optional[UserSession]:
+        """載入單一使用者的工作階段，不存在時回傳 None"""
+
+    @abstractmethod
+    def save_many(self, sessions: Iterable[UserSession]) -> None:
+        """寫入（新增或取代）多個工作階段"""
+
+    @abstractmethod
+    def delete_many(self, user_ids: Iterable[str]) -> None:
+        """刪除多個使用者的工作階段"""
+
+    def close(self) -> None:
+        pass
+
+
+_COLUMNS = (
+    "user_id, email, name, conversation_id, created_at, last_activity, is_authenticated, "
+    "aad_object_id, upn, last_question, last_message_id, last_sql, last_response_at, query_count, text_charts"
+)
+
+
+def _session_to_row(session: UserSession) -> tuple:
+    context = session.user_context
+    return (
+        session.user_id,
+        session.email,
+        session.name,
+        session.conversation_id,
+        session.created_at,
+        session.last_activity,
+        int(session.is_authenticated),
+        session.aad_object_id,
+        session.upn,
+        context.last_question,
+        context.last_message_id,
+        context.last_sql,
+        context.last_response_at,
+        context.query_count,
+        int(context.text_charts),
+    )
+
+
+def _session_from_row(row: tuple) -> UserSession:
+    # 啟動時可能需還原數萬筆，直接設定欄位而不經過中介 dict
+    session = UserSession(row[0], row[1], row[2])
+    session.conversation_id = row[3]
+    session.created_at = row[4]
+    session.last_activity = row[5]
+    session.is_authenticated = bool(row[6])
+    session.aad_object_id = row[7]
+    session.upn = row[8]
+    context = session.user_context
+    context.last_question = row[9]
+    context.last_message_id = row[10]
+    context.last_sql = row[11]
+    context.last_response_at = row[12]
+    context.query_count = row[13]
+    context.text_charts = bool(row[14])
+    return session
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """以 SQLite（WAL 模式）保存工作階段"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 寫入在背景執行緒中進行，連線以鎖保護；多個行程共用時最多等待 5 秒取得寫入鎖
+        self._conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    user_id TEXT PRIMARY KEY,
+                    email TEXT NOT NULL,
+                    name TEXT,
+                    conversation_id TEXT,
+                    created_at REAL NOT NULL,
+                    last_activity REAL NOT NULL,
+                    is_authenticated INTEGER NOT NULL,
+                    aad_object_id TEXT,
+                    upn TEXT,
+                    last_question TEXT,
+                    last_message_id TEXT,
+                    last_sql TEXT,
+                    last_response_at REAL,
+                    query_count INTEGER NOT NULL DEFAULT 0,
+                    text_charts INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_activity ON sessions(last_activity)")
+            self._conn.commit()
+
+    def load_all(self, max_idle_seconds: float) -> List[UserSession]:
+        cutoff = time.time() - max_idle_seconds
+        with self._lock:
+            # 順便清除已過期的紀錄，避免資料庫無限成長
+            self._conn.execute("DELETE FROM sessions WHERE last_activity < ?", (cutoff,))
+            self._conn.commit()
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM sessions ORDER BY last_activity"
+            ).fetchall()
+        return [_session_from_row(row) for row in rows]
+
+    def load(self, user_id: str) -> Optional[UserSession]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        return _session_from_row(row) if row else None
+
+    def save_many(self, sessions: Iterable[UserSession]) -> None:
+        rows = [_session_to_row(session) for session in sessions]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def delete_many(self, user_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM sessions WHERE user_id = ?", [(user_id,) for user_id in user_ids])
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_backend(kind: str, path: Optional[str] = None) -> Optional[SessionBackend]:
+    """依設定建立持久化後端；kind 為 memory 時不持久化，回傳 None"""
+    if kind == MEMORY_BACKEND:
+        return None
+    if kind == SQLITE_BACKEND:
+        return SQLiteSessionBackend(path or str(Path(tempfile.gettempdir()) / "genie_sessions.db"))
+    raise ValueError(f"unsupported session store backend: {kind}")
+
+
+class SessionPersister:
+    """工作階段的 write-behind 持久化
+
+    mark_dirty / mark_deleted 只記錄需要寫入的使用者 ID，背景工作每隔 flush_interval
+    秒將累積的變更以單一交易批次寫入；同一個工作階段在兩次寫入之間多次變更只會寫入一次。
+
+    write_through 為 True 時（多工作行程模式）變更會立即喚醒背景工作寫入，並在每個回合開始時以 sync
+    讀取共用資料庫中的最新版本，讓任何一個行程都能接續處理使用者的下一個回合。
+    SQLite 的讀寫都在執行緒中進行，鎖競爭不會阻塞事件迴圈上的其他對話。
+    """
+
+    def __init__(
+        self,
+        backend: Optional[SessionBackend],
+        flush_interval: float = 5.0,
+        write_through: bool = False,
+    ):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.write_through = write_through
+        self._dirty: Dict[str, UserSession] = {}
+        self._deleted: set = set()
+        # 正在由背景工作寫入的使用者 ID（本機版本比資料庫新）
+        self._writing: set = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushes = 0
+        self._written = 0
+        self._restored = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def mark_dirty(self, session: Optional[UserSession]) -> None:
+        if self.backend is None or session is None:
+            return
+        self._deleted.discard(session.user_id)
+        self._dirty[session.user_id] = session
+        self._wake_writer()
+
+    def mark_deleted(self, user_id: str) -> None:
+        if self.backend is None:
+            return
+        self._dirty.pop(user_id, None)
+        self._deleted.add(user_id)
+        self._wake_writer()
+
+    def _wake_writer(self) -> None:
+        if self.write_through and self._wake is not None:
+            self._wake.set()
+
+    def _has_local_changes(self, user_id: str) -> bool:
+        return user_id in self._dirty or user_id in self._deleted or user_id in self._writing
+
+    async def sync(self, user_id: str, sessions: SessionStore, email_sessions: SessionStore) -> None:
+        """以共用資料庫中的版本取代本機快取（多工作行程模式，於回合開始時呼叫）
+
+        本機有尚未寫入的變更時保留本機版本，避免以資料庫中較舊的版本覆寫。
+        """
+        if not self.write_through or self._has_local_changes(user_id):
+            return
+        stored = await asyncio.to_thread(self.backend.load, user_id)
+        if self._has_local_changes(user_id):
+            return
+        if stored is None:
+            # 已在其他行程登出或過期
+            sessions.pop(user_id, None)
+            return
+        sessions[user_id] = stored
+        email_sessions[stored.email] = stored
+
+    def restore(self, sessions: SessionStore, email_sessions: SessionStore) -> int:
+        """啟動時將未過期的工作階段批次載入記憶體中的儲存區，回傳載入的筆數"""
+        if self.backend is None:
+            return 0
+        start = time.time()
+        restored = self.backend.load_all(sessions.ttl_seconds)
+        now = time.time()
+        for session in restored:
+            idle_seconds = max(0.0, now - session.last_activity)
+            sessions.put(session.user_id, session, idle_seconds)
+            email_sessions.put(session.email, session, idle_seconds)
+        self._restored = len(restored)
+        logger.info(f"💾 已還原 {len(restored)} 個工作階段，耗時 {(time.time() - start) * 1000:.0f}ms")
+        return len(restored)
+
+    def _take_batch(self):
+        dirty, self._dirty = list(self._dirty.values()), {}
+        deleted, self._deleted = list(self._deleted), set()
+        return dirty, deleted
+
+    def _write_batch(self, dirty: List[UserSession], deleted: List[str]) -> int:
+        if deleted:
+            self.backend.delete_many(deleted)
+        if dirty:
+            self.backend.save_many(dirty)
+        self._flushes += 1
+        self._written += len(dirty) + len(deleted)
+        return len(dirty) + len(deleted)
+
+    def _requeue(self, dirty: List[UserSession], deleted: List[str]) -> None:
+        """寫入失敗時放回佇列，較新的變更優先"""
+        for user_id in deleted:
+            if user_id not in self._dirty:
+                self._deleted.add(user_id)
+        for session in dirty:
+            if session.user_id not in self._deleted:
+                self._dirty.setdefault(session.user_id, session)
+
+    def flush(self) -> int:
+        """立即寫入所有累積的變更，回傳寫入的筆數"""
+        if self.backend is None or not (self._dirty or self._deleted):
+            return 0
+        return self._write_batch(*self._take_batch())
+
+    async def _run(self) -> None:
+        while True:
+            # write_through 模式下 mark_dirty / mark_deleted 會立即喚醒，否則每隔 flush_interval 寫入
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not (self._dirty or self._deleted):
+                continue
+            # 在事件迴圈中取出快照，再交給執行緒寫入，新的變更會累積到下一批
+            dirty, deleted = self._take_batch()
+            self._writing = {session.user_id for session in dirty} | set(deleted)
+            try:
+                await asyncio.to_thread(self._write_batch, dirty, deleted)
+            except Exception as e:  # 寫入失敗不應中止背景工作
+                self._requeue(dirty, deleted)
+                logger.warning(f"⚠️ 寫入工作階段資料時發生錯誤: {e}")
+            finally:
+                self._writing = set()
+
+    def start(self) -> None:
+        if self.backend is not None and (self._task is None or self._task.done()):
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """停止背景工作並寫入剩餘的變更（應用程式關閉時調用）"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.backend is not None:
+            self.flush()
+            self.backend.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._dirty) + len(self._deleted),
+            "flushes": self._flushes,
+            "written": self._written,
+            "restored": self._restored,
+        }
@@ -0,0 +1,212 @@
+"""Bounded in-memory session store with idle TTL and LRU eviction.
+
+使用者工作階段、電子郵件索引、回饋紀錄等原本存放在只會成長的 dict 中，
+程序執行越久記憶體用量越大。SessionStore 提供相同的字典介面，
+但每筆資料有閒置 TTL（存取時更新）並有筆數上限（超過時依 LRU 淘汰），
+過期資料由背景 SessionSweeper 定期清除，統計資料提供筆數與估計的記憶體用量。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 估計記憶體用量時抽樣的筆數（以平均值乘以總筆數）
+SIZE_SAMPLE_ENTRIES = 64
+
+
+def estimate_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """遞迴估計物件佔用的位元組數（dict / list / 一般物件的屬性）"""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(key, seen) + estimate_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif not isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        if hasattr(obj, "__dict__"):
+            size += estimate_size(vars(obj), seen)
+        for slot in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, slot):
+                size += estimate_size(getattr(obj, slot), seen)
+    return size
+
+
+class SessionStore(MutableMapping):
+    """具閒置 TTL 與筆數上限的 LRU 字典
+
+    讀取與寫入都會更新該筆資料的最後存取時間；`in` 只檢查是否存在且未過期，不延長壽命。
+    on_evict 在資料因過期、超出上限、被刪除或被另一個值取代時呼叫，可用來同步清除其他索引。
+    *_async 方法與 SharedMapping 的介面相同，呼叫端不需區分本機或跨行程共用的儲存區。
+    """
+
+    blocking = False
+
+    def __init__(
+        self,
+        name: str,
+        ttl_seconds: float,
+        max_entries: int,
+        on_evict: Optional[Callable[[Any, Any], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self._clock = clock
+        # key -> (value, 最後存取時間)，依最後存取時間由舊到新排列
+        self._entries: "OrderedDict[Any, Tuple[Any, float]]" = OrderedDict()
+        self._expired = 0
+        self._evicted = 0
+
+    def __getitem__(self, key: Any) -> Any:
+        value, last_access = self._entries[key]
+        now = self._clock()
+        if now - last_access > self.ttl_seconds:
+            self._remove(key, expired=True)
+            raise KeyError(key)
+        self._entries[key] = (value, now)
+        self._entries.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self.put(key, value)
+
+    def put(self, key: Any, value: Any, idle_seconds: float = 0.0) -> None:
+        """寫入資料；idle_seconds 為該筆資料已閒置的秒數（還原持久化的工作階段時使用）"""
+        previous = self._entries.get(key)
+        self._entries[key] = (value, self._clock() - idle_seconds)
+        self._entries.move_to_end(key)
+        if previous is not None and previous[0] is not value and self.on_evict is not None:
+            self.on_evict(key, previous[0])
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._evicted += 1
+
+    async def get_async(self, key: Any, default: Any = None) -> Any:
+        return self.get(key, default)
+
+    async def set_async(self, key: Any, value: Any) -> None:
+        self.put(key, value)
+
+    async def pop_async(self, key: Any, default: Any = None) -> Any:
+        return self.pop(key, default)
+
+    async def contains_async(self, key: Any) -> bool:
+        return key in self
+
+    def __delitem__(self, key: Any) -> None:
+        if key not in self._entries:
+            raise KeyError(key)
+        self._remove(key)
+
+    def __contains__(self, key: Any) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and self._clock() - entry[1] <= self.ttl_seconds
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Any, expired: bool = False) -> None:
+        value, _ = self._entries.pop(key)
+        if expired:
+            self._expired += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def sweep(self) -> int:
+        """清除所有已過期的資料，回傳清除的筆數
+
+        資料依最後存取時間排序，只需從最舊的一端掃描到第一筆未過期的資料。
+        """
+        cutoff = self._clock() - self.ttl_seconds
+        expired: List[Any] = []
+        for key, (_, last_access) in self._entries.items():
+            if last_access >= cutoff:
+                break
+            expired.append(key)
+        for key in expired:
+            self._remove(key, expired=True)
+        return len(expired)
+
+    def estimated_bytes(self) -> int:
+        """以抽樣的平均大小估計所有資料佔用的記憶體"""
+        if not self._entries:
+            return 0
+        sample = list(itertools.islice(self._entries.items(), SIZE_SAMPLE_ENTRIES))
+        sampled = sum(estimate_size(key) + estimate_size(value) for key, (value, _) in sample)
+        return int(sampled / len(sample) * len(self._entries) + sys.getsizeof(self._entries))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "estimated_bytes": self.estimated_bytes(),
+            "expired": self._expired,
+            "evicted": self._evicted,
+        }
+
+
+class SessionSweeper:
+    """定期清除多個 SessionStore 中過期資料的背景工作"""
+
+    def __init__(self, stores: List[SessionStore], interval_seconds: float = 300):
+        self.stores = stores
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def sweep(self) -> Dict[str, int]:
+        """清除一次所有儲存區，回傳各儲存區清除的筆數"""
+        return self._log_removed({store.name: store.sweep() for store in self.stores})
+
+    async def sweep_async(self) -> Dict[str, int]:
+        """與 sweep 相同，但跨行程共用的儲存區在執行緒中清除，不阻塞事件迴圈"""
+        removed = {}
+        for store in self.stores:
+            if getattr(store, "blocking", False):
+                removed[store.name] = await asyncio.to_thread(store.sweep)
+            else:
+                removed[store.name] = store.sweep()
+        return self._log_removed(removed)
+
+    @staticmethod
+    def _log_removed(removed: Dict[str, int]) -> Dict[str, int]:
+        if any(removed.values()):
+            logger.info(f"🧹 已清除過期的工作階段資料: {removed}")
+        return removed
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.sweep_async()
+            except Exception as e:  # 清除失敗不應中止背景工作
+                logger.warning(f"⚠️ 清除工作階段資料時發生錯誤: {e}")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """停止背景工作（應用程式關閉時調用）"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,179 @@
+"""Cross-process state for multi-worker serving.
+
+多工作行程模式下，同一位使用者的下一個回合可能由任何一個行程處理，
+因此等待輸入電子郵件的狀態、回饋紀錄與分頁游標等原本只存在單一行程記憶體中的資料
+改存放在同一台機器上的 SQLite（WAL）資料庫。SharedMapping 提供與 SessionStore
+相同的字典介面與 sweep / stats，可直接替換並交給 SessionSweeper 定期清除。
+
+SQLite 的鎖可能被其他行程持有（最多等待 5 秒），在事件迴圈中應使用 *_async 方法，
+查詢會交給執行緒進行，不會讓同一行程中的其他對話停頓。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+
+def default_shared_state_path() -> str:
+    return str(Path(tempfile.gettempdir()) / "genie_shared_state.db")
+
+
+class SharedStateDB:
+    """多個行程共用的 SQLite 鍵值資料庫（依命名空間區分，每筆資料有到期時間）"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or default_shared_state_path())
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 其他行程寫入時最多等待 5 秒取得鎖
+        self._conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS shared_state (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS shared_state_expires ON shared_state(namespace, expires_at)"
+            )
+            self._conn.commit()
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def write(self, sql: str, params: tuple = ()) -> int:
+        """執行寫入並提交，回傳受影響的筆數"""
+        with self._lock:
+            rowcount = self._conn.execute(sql, params).rowcount
+            self._conn.commit()
+            return rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SharedMapping(MutableMapping):
+    """存放在 SharedStateDB 中、具 TTL 的字典（值需可 JSON 序列化）
+
+    寫入時設定到期時間；讀取不延長壽命，過期資料在讀取時視為不存在並由 sweep 清除。
+    """
+
+    # 操作會執行 SQLite 查詢，SessionSweeper 與統計資料在執行緒中呼叫
+    blocking = True
+
+    def __init__(self, db: SharedStateDB, name: str, ttl_seconds: float, max_entries: int = 0):
+        self.db = db
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._expired = 0
+
+    def __getitem__(self, key: str) -> Any:
+        rows = self.db.query(
+            "SELECT value FROM shared_state WHERE namespace = ? AND key = ? AND expires_at >= ?",
+            (self.name, key, time.time()),
+        )
+        if not rows:
+            raise KeyError(key)
+        return json.loads(rows[0][0])
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.db.write(
+            "INSERT OR REPLACE INTO shared_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (self.name, key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl_seconds),
+        )
+
+    def __delitem__(self, key: str) -> None:
+        if not self.db.write("DELETE FROM shared_state WHERE namespace = ? AND key = ?", (self.name, key)):
+            raise KeyError(key)
+
+    def claim(self, key: str, value: Any) -> bool:
+        """不存在或已過期時寫入並回傳 True；其他行程已寫入且尚未過期時回傳 False（單一 SQL 完成，不會競爭）"""
+        now = time.time()
+        return bool(
+            self.db.write(
+                "INSERT INTO shared_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE shared_state.expires_at < ?",
+                (self.name, key, json.dumps(value, ensure_ascii=False), now + self.ttl_seconds, now),
+            )
+        )
+
+    async def get_async(self, key: str, default: Any = None) -> Any:
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def set_async(self, key: str, value: Any) -> None:
+        await asyncio.to_thread(self.__setitem__, key, value)
+
+    async def pop_async(self, key: str, default: Any = None) -> Any:
+        return await asyncio.to_thread(self.pop, key, default)
+
+    async def contains_async(self, key: str) -> bool:
+        return await asyncio.to_thread(self.__contains__, key)
+
+    async def claim_async(self, key: str, value: Any) -> bool:
+        return await asyncio.to_thread(self.claim, key, value)
+
+    def __contains__(self, key: Any) -> bool:
+        rows = self.db.query(
+            "SELECT 1 FROM shared_state WHERE namespace = ? AND key = ? AND expires_at >= ?",
+            (self.name, key, time.time()),
+        )
+        return bool(rows)
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self.db.query(
+            "SELECT key FROM shared_state WHERE namespace = ? AND expires_at >= ?", (self.name, time.time())
+        )
+        return iter([row[0] for row in rows])
+
+    def __len__(self) -> int:
+        return self.db.query(
+            "SELECT COUNT(*) FROM shared_state WHERE namespace = ? AND expires_at >= ?", (self.name, time.time())
+        )[0][0]
+
+    def sweep(self) -> int:
+        """清除已過期的資料；設定了筆數上限時一併刪除最早到期的多餘資料"""
+        removed = self.db.write(
+            "DELETE FROM shared_state WHERE namespace = ? AND expires_at < ?", (self.name, time.time())
+        )
+        if self.max_entries:
+            removed += self.db.write(
+                "DELETE FROM shared_state WHERE namespace = ? AND key IN ("
+                "SELECT key FROM shared_state WHERE namespace = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.name, self.name, self.max_entries),
+            )
+        self._expired += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        entries, size = self.db.query(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM shared_state WHERE namespace = ?",
+            (self.name,),
+        )[0]
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "estimated_bytes": size,
+            "expired": self._expired,
+            "shared": True,
+        }
@@ -0,0 +1,119 @@
+"""測試 Bot Connector 重送活動的去重複（join、drop、失敗釋放與跨行程共用）"""
+
+import asyncio
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+from activity_dedup import ActivityDeduplicator, activity_dedup_key
+from shared_state import SharedMapping, SharedStateDB
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _activity(activity_id, conversation_id="conv-1"):
+    return SimpleNamespace(id=activity_id, channel_id="msteams", conversation=SimpleNamespace(id=conversation_id))
+
+
+def test_duplicates_are_joined_dropped_or_released():
+    """測試處理中的重複活動等待原始結果、完成後略過、失敗後允許重新處理"""
+
+    async def scenario():
+        clock = _Clock()
+        dedup = ActivityDeduplicator(window_seconds=60, max_entries=100, clock=clock)
+        calls = []
+
+        async def slow_handler():
+            calls.append("question")
+            await asyncio.sleep(0.05)
+            return 201
+
+        key = activity_dedup_key(_activity("act-1"))
+        statuses = await asyncio.gather(dedup.process(key, slow_handler), dedup.process(key, slow_handler))
+        assert statuses == [201, 201] and calls == ["question"]
+        # 已完成的活動回傳原始的狀態碼，不再處理
+        assert await dedup.process(key, slow_handler) == 201
+        assert calls == ["question"]
+
+        # 不同對話中相同的活動 ID 不視為重複；缺少 ID 時不去重複
+        assert await dedup.process(activity_dedup_key(_activity("act-1", "conv-2")), slow_handler) == 201
+        assert activity_dedup_key(_activity(None)) is None
+
+        async def failing_handler():
+            calls.append("failed")
+            return 503
+
+        key = activity_dedup_key(_activity("act-2"))
+        assert await dedup.process(key, failing_handler) == 503
+        assert await dedup.process(key, slow_handler) == 201
+
+        # 時間窗過後視為新的活動
+        clock.now = 61
+        assert await dedup.process(activity_dedup_key(_activity("act-1")), slow_handler) == 201
+
+        stats = dedup.stats()
+        assert stats["unique"] == 5 and stats["joined"] == 1 and stats["dropped"] == 1
+        assert stats["released"] == 1
+
+    asyncio.run(scenario())
+    print("✅ 重複活動 join / drop / 釋放測試通過")
+
+
+def test_duplicates_across_workers():
+    """測試其他行程已處理的活動不會再次處理"""
+
+    async def scenario(path):
+        workers = [
+            ActivityDeduplicator(60, 100, shared=SharedMapping(SharedStateDB(path), "activity_dedup", 60))
+            for _ in range(2)
+        ]
+
+        async def handler():
+            return 201
+
+        key = activity_dedup_key(_activity("act-1"))
+        assert await workers[0].process(key, handler) == 201
+        assert await workers[1].process(key, handler) == 200
+        assert workers[1].stats()["dropped"] == 1
+        # 等待共用資料庫期間送達的重複請求加入同一個處理，而非視為其他行程的請求
+        key = activity_dedup_key(_activity("act-3"))
+        assert await asyncio.gather(workers[0].process(key, handler), workers[0].process(key, handler)) == [201, 201]
+        assert workers[0].stats()["joined"] == 1
+
+        expired = SharedMapping(workers[0].shared.db, "activity_dedup", ttl_seconds=-1)
+        assert expired.claim("old", True) is True
+        assert workers[1].shared.claim("old", True) is True
+        assert workers[0].shared.claim("old", True) is False
+
+        # invoke 的回應本文只有原始行程有：重複的請求取得相同的本文，其他行程則重新處理
+        invokes = []
+
+        async def invoke_handler():
+            invokes.append(True)
+            await asyncio.sleep(0.01)
+            return 200, b'{"type":"application/vnd.microsoft.card.adaptive"}'
+
+        key = activity_dedup_key(_activity("invoke-1"))
+        options = dict(status_of=lambda result: result[0], duplicate=(200, None), local_only=True)
+        first, joined = await asyncio.gather(
+            workers[0].process(key, invoke_handler, **options), workers[0].process(key, invoke_handler, **options)
+        )
+        assert first == joined == (200, b'{"type":"application/vnd.microsoft.card.adaptive"}')
+        assert await workers[0].process(key, invoke_handler, **options) == first
+        assert await workers[1].process(key, invoke_handler, **options) == first
+        assert len(invokes) == 2
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(str(Path(tmp) / "shared.db")))
+    print("✅ 跨行程重複活動測試通過")
+
+
+if __name__ == "__main__":
+    test_duplicates_are_joined_dropped_or_released()
+    test_duplicates_across_workers()
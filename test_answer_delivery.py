@@ -0,0 +1,137 @@
+"""測試答案與圖表的送出順序：答案不等待圖表，短時間內完成的圖表與答案合併送出"""
+
+import asyncio
+import json
+import time
+
+from botbuilder.core import TurnContext
+from botbuilder.core.adapters import TestAdapter
+from botbuilder.schema import Activity, ActivityTypes, ChannelAccount, ConversationAccount
+
+import app
+from user_session import UserSession
+
+ANSWER = {
+    "query_description": "各地區營收",
+    "columns": {"columns": [
+        {"name": "地區", "type_name": "STRING", "type_text": "STRING"},
+        {"name": "營收", "type_name": "INT", "type_text": "INT"},
+    ]},
+    "data": {"data_array": [["北部", "120"], ["中部", "80"], ["南部", "95"]]},
+    "total_row_count": 3,
+}
+CHART_CARD = {"type": "AdaptiveCard", "body": [{"type": "TextBlock", "text": "圖表"}]}
+
+
+def _turn_context(channel_id):
+    adapter = TestAdapter()
+    activity = Activity(
+        type=ActivityTypes.message,
+        id="act-1",
+        text="各地區營收？",
+        channel_id=channel_id,
+        from_property=ChannelAccount(id="user-1"),
+        recipient=ChannelAccount(id="bot"),
+        conversation=ConversationAccount(id="conv-1"),
+        service_url="https://example.test",
+    )
+    return adapter, TurnContext(adapter, activity)
+
+
+def _has_chart(activity):
+    return any(attachment.content == CHART_CARD for attachment in activity.attachments or [])
+
+
+def _has_answer(activity):
+    return "各地區營收" in (activity.text or "")
+
+
+async def _answer(channel_id, chart_ready, answer=ANSWER):
+    """以假的 Genie 回應與圖表繪製執行一個回合，回傳 (送出的活動, 圖表完成前已送出的活動)"""
+    bot = app.BOT
+    adapter, turn_context = _turn_context(channel_id)
+    user_session = UserSession("user-1", "user1@example.com")
+
+    async def ask(question, space_id, session, conversation_id):
+        return json.dumps(answer), "conv-1", "msg-1"
+
+    async def render_chart(chart_info):
+        await chart_ready.wait()
+        return CHART_CARD, None
+
+    bot.genie_service.ask = ask
+    bot._render_chart_reply = render_chart
+    try:
+        task = asyncio.create_task(bot._answer_question(turn_context, "各地區營收？", user_session, time.perf_counter()))
+        for _ in range(200):
+            if task.done() or any(_has_answer(activity) for activity in adapter.activity_buffer):
+                break
+            await asyncio.sleep(0.01)
+        before_chart = list(adapter.activity_buffer)
+        chart_ready.set()
+        await task
+    finally:
+        del bot.genie_service.ask
+        del bot._render_chart_reply
+    return list(adapter.activity_buffer), before_chart
+
+
+def test_answer_is_sent_before_late_chart():
+    """測試圖表繪製較慢時，答案先送出，圖表完成後以獨立訊息送在最後"""
+
+    async def scenario():
+        for channel_id in ("slack", "msteams"):
+            sent, before_chart = await _answer(channel_id, asyncio.Event())
+            assert any(_has_answer(activity) for activity in before_chart), channel_id
+            assert not any(_has_chart(activity) for activity in before_chart), channel_id
+            assert _has_chart(sent[-1]) and not _has_answer(sent[-1]), channel_id
+            assert sum(_has_chart(activity) for activity in sent) == 1
+
+    asyncio.run(scenario())
+    print("✅ 答案先於較慢的圖表送出測試通過")
+
+
+def test_fast_chart_is_merged_with_answer():
+    """測試圖表在合併等待時間內完成時，與答案、回饋卡合併為同一個活動"""
+
+    async def scenario():
+        chart_ready = asyncio.Event()
+        chart_ready.set()
+        sent, _ = await _answer("msteams", chart_ready)
+        answers = [activity for activity in sent if _has_answer(activity)]
+        assert len(answers) == 1
+        assert _has_chart(answers[0]) and len(answers[0].attachments) == 2
+        assert sum(_has_chart(activity) for activity in sent) == 1
+        # 處理中訊息 + 合併後的答案
+        assert len([activity for activity in sent if activity.type == ActivityTypes.message]) == 2
+
+    asyncio.run(scenario())
+    print("✅ 圖表與答案合併送出測試通過")
+
+
+def test_answer_is_sent_when_result_page_fails():
+    """測試分頁表格建立失敗時只略過表格，答案仍照常送出"""
+
+    async def fetch_failed(*args):
+        raise IndexError("chunk out of range")
+
+    async def scenario():
+        chart_ready = asyncio.Event()
+        chart_ready.set()
+        large = dict(ANSWER, statement_id="stmt-1", total_row_count=app.CONFIG.RESULT_PAGE_SIZE + 1)
+        app.BOT.result_cursors.get_page_rows = fetch_failed
+        try:
+            sent, _ = await _answer("msteams", chart_ready, large)
+        finally:
+            del app.BOT.result_cursors.get_page_rows
+        answers = [activity for activity in sent if _has_answer(activity)]
+        assert len(answers) == 1 and _has_chart(answers[0])
+
+    asyncio.run(scenario())
+    print("✅ 分頁表格失敗時仍送出答案測試通過")
+
+
+if __name__ == "__main__":
+    test_answer_is_sent_before_late_chart()
+    test_fast_chart_is_merged_with_answer()
+    test_answer_is_sent_when_result_page_fails()
@@ -0,0 +1,123 @@
+"""測試以內容雜湊為鍵的圖表圖片快取"""
+
+import asyncio
+import tempfile
+import threading
+
+from urllib.parse import parse_qs, urlsplit
+
+from chart_cache import ChartImageCache, chart_cache_key, sign_chart_path, verify_chart_signature
+from chart_image import ChartImage
+
+
+def _chart(values):
+    return {
+        'suitable': True,
+        'chart_type': 'bar',
+        'category_column': '產品',
+        'value_column': '銷售額',
+        'data_for_chart': [{'category': f'產品{i}', 'value': v} for i, v in enumerate(values)],
+    }
+
+
+def test_chart_cache_key_normalization():
+    """測試相同內容產生相同鍵，不影響繪圖的欄位不改變鍵"""
+    key = chart_cache_key(_chart([1000, 1500]))
+    assert key == chart_cache_key(_chart([1000.0, 1500.0]))
+    assert key == chart_cache_key(dict(_chart([1000, 1500]), reason='偵測到 2 個類別'))
+    assert key != chart_cache_key(_chart([1000, 1501]))
+    assert key != chart_cache_key(dict(_chart([1000, 1500]), chart_type='pie'))
+    print("✅ 快取鍵正規化測試通過")
+
+
+def test_chart_cache_lru_and_disk():
+    """測試記憶體預算 LRU 淘汰、磁碟持久化與統計資料"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ChartImageCache(memory_budget_bytes=250, disk_dir=cache_dir)
+        for i in range(3):
+            cache.put(f"k{i}", ChartImage(bytes([i]) * 100, render_ms=40.0, encode_ms=10.0))
+
+        assert cache.get("k2").data == bytes([2]) * 100
+        assert cache.get("missing") is None
+        stats = cache.stats()
+        assert stats["entries"] == 2 and stats["evictions"] == 1
+        assert stats["render_ms_saved"] == 50.0
+
+        # 已被記憶體淘汰的圖片仍可由磁碟讀回；重新啟動後磁碟索引也會重建
+        assert cache.get("k0").data == bytes([0]) * 100
+        restarted = ChartImageCache(memory_budget_bytes=250, disk_dir=cache_dir)
+        assert "k1" in restarted and restarted.get("k1").data == bytes([1]) * 100
+        assert restarted.stats()["disk_hits"] == 1
+        assert cache.stats()["hit_rate"] == round(2 / 3, 4)
+    print("✅ 圖表快取測試通過")
+
+
+def test_chart_cache_async_disk_io_off_loop():
+    """測試 put_async / get_async 的磁碟讀寫在事件迴圈以外的執行緒中進行"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ChartImageCache(memory_budget_bytes=150, disk_dir=cache_dir, shared_disk=True)
+        other = ChartImageCache(memory_budget_bytes=150, disk_dir=cache_dir, shared_disk=True)
+        threads = []
+        for instance in (cache, other):
+            write_disk, read_disk = instance._write_disk, instance._read_disk
+            instance._write_disk = lambda *args, f=write_disk: threads.append(threading.current_thread()) or f(*args)
+            instance._read_disk = lambda key, f=read_disk: threads.append(threading.current_thread()) or f(key)
+
+        async def scenario():
+            await cache.put_async("k0", ChartImage(b"0" * 100, render_ms=40.0))
+            await cache.put_async("k1", ChartImage(b"1" * 100, render_ms=40.0))
+            # k0 已被記憶體淘汰，從磁碟讀回；另一個行程由共用目錄讀取
+            assert (await cache.get_async("k0")).data == b"0" * 100
+            assert (await other.get_async("k1")).data == b"1" * 100
+            assert await other.get_async("missing") is None
+
+        asyncio.run(scenario())
+        assert len(threads) == 4 and threading.main_thread() not in threads
+    print("✅ 圖表快取非同步磁碟讀寫測試通過")
+
+
+def test_chart_url_signature():
+    """測試圖表網址簽章驗證與到期"""
+    key = chart_cache_key(_chart([1, 2]))
+    path = sign_chart_path(key, "secret", ttl_seconds=60, now=1000)
+    parts = urlsplit(path)
+    query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+    assert parts.path == f"/charts/{key}.png"
+
+    assert verify_chart_signature(key, query["exp"], query["sig"], "secret", now=1030)
+    assert not verify_chart_signature(key, query["exp"], query["sig"], "secret", now=1061)
+    assert not verify_chart_signature(key, query["exp"], query["sig"], "other-secret", now=1030)
+    assert not verify_chart_signature(key, str(int(query["exp"]) + 3600), query["sig"], "secret", now=1030)
+    assert not verify_chart_signature(key, None, None, "secret", now=1030)
+    print("✅ 圖表網址簽章測試通過")
+
+
+def test_chart_image_url_requires_disk_cache_and_secret():
+    """測試只有同時設定對外網址、磁碟快取與簽章金鑰時才使用圖表網址，否則內嵌圖片"""
+    import app
+    from chart_render_pool import ChartRenderResult
+
+    key = chart_cache_key(_chart([3, 4]))
+    image = ChartImage(b"png", render_ms=1.0)
+    app.CHART_CACHE.put(key, image)
+    render = ChartRenderResult(image, render_ms=1.0, queue_wait_ms=0.0, cache_key=key)
+    config = app.CONFIG
+    original = (config.PUBLIC_BASE_URL, config.CHART_CACHE_DIR, config.CHART_URL_SECRET)
+    try:
+        config.PUBLIC_BASE_URL = "https://bot.example.test"
+        for cache_dir, secret in (("", ""), ("/tmp/charts", ""), ("", "secret")):
+            config.CHART_CACHE_DIR, config.CHART_URL_SECRET = cache_dir, secret
+            assert app.build_chart_image_url(render) == image.data_uri()
+        config.CHART_CACHE_DIR, config.CHART_URL_SECRET = "/tmp/charts", "secret"
+        assert app.build_chart_image_url(render).startswith(f"https://bot.example.test/charts/{key}.png?")
+    finally:
+        config.PUBLIC_BASE_URL, config.CHART_CACHE_DIR, config.CHART_URL_SECRET = original
+    print("✅ 圖表網址設定測試通過")
+
+
+if __name__ == "__main__":
+    test_chart_cache_key_normalization()
+    test_chart_cache_lru_and_disk()
+    test_chart_cache_async_disk_io_off_loop()
+    test_chart_url_signature()
+    test_chart_image_url_requires_disk_cache_and_secret()
@@ -1,6 +1,16 @@
 """測試圖表生成功能"""
 
-from chart_generator import generate_chart_image, create_chart_card_with_image
+from concurrent.futures import ThreadPoolExecutor
+
+from chart_cards import build_chart_card
+from chart_encoder import ChartEncodeOptions
+from chart_generator import (
+    CJK_FONT_FAMILIES,
+    FALLBACK_FONT_FAMILY,
+    configure_fonts,
+    render_chart_image,
+    warm_up,
+)
 
 # 測試數據 - 長條圖
 test_bar_data = {
@@ -45,6 +55,10 @@ test_line_data = {
     ]
 }
 
+def _chart_card(chart_info):
+    return build_chart_card(chart_info, render_chart_image(chart_info).data_uri())
+
+
 def test_chart_generation():
     """測試圖表生成"""
     print("🧪 測試圖表生成功能\n")
@@ -52,7 +66,7 @@ def test_chart_generation():
     # 測試長條圖
     print("1️⃣ 測試長條圖...")
     try:
-        card = create_chart_card_with_image(test_bar_data)
+        card = _chart_card(test_bar_data)
         if card and 'body' in card:
             print("✅ 長條圖生成成功")
             print(f"   卡片包含 {len(card['body'])} 個元素")
@@ -64,7 +78,7 @@ def test_chart_generation():
     # 測試圓餅圖
     print("\n2️⃣ 測試圓餅圖...")
     try:
-        card = create_chart_card_with_image(test_pie_data)
+        card = _chart_card(test_pie_data)
         if card and 'body' in card:
             print("✅ 圓餅圖生成成功")
             print(f"   卡片包含 {len(card['body'])} 個元素")
@@ -76,7 +90,7 @@ def test_chart_generation():
     # 測試折線圖
     print("\n3️⃣ 測試折線圖...")
     try:
-        card = create_chart_card_with_image(test_line_data)
+        card = _chart_card(test_line_data)
         if card and 'body' in card:
             print("✅ 折線圖生成成功")
             print(f"   卡片包含 {len(card['body'])} 個元素")
@@ -96,5 +110,71 @@ def test_chart_generation():
     print("✅ 測試完成！")
     print("="*50)
 
+def test_chart_rendering_is_thread_safe():
+    """測試多執行緒同時繪圖時結果與單執行緒一致（不依賴 pyplot 全域狀態）"""
+    charts = [test_bar_data, test_pie_data, test_line_data]
+    expected = [render_chart_image(chart).data for chart in charts]
+    # 同一執行緒重用圖表範本時輸出不變
+    assert [render_chart_image(chart).data for chart in charts] == expected
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda chart: render_chart_image(chart).data, charts * 4))
+    assert results == expected * 4
+    print("✅ 多執行緒繪圖測試通過")
+
+
+def test_chart_encoding_budget():
+    """測試依位元組預算選擇編碼方式並記錄選用的設定"""
+    full = render_chart_image(test_line_data)
+    image = render_chart_image(test_line_data, ChartEncodeOptions(byte_budget=full.byte_size // 2))
+    assert image.byte_size <= full.byte_size // 2
+    assert image.encoding["within_budget"]
+    assert image.encoding["bytes"] == image.byte_size
+    assert image.encoding["format"] == "png" and image.encoding["dpi"] <= 100
+
+    # 預算不可能達成時仍回傳最小的輸出，且不低於最低 DPI
+    options = ChartEncodeOptions(byte_budget=100, formats=("png", "webp"), min_dpi=72)
+    tiny = render_chart_image(test_line_data, options)
+    assert not tiny.encoding["within_budget"]
+    assert tiny.encoding["dpi"] == 72
+    assert tiny.mime_type in ("image/png", "image/webp")
+    print(f"✅ 圖表編碼預算測試通過（{full.byte_size} → {image.byte_size} bytes）")
+
+
+def test_multi_series_rendering():
+    """測試分組 / 堆疊長條圖與多條折線在同一張圖中繪製"""
+    categories = ['北部', '中部', '南部']
+    series = [{'name': '2023', 'values': [100, 80, None]}, {'name': '2024', 'values': [120, 90, 70]}]
+    base = {
+        'suitable': True,
+        'category_column': '地區',
+        'value_column': '2023',
+        'data_for_chart': [{'category': '北部', 'value': 100}, {'category': '中部', 'value': 80}],
+        'categories': categories,
+        'series': series,
+    }
+    sizes = set()
+    for chart_type, bar_mode in [('bar', 'grouped'), ('bar', 'stacked'), ('line', 'grouped')]:
+        image = render_chart_image(dict(base, chart_type=chart_type, bar_mode=bar_mode))
+        assert image.byte_size > 0
+        sizes.add(image.byte_size)
+    assert len(sizes) == 3
+    print("✅ 多系列圖表繪製測試通過")
+
+
+def test_chart_warm_up():
+    """測試預熱只解析一次字型，並建立各圖表類型的範本"""
+    family = configure_fonts()
+    assert family in CJK_FONT_FAMILIES or family == FALLBACK_FONT_FAMILY
+    assert warm_up() > 0
+    # 字型已解析，再次呼叫（即使指定其他字型檔）不會改變結果
+    assert configure_fonts("/nonexistent/font.ttf") == family
+    print(f"✅ 圖表預熱測試通過（字型: {family}）")
+
+
 if __name__ == "__main__":
     test_chart_generation()
+    test_chart_rendering_is_thread_safe()
+    test_chart_encoding_budget()
+    test_multi_series_rendering()
+    test_chart_warm_up()
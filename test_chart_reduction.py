@@ -0,0 +1,123 @@
+"""測試大型結果的圖表資料縮減（前 N 項 +「其他」與 LTTB 降採樣）"""
+
+import math
+
+import numpy as np
+
+from chart_reduction import OTHER_CATEGORY, lttb_indices, top_n_rows
+from chart_cards import build_chart_card
+from genie_service import _analyze_chart_suitability
+from text_chart import render_text_chart
+
+COLUMNS = {'columns': [
+    {'name': '產品', 'type_text': 'STRING'},
+    {'name': '銷售額', 'type_text': 'BIGINT'},
+]}
+TIME_COLUMNS = {'columns': [
+    {'name': '日期', 'type_text': 'STRING'},
+    {'name': '金額', 'type_text': 'DOUBLE'},
+]}
+
+
+def test_top_n_rows():
+    """測試保留前 N 大類別並將其餘加總為「其他」"""
+    categories = np.array([f"P{i}" for i in range(10)], dtype=object)
+    values = np.array([5, 1, 9, 3, 7, 2, 8, 4, 6, 0], dtype=float)
+    labels, reduced = top_n_rows(categories, values.reshape(-1, 1), 3)
+    assert labels.tolist() == ["P2", "P6", "P4", OTHER_CATEGORY]
+    assert reduced[:, 0].tolist() == [9.0, 8.0, 7.0, 21.0]
+    assert reduced.sum() == values.sum()
+    print("✅ 前 N 項縮減測試通過")
+
+
+def test_lttb_keeps_extremes():
+    """測試 LTTB 保留首尾點與尖峰，輸出點數符合門檻"""
+    values = np.sin(np.linspace(0, 8 * math.pi, 10000))
+    values[5000] = 10.0
+    keep = lttb_indices(values, 100)
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 9999
+    assert 5000 in keep
+    assert np.all(np.diff(keep) > 0)
+    assert len(lttb_indices(values[:50], 100)) == 50
+    print("✅ LTTB 降採樣測試通過")
+
+
+def test_large_results_are_charted():
+    """測試超過 20 筆的結果也會產生縮減後的圖表"""
+    rows = [[f"P{i}", str(i)] for i in range(5000)] + [["壞資料", "n/a"], ["空值", None]]
+    chart_info = _analyze_chart_suitability(COLUMNS, {'data_array': rows}, top_n=10, max_line_points=200)
+    assert chart_info['suitable'] and chart_info['chart_type'] == 'bar'
+    assert len(chart_info['data_for_chart']) == 11
+    assert chart_info['data_for_chart'][0] == {'category': 'P4999', 'value': 4999.0}
+    assert chart_info['reduction'] == {'method': 'top_n', 'original_points': 5000, 'points': 11}
+
+    rows = [[f"2024-01-{i:05d}", str(i % 97)] for i in range(20000)]
+    chart_info = _analyze_chart_suitability(TIME_COLUMNS, {'data_array': rows}, top_n=10, max_line_points=200)
+    assert chart_info['chart_type'] == 'line'
+    assert len(chart_info['data_for_chart']) == 200
+    assert chart_info['reduction']['method'] == 'lttb'
+
+    # 少量資料維持原本的行為（不縮減，可使用圓餅圖）
+    rows = [["A", "10"], ["B", "20"], ["C", "30"]]
+    chart_info = _analyze_chart_suitability(COLUMNS, {'data_array': rows})
+    assert chart_info['chart_type'] == 'pie' and chart_info['reduction'] is None
+    assert chart_info['sample'] is None
+    print("✅ 大型結果圖表測試通過")
+
+
+def test_first_chunk_chart_is_labelled():
+    """測試只取得第一個 chunk 時，圖表說明標示僅依前 N 筆繪製"""
+    rows = [["A", "10"], ["B", "20"], ["C", "30"]]
+    chart_info = _analyze_chart_suitability(COLUMNS, {'data_array': rows}, total_rows=12000)
+    assert chart_info['sample'] == {'rows': 3, 'total_rows': 12000}
+    # 部分資料的占比會失真，不使用圓餅圖
+    assert chart_info['chart_type'] == 'bar'
+
+    note = "⚠️ 圖表僅依前 3 筆資料繪製（共 12,000 筆）"
+    card = build_chart_card(chart_info, "https://example.test/chart.png")
+    assert any(note in item.get('text', '') for item in card['body'])
+    assert render_text_chart(chart_info).endswith(note)
+
+    chart_info = _analyze_chart_suitability(COLUMNS, {'data_array': rows}, total_rows=3)
+    assert chart_info['sample'] is None
+    print("✅ 部分結果圖表說明測試通過")
+
+
+def test_multi_series_analysis():
+    """測試多個數值欄位成為多個系列，長格式資料依字串欄位拆成堆疊系列"""
+    columns = {'columns': [
+        {'name': '地區', 'type_text': 'STRING'},
+        {'name': '銷售額', 'type_text': 'BIGINT'},
+        {'name': '成本', 'type_text': 'DOUBLE'},
+    ]}
+    rows = [[f"R{i}", str(i * 10), str(i * 7)] for i in range(1, 6)]
+    chart_info = _analyze_chart_suitability(columns, {'data_array': rows})
+    assert chart_info['chart_type'] == 'bar' and chart_info['bar_mode'] == 'grouped'
+    assert [item['name'] for item in chart_info['series']] == ['銷售額', '成本']
+    assert chart_info['series'][1]['values'] == [7.0, 14.0, 21.0, 28.0, 35.0]
+    # 相容欄位仍對應第一個系列
+    assert chart_info['value_column'] == '銷售額'
+    assert [point['value'] for point in chart_info['data_for_chart']] == [10.0, 20.0, 30.0, 40.0, 50.0]
+
+    columns = {'columns': [
+        {'name': '月份', 'type_text': 'STRING'},
+        {'name': '產品', 'type_text': 'STRING'},
+        {'name': '銷售額', 'type_text': 'BIGINT'},
+    ]}
+    rows = [[f"2024-{m:02d}", product, str(m * (i + 1))] for m in range(1, 13) for i, product in enumerate("ABC")]
+    rows.remove(["2024-05", "B", "10"])
+    chart_info = _analyze_chart_suitability(columns, {'data_array': rows})
+    assert chart_info['chart_type'] == 'line' and chart_info['series_column'] == '產品'
+    assert [item['name'] for item in chart_info['series']] == ['A', 'B', 'C']
+    assert len(chart_info['categories']) == 12
+    assert chart_info['series'][1]['values'][4] is None
+    print("✅ 多系列圖表分析測試通過")
+
+
+if __name__ == "__main__":
+    test_top_n_rows()
+    test_lttb_keeps_extremes()
+    test_large_results_are_charted()
+    test_first_chunk_chart_is_labelled()
+    test_multi_series_analysis()
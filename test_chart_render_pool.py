@@ -0,0 +1,107 @@
+"""測試圖表繪圖池的佇列上限、逾時與 worker 異常終止後的重建"""
+
+import asyncio
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import chart_render_pool
+from chart_render_pool import THREAD_EXECUTOR, ChartRenderPool
+
+CHART = {"chart_type": "bar", "data": {}}
+
+
+def _image():
+    return SimpleNamespace(encode_ms=1.0, byte_size=100, encoding={}, extension="png")
+
+
+class _BrokenExecutor(Executor):
+    """模擬 worker 已異常終止的行程池"""
+
+    def __init__(self, fail_on_submit):
+        self.fail_on_submit = fail_on_submit
+        self.shut_down = False
+
+    def submit(self, fn, *args, **kwargs):
+        if self.fail_on_submit:
+            raise BrokenProcessPool("worker 已終止")
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker 已終止"))
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_queue_full_and_timeout_keep_pending_until_render_finishes():
+    """測試佇列已滿時略過圖表，逾時後佇列深度在繪圖實際結束時才減少"""
+    release = threading.Event()
+
+    def slow_render(chart_info, submitted_at, encode_options=None):
+        release.wait(5)
+        return _image(), 0.0, 0.01
+
+    async def scenario():
+        pool = ChartRenderPool(max_workers=1, max_queue_depth=1, render_timeout=0.05, executor=THREAD_EXECUTOR)
+        pool._executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            assert await pool.render(CHART) is None
+            stats = pool.stats()
+            assert stats["timeouts"] == 1
+            # worker 仍在繪圖，佇列仍視為已滿
+            assert pool.pending == 1
+            assert await pool.render(CHART) is None
+            assert pool.stats()["saturated"] == 1
+
+            release.set()
+            for _ in range(100):
+                if pool.pending == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert pool.pending == 0
+            result = await pool.render(CHART)
+            assert result is not None and pool.stats()["rendered"] == 1
+        finally:
+            pool.shutdown()
+
+    original = chart_render_pool._render_in_worker
+    chart_render_pool._render_in_worker = slow_render
+    try:
+        asyncio.run(scenario())
+    finally:
+        chart_render_pool._render_in_worker = original
+    print("✅ 繪圖佇列上限與逾時測試通過")
+
+
+def test_broken_pool_is_rebuilt():
+    """測試 worker 異常終止後捨棄行程池，下一張圖表重新建立"""
+
+    async def scenario():
+        pool = ChartRenderPool(max_workers=1, max_queue_depth=4)
+        started = []
+
+        async def fake_start():
+            started.append(True)
+            pool._executor = _BrokenExecutor(fail_on_submit=False)
+
+        pool.start = fake_start
+        for fail_on_submit in (True, False):
+            broken = _BrokenExecutor(fail_on_submit)
+            pool._executor = broken
+            assert await pool.render(CHART) is None
+            assert broken.shut_down and pool._executor is None
+            assert pool.pending == 0
+
+        assert await pool.render(CHART) is None
+        assert started == [True]
+        stats = pool.stats()
+        assert stats["restarts"] == 3 and stats["failures"] == 3
+
+    asyncio.run(scenario())
+    print("✅ 繪圖池重建測試通過")
+
+
+if __name__ == "__main__":
+    test_queue_full_and_timeout_keep_pending_until_render_finishes()
+    test_broken_pool_is_rebuilt()
@@ -0,0 +1,104 @@
+"""測試 JSON 編解碼器（orjson 與標準函式庫）與 /api/messages 的請求本文檢查"""
+
+import asyncio
+import json
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import app
+import json_codec
+
+ACTIVITY = {
+    "type": "message",
+    "id": "act-1",
+    "channelId": "msteams",
+    "text": "本月營收？",
+    "conversation": {"id": "conv-1"},
+    "from": {"id": "user-1"},
+    "recipient": {"id": "bot"},
+    "serviceUrl": "https://example.test",
+}
+
+
+def _codec_variants():
+    """回傳 (名稱, orjson 模組或 None)；未安裝 orjson 時只測試標準函式庫"""
+    variants = [("json", None)]
+    if json_codec.orjson is not None:
+        variants.append(("orjson", json_codec.orjson))
+    else:
+        print("⚠️ 未安裝 orjson，略過 orjson 分支")
+    return variants
+
+
+def _with_codec(orjson_module, func):
+    original = json_codec.orjson
+    json_codec.orjson = orjson_module
+    try:
+        return func()
+    finally:
+        json_codec.orjson = original
+
+
+def test_codec_round_trip():
+    """測試兩種編解碼器的輸入與輸出格式相同，格式錯誤時拋出 ValueError"""
+    data = {"text": "營收", "count": 3, "ratio": 0.5, "items": [None, True], 1: "int key"}
+    expected = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def check():
+        encoded = json_codec.dumps_bytes(data)
+        assert encoded == expected
+        assert "營收".encode("utf-8") in encoded
+        assert json_codec.loads(encoded) == json_codec.loads(encoded.decode("utf-8")) == json.loads(expected)
+        for invalid in (b"{not json", b"", "{\"a\":"):
+            try:
+                json_codec.loads(invalid)
+                raise AssertionError(f"expected ValueError for {invalid!r}")
+            except ValueError:
+                pass
+        response = json_codec.json_response({"ok": True}, status=202, headers={"X-Test": "1"})
+        assert response.status == 202 and response.content_type == "application/json"
+        assert response.charset == "utf-8" and response.headers["X-Test"] == "1"
+        assert response.body == b'{"ok":true}'
+
+    for name, module in _codec_variants():
+        _with_codec(module, check)
+        print(f"✅ JSON 編解碼測試通過（{name}）")
+
+
+def test_messages_rejects_bad_bodies():
+    """測試 /api/messages 對過大（413）、格式錯誤或缺少活動類型（400）與非 JSON（415）的請求"""
+    max_body = 1024
+
+    async def scenario():
+        original_max = app.CONFIG.MAX_REQUEST_BODY_BYTES
+        app.CONFIG.MAX_REQUEST_BODY_BYTES = max_body
+        try:
+            web_app = app.init_func(None)
+        finally:
+            app.CONFIG.MAX_REQUEST_BODY_BYTES = original_max
+        # 不啟動背景資源（Databricks 客戶端與繪圖池），只測試請求本文的處理
+        web_app.on_startup.clear()
+        web_app.on_shutdown.clear()
+        web_app.on_cleanup.clear()
+
+        async with TestClient(TestServer(web_app)) as client:
+            async def post(body, content_type="application/json"):
+                response = await client.post("/api/messages", data=body, headers={"Content-Type": content_type})
+                return response.status
+
+            oversized = dict(ACTIVITY, text="營" * max_body)
+            assert await post(json.dumps(oversized, ensure_ascii=False).encode("utf-8")) == 413
+            assert await post(b"{not json") == 400
+            assert await post(b"") == 400
+            assert await post(b"[1, 2]") == 400
+            assert await post(json.dumps(dict(ACTIVITY, type=None)).encode("utf-8")) == 400
+            assert await post(json.dumps(ACTIVITY).encode("utf-8"), "text/plain") == 415
+
+    for name, module in _codec_variants():
+        _with_codec(module, lambda: asyncio.run(scenario()))
+        print(f"✅ 請求本文檢查測試通過（{name}）")
+
+
+if __name__ == "__main__":
+    test_codec_round_trip()
+    test_messages_rejects_bad_bodies()
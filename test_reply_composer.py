@@ -0,0 +1,70 @@
+"""測試回覆合併與每回合的 Bot Connector 呼叫次數統計"""
+
+import asyncio
+
+from botbuilder.core import TurnContext
+from botbuilder.core.adapters import TestAdapter
+from botbuilder.schema import Activity, ActivityTypes, ChannelAccount, ConversationAccount
+
+from reply_composer import ReplyComposer, ReplyMetrics, parse_channels
+
+
+def _turn_context():
+    adapter = TestAdapter()
+    activity = Activity(
+        type=ActivityTypes.message,
+        id="act-1",
+        text="本月營收？",
+        channel_id="msteams",
+        from_property=ChannelAccount(id="user-1"),
+        recipient=ChannelAccount(id="bot"),
+        conversation=ConversationAccount(id="conv-1"),
+        service_url="https://example.test",
+    )
+    return adapter, TurnContext(adapter, activity)
+
+
+def test_coalesced_reply_uses_one_connector_call():
+    """測試答案與卡片合併為一個活動，並統計回合的呼叫次數與省下的呼叫數"""
+
+    async def scenario():
+        metrics = ReplyMetrics()
+        adapter, turn_context = _turn_context()
+        counter = metrics.track(turn_context)
+
+        composer = ReplyComposer(turn_context, coalesce=True, metrics=metrics)
+        composer.add_text("**👤 user1**\n\n答案")
+        composer.add_card({"type": "AdaptiveCard", "body": [{"type": "TextBlock", "text": "第 1 頁"}]})
+        composer.add_card(None)  # 沒有分頁表格時略過
+        composer.add_card({"type": "AdaptiveCard", "body": [{"type": "TextBlock", "text": "這個回應有幫助嗎？"}]})
+        await composer.flush()
+        await composer.flush()  # 已清空，不會再送出
+        metrics.finish(counter)
+
+        sent = list(adapter.activity_buffer)
+        assert len(sent) == 1
+        assert sent[0].text.endswith("答案") and len(sent[0].attachments) == 2
+        assert sent[0].attachment_layout == "list"
+        assert counter.calls == 1
+
+        adapter, turn_context = _turn_context()
+        counter = metrics.track(turn_context)
+        composer = ReplyComposer(turn_context, coalesce=False, metrics=metrics)
+        composer.add_text("答案")
+        composer.add_card({"type": "AdaptiveCard", "body": []})
+        await composer.flush()
+        metrics.finish(counter)
+        assert len(adapter.activity_buffer) == 2 and counter.calls == 2
+
+        summary = metrics.summary()
+        assert summary["turns"] == 2 and summary["connector_calls"] == 3
+        assert summary["saved_calls"] == 2 and summary["coalesced_replies"] == 1
+        assert summary["avg_calls_per_turn"] == 1.5 and summary["max_calls_per_turn"] == 2
+
+    asyncio.run(scenario())
+    assert parse_channels(" msteams, Emulator ,") == frozenset({"msteams", "emulator"})
+    print("✅ 回覆合併與呼叫次數統計測試通過")
+
+
+if __name__ == "__main__":
+    test_coalesced_reply_uses_one_connector_call()
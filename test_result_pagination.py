@@ -0,0 +1,157 @@
+"""測試查詢結果分頁游標與按需 chunk 讀取"""
+
+import asyncio
+import csv
+import tempfile
+
+from result_export import ExportJob, ExportLimitExceeded, ResultExporter
+from result_pagination import ResultCursorStore, build_result_page_card
+
+
+def _make_answer(total_rows: int, chunk_size: int) -> dict:
+    chunks = [
+        {"chunk_index": idx, "row_offset": offset, "row_count": min(chunk_size, total_rows - offset)}
+        for idx, offset in enumerate(range(0, total_rows, chunk_size))
+    ]
+    return {
+        "columns": {"columns": [
+            {"name": "產品", "type_name": "STRING"},
+            {"name": "銷售額", "type_name": "INT"},
+        ]},
+        "data": {"chunk_index": 0, "data_array": [[f"P{i}", str(i)] for i in range(chunk_size)]},
+        "statement_id": "stmt-1",
+        "total_row_count": total_rows,
+        "chunks": chunks,
+    }
+
+
+def test_result_pagination():
+    """測試分頁跨越 chunk 邊界時只讀取需要的 chunk"""
+    fetched = []
+
+    async def fetch_chunk(statement_id, chunk_index):
+        fetched.append(chunk_index)
+        start = chunk_index * 50
+        return {"data_array": [[f"P{i}", str(i)] for i in range(start, min(start + 50, 120))]}
+
+    async def run():
+        store = ResultCursorStore(ttl_seconds=60)
+        cursor = await store.create("user-1", _make_answer(120, 50), page_size=20)
+        assert cursor.page_count == 6
+
+        first_page, _ = await store.get_page_rows(cursor, 0, fetch_chunk)
+        assert [row[0] for row in first_page] == [f"P{i}" for i in range(20)]
+        assert fetched == []
+
+        # 第 3 頁（第 40-59 筆）跨越 chunk 0 與 chunk 1
+        third_page, _ = await store.get_page_rows(cursor, 2, fetch_chunk)
+        assert [row[0] for row in third_page] == [f"P{i}" for i in range(40, 60)]
+        assert fetched == [1]
+
+        last_page, page = await store.get_page_rows(cursor, 99, fetch_chunk)
+        assert page == 5
+        assert len(last_page) == 20
+        assert fetched == [1, 2]
+
+        card = build_result_page_card(cursor, last_page, page)
+        assert [action["data"]["page"] for action in card["actions"]] == [4]
+
+        # 同一個游標的並行翻頁各自使用自己的頁碼
+        (rows_a, page_a), (rows_b, page_b) = await asyncio.gather(
+            store.get_page_rows(cursor, 1, fetch_chunk), store.get_page_rows(cursor, 3, fetch_chunk)
+        )
+        card_a = build_result_page_card(cursor, rows_a, page_a)
+        card_b = build_result_page_card(cursor, rows_b, page_b)
+        assert card_a["body"][1]["text"].startswith("第 2 / 6 頁 · 第 21-40 筆")
+        assert card_b["body"][1]["text"].startswith("第 4 / 6 頁 · 第 61-80 筆")
+        assert not hasattr(cursor, "page")
+        assert await store.get(cursor.cursor_id) is cursor
+
+    asyncio.run(run())
+    print("✅ 分頁游標測試通過")
+
+
+def test_result_export_streams_all_chunks():
+    """測試完整結果逐 chunk 匯出為 CSV，且每位使用者受並發上限限制"""
+    async def fetch_chunk(statement_id, chunk_index):
+        await asyncio.sleep(0)
+        start = chunk_index * 50
+        return {"data_array": [[f"P{i}", str(i)] for i in range(start, min(start + 50, 120))]}
+
+    async def run():
+        store = ResultCursorStore(ttl_seconds=60)
+        cursor = await store.create("user-1", _make_answer(120, 50), page_size=20)
+        progress = []
+
+        async def on_progress(job):
+            progress.append(job.rows_written)
+
+        with tempfile.TemporaryDirectory() as export_dir:
+            exporter = ResultExporter(export_dir=export_dir, max_concurrent_per_user=1, cursor_store=store)
+            job = exporter.start_export("user-1", cursor, "csv", fetch_chunk, on_progress=on_progress)
+            try:
+                exporter.start_export("user-1", cursor, "csv", fetch_chunk)
+                raise AssertionError("expected ExportLimitExceeded")
+            except ExportLimitExceeded:
+                pass
+
+            while job.status == ExportJob.RUNNING:
+                await asyncio.sleep(0.01)
+
+            assert job.status == ExportJob.COMPLETED
+            assert progress == [50, 100, 120]
+            with open(job.path, encoding="utf-8-sig", newline="") as f:
+                rows = list(csv.reader(f))
+            assert rows[0] == ["產品", "銷售額"]
+            assert len(rows) == 121
+            assert rows[-1] == ["P119", "119"]
+            assert await exporter.get_job(job.job_id, "wrong-token") is None
+            assert await exporter.get_job(job.job_id, job.token) is job
+
+    asyncio.run(run())
+    print("✅ 結果匯出測試通過")
+
+
+def test_cancelled_export_releases_slot_and_file():
+    """測試取消匯出時刪除不完整的檔案並釋放使用者名額，過期檔案由定期清除移除"""
+    release = asyncio.Event()
+
+    async def fetch_chunk(statement_id, chunk_index):
+        if chunk_index == 1:
+            await release.wait()
+        start = chunk_index * 50
+        return {"data_array": [[f"P{i}", str(i)] for i in range(start, min(start + 50, 120))]}
+
+    async def run():
+        store = ResultCursorStore(ttl_seconds=60)
+        cursor = await store.create("user-1", _make_answer(120, 50), page_size=20)
+        with tempfile.TemporaryDirectory() as export_dir:
+            exporter = ResultExporter(export_dir=export_dir, cursor_store=store)
+            job = exporter.start_export("user-1", cursor, "csv", fetch_chunk)
+            while job.rows_written == 0:
+                await asyncio.sleep(0.01)
+            assert job.path.exists()
+
+            await exporter.close()
+            assert job.status == ExportJob.FAILED
+            assert not job.path.exists()
+            assert exporter.active_jobs("user-1") == 0
+
+            release.set()
+            job = exporter.start_export("user-1", cursor, "csv", fetch_chunk)
+            while job.status == ExportJob.RUNNING:
+                await asyncio.sleep(0.01)
+            assert job.status == ExportJob.COMPLETED
+            assert exporter.stats()["entries"] == 2
+            exporter.ttl_seconds = -1
+            assert exporter.sweep() == 2
+            assert not job.path.exists() and exporter.stats()["entries"] == 0
+
+    asyncio.run(run())
+    print("✅ 匯出取消與過期清除測試通過")
+
+
+if __name__ == "__main__":
+    test_result_pagination()
+    test_result_export_streams_all_chunks()
+    test_cancelled_export_releases_slot_and_file()
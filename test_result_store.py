@@ -0,0 +1,119 @@
+"""測試分層壓縮結果儲存區"""
+
+import os
+import tempfile
+from pathlib import Path
+
+from result_store import ResultStore
+
+
+def _rows(seed: int):
+    return [[f"產品{j}", j * seed, None if j % 7 == 0 else j / 3] for j in range(200)]
+
+
+def test_result_store_tiers():
+    """測試記憶體預算溢出、磁碟預算淘汰與統計資料"""
+    with tempfile.TemporaryDirectory() as spill_dir:
+        store = ResultStore(memory_budget_bytes=4000, disk_budget_bytes=8000, spill_dir=spill_dir)
+        for i in range(20):
+            store.put(f"chunk:{i}", _rows(i))
+
+        stats = store.stats()
+        assert stats["memory_bytes"] <= 4000
+        assert stats["disk_bytes"] <= 8000
+        assert stats["spills"] > 0 and stats["evictions"] > 0
+        assert stats["compression_ratio"] > 1
+
+        # 最新的區塊在記憶體中，較舊的在磁碟上，最舊的已被淘汰
+        assert store.get("chunk:19") == _rows(19)
+        disk_keys = [f"chunk:{i}" for i in range(20) if f"chunk:{i}" in store][:1]
+        assert store.get(disk_keys[0]) == _rows(int(disk_keys[0].split(":")[1]))
+        assert store.get("chunk:0") is None
+
+        stats = store.stats()
+        assert stats["memory_hits"] == 1
+        assert stats["disk_hits"] == 1
+        assert stats["misses"] == 1
+
+        store.close()
+        assert len(store) == 0
+    print("✅ 結果儲存區測試通過")
+
+
+def test_missing_spill_file_is_a_miss():
+    """測試每個行程使用獨立的溢出目錄，溢出檔案遺失時視為未命中而不拋出例外"""
+    with tempfile.TemporaryDirectory() as spill_dir:
+        store = ResultStore(memory_budget_bytes=4000, disk_budget_bytes=1_000_000, spill_dir=spill_dir)
+        assert store.spill_dir == Path(spill_dir) / str(os.getpid())
+        for i in range(5):
+            store.put(f"chunk:{i}", _rows(i))
+        assert store.stats()["disk_entries"] > 0
+
+        for path in store.spill_dir.iterdir():
+            path.unlink()
+        assert store.get("chunk:0") is None
+        assert "chunk:0" not in store
+        assert store.stats()["misses"] == 1
+
+        store.close()
+        assert not store.spill_dir.exists()
+    print("✅ 溢出檔案遺失測試通過")
+
+
+def test_disk_hits_are_promoted_and_spills_written_outside_lock():
+    """測試記憶體有空間時磁碟層命中移回記憶體，寫檔期間被刪除的區塊不留下溢出檔案"""
+    with tempfile.TemporaryDirectory() as spill_dir:
+        store = ResultStore(memory_budget_bytes=4000, disk_budget_bytes=1_000_000, spill_dir=spill_dir)
+        for i in range(5):
+            store.put(f"chunk:{i}", _rows(i))
+        assert store.stats()["disk_entries"] > 0
+
+        # 記憶體已滿時磁碟層命中留在磁碟
+        store.memory_budget_bytes = store.stats()["memory_bytes"]
+        assert store.get("chunk:0") == _rows(0)
+        assert store.stats()["promotions"] == 0
+
+        store.memory_budget_bytes = 1_000_000
+        assert store.get("chunk:0") == _rows(0)
+        stats = store.stats()
+        assert stats["promotions"] == 1 and stats["disk_hits"] == 2
+        assert store._entries["chunk:0"].tier == "memory"
+        assert store.get("chunk:0") == _rows(0)
+        assert store.stats()["memory_hits"] == 1
+
+        # 溢出檔案在鎖外讀取；讀取期間區塊被刪除時仍回傳已讀到的資料
+        disk_key = next(key for key, entry in store._entries.items() if entry.tier == "disk")
+        read_spilled = store._read_spilled
+
+        def read_and_discard(path):
+            assert not store._lock.locked()
+            data = read_spilled(path)
+            store.discard(disk_key)
+            return data
+
+        store.memory_budget_bytes = store.stats()["memory_bytes"]
+        store._read_spilled = read_and_discard
+        assert store.get(disk_key) == _rows(int(disk_key.split(":")[1]))
+        del store._read_spilled
+        assert disk_key not in store and store.stats()["promotions"] == 1
+
+        # 選為溢出對象後、寫入完成前區塊被取代：寫入的檔案隨即刪除
+        store.memory_budget_bytes = 0
+        with store._lock:
+            spills = store._select_spills_locked()
+        assert spills
+        for entry, _ in spills:
+            store.discard(entry.key)
+        store._write_spills(spills)
+        assert not any(path.exists() for _, path in spills)
+        assert store.stats()["memory_bytes"] == 0
+
+        store.close()
+        assert not store.spill_dir.exists()
+    print("✅ 磁碟層提升與鎖外溢出測試通過")
+
+
+if __name__ == "__main__":
+    test_result_store_tiers()
+    test_missing_spill_file_is_a_miss()
+    test_disk_hits_are_promoted_and_spills_written_outside_lock()
@@ -0,0 +1,70 @@
+"""測試工作階段的 SQLite 持久化、write-behind 批次寫入與重新啟動後的還原"""
+
+import tempfile
+import time
+from pathlib import Path
+
+from session_persistence import SessionPersister, SQLiteSessionBackend
+from session_store import SessionStore
+from user_session import UserSession
+
+DAY = 24 * 3600
+
+
+def _session(index: int, idle_seconds: float = 0.0) -> UserSession:
+    session = UserSession(f"user-{index}", f"user{index}@example.com", f"使用者{index}")
+    session.conversation_id = f"conv-{index}"
+    session.last_activity = time.time() - idle_seconds
+    session.user_context.last_question = "本月營收？"
+    session.user_context.query_count = index
+    return session
+
+
+def test_write_behind_and_restore():
+    """測試批次寫入、合併重複變更，並在新的程序中還原工作階段"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "sessions.db")
+        persister = SessionPersister(SQLiteSessionBackend(path))
+        sessions = [_session(index, idle_seconds=index * 60) for index in range(5)]
+        for session in sessions:
+            persister.mark_dirty(session)
+        # 同一個工作階段在兩次寫入之間多次變更只寫入一次
+        sessions[0].conversation_id = "conv-updated"
+        persister.mark_dirty(sessions[0])
+        persister.mark_deleted("user-4")
+        assert persister.flush() == 5
+        assert persister.flush() == 0
+        persister.backend.close()
+
+        # 模擬重新啟動：以新的後端與空的儲存區還原
+        restarted = SessionPersister(SQLiteSessionBackend(path))
+        user_sessions = SessionStore("user_sessions", DAY, 100)
+        email_sessions = SessionStore("email_sessions", DAY, 100)
+        assert restarted.restore(user_sessions, email_sessions) == 4
+        # 依最後活動時間由舊到新排列（LRU 順序）
+        assert list(user_sessions) == ["user-3", "user-2", "user-1", "user-0"]
+        restored = user_sessions["user-0"]
+        assert restored.conversation_id == "conv-updated"
+        assert restored.name == "使用者0"
+        assert restored.user_context.last_question == "本月營收？"
+        assert user_sessions["user-2"].user_context.query_count == 2
+        assert email_sessions["user1@example.com"] is user_sessions["user-1"]
+        assert abs(restored.last_activity - sessions[0].last_activity) < 1e-3
+        restarted.backend.close()
+    print("✅ write-behind 寫入與還原測試通過")
+
+
+def test_expired_sessions_are_not_restored():
+    """測試閒置超過 TTL 的工作階段不會被還原，且會從資料庫中清除"""
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteSessionBackend(str(Path(tmp) / "sessions.db"))
+        backend.save_many([_session(1), _session(2, idle_seconds=2 * DAY)])
+        assert [session.user_id for session in backend.load_all(DAY)] == ["user-1"]
+        assert len(backend.load_all(10 * DAY)) == 1
+        backend.close()
+    print("✅ 過期工作階段清除測試通過")
+
+
+if __name__ == "__main__":
+    test_write_behind_and_restore()
+    test_expired_sessions_are_not_restored()
@@ -0,0 +1,113 @@
+"""測試具 TTL 與筆數上限的工作階段儲存區，以及模擬一週流量的記憶體穩定性"""
+
+import tracemalloc
+
+from session_store import SessionStore, SessionSweeper
+from user_session import UserSession
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_and_lru():
+    """測試閒置 TTL、存取續期與超出上限時的 LRU 淘汰"""
+    clock = FakeClock()
+    evicted = []
+    store = SessionStore("test", ttl_seconds=10, max_entries=3, clock=clock,
+                         on_evict=lambda key, value: evicted.append(key))
+    store["a"] = 1
+    store["b"] = 2
+    clock.now = 8
+    assert store["a"] == 1  # 存取後重新計算閒置時間
+    clock.now = 15
+    assert "a" in store and "b" not in store
+    assert store.get("b") is None
+    assert evicted == ["b"]
+
+    store["c"] = 3
+    store["d"] = 4
+    store["e"] = 5  # 超過 3 筆，淘汰最久未使用的 a
+    assert list(store) == ["c", "d", "e"]
+    assert evicted == ["b", "a"]
+
+    store["e"] = 5  # 寫入相同的值不呼叫 on_evict
+    store["e"] = 6  # 以不同的值取代時呼叫 on_evict
+    assert evicted == ["b", "a", "e"] and store["e"] == 6
+
+    clock.now = 30
+    assert store.sweep() == 3 and len(store) == 0
+    stats = store.stats()
+    assert stats["expired"] == 4 and stats["evicted"] == 1
+    print("✅ TTL 與 LRU 測試通過")
+
+
+def test_replaced_session_clears_email_index():
+    """測試以另一個工作階段取代時呼叫 on_evict，電子郵件索引不保留舊的電子郵件"""
+    import app
+
+    bot = app.BOT
+    old = UserSession("user-replace", "old@example.com")
+    new = UserSession("user-replace", "new@example.com")
+    bot.user_sessions["user-replace"] = old
+    bot.email_sessions["old@example.com"] = old
+    bot.user_sessions["user-replace"] = old  # 寫入相同的值不視為取代
+    assert bot.email_sessions.get("old@example.com") is old
+
+    bot.user_sessions["user-replace"] = new
+    bot.email_sessions["new@example.com"] = new
+    assert "old@example.com" not in bot.email_sessions
+    assert bot.email_sessions["new@example.com"] is new
+    del bot.user_sessions["user-replace"]
+    assert "new@example.com" not in bot.email_sessions
+    print("✅ 取代工作階段時清除電子郵件索引測試通過")
+
+
+def test_soak_simulated_week():
+    """模擬一週的使用者流量：筆數與記憶體用量在穩定後維持平坦"""
+    clock = FakeClock()
+    sessions = SessionStore("user_sessions", ttl_seconds=4 * 3600, max_entries=5000, clock=clock)
+    emails = SessionStore("email_sessions", ttl_seconds=4 * 3600, max_entries=5000, clock=clock)
+    sweeper = SessionSweeper([sessions, emails])
+
+    users_per_hour = 150
+    samples = {}
+    tracemalloc.start()
+    try:
+        for hour in range(7 * 24):
+            for index in range(users_per_hour):
+                # 約三成為近期活躍的回訪使用者，其餘為新使用者
+                if index % 3 == 0 and hour > 0:
+                    user_id = f"user-{hour - 1}-{index}"
+                else:
+                    user_id = f"user-{hour}-{index}"
+                session = sessions.get(user_id)
+                if session is None:
+                    session = UserSession(user_id, f"{user_id}@example.com")
+                    session.user_context.last_question = "本月營收？"
+                    sessions[user_id] = session
+                    emails[session.email] = session
+                clock.now += 3600 / users_per_hour
+            # 每小時清除一次（正式環境預設為 5 分鐘）
+            sweeper.sweep()
+            if hour in (48, 7 * 24 - 1):
+                samples[hour] = (len(sessions), tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+
+    (day2_entries, day2_bytes), (day7_entries, day7_bytes) = samples[48], samples[7 * 24 - 1]
+    assert day2_entries <= users_per_hour * 5 and day7_entries <= users_per_hour * 5
+    assert abs(day7_entries - day2_entries) <= users_per_hour * 0.1
+    assert day7_bytes < day2_bytes * 1.1, (day2_bytes, day7_bytes)
+    assert sessions.stats()["estimated_bytes"] > 0
+    print(f"✅ 一週模擬測試通過（第 2 天 {day2_bytes} bytes，第 7 天 {day7_bytes} bytes）")
+
+
+if __name__ == "__main__":
+    test_ttl_and_lru()
+    test_replaced_session_clears_email_index()
+    test_soak_simulated_week()
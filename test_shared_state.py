@@ -0,0 +1,165 @@
+"""測試多工作行程模式的跨行程共用狀態（以兩個獨立連線模擬兩個行程）"""
+
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from result_export import ExportJob, ResultExporter
+from result_pagination import ResultCursorStore
+from session_persistence import SessionPersister, SQLiteSessionBackend
+from session_store import SessionStore
+from shared_state import SharedMapping, SharedStateDB
+from user_session import UserSession
+
+DAY = 24 * 3600
+
+
+def test_shared_mapping_across_connections():
+    """測試一個行程寫入的資料可由另一個行程讀取，並依 TTL 與筆數上限清除"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "shared.db")
+        worker_a = SharedMapping(SharedStateDB(path), "pending_email_input", ttl_seconds=60)
+        worker_b = SharedMapping(SharedStateDB(path), "pending_email_input", ttl_seconds=60)
+        feedback_b = SharedMapping(worker_b.db, "message_feedback", ttl_seconds=60)
+
+        worker_a["user-1"] = True
+        worker_a["user-2"] = {"feedback": "positive", "conversation_id": "conv-1"}
+        assert "user-1" in worker_b
+        assert worker_b["user-2"]["conversation_id"] == "conv-1"
+        # 命名空間互不影響
+        assert "user-1" not in feedback_b
+        del worker_b["user-1"]
+        assert "user-1" not in worker_a
+        assert sorted(worker_a) == ["user-2"]
+
+        expired = SharedMapping(worker_a.db, "pending_email_input", ttl_seconds=-1)
+        expired["user-3"] = True
+        assert "user-3" not in worker_b
+        assert worker_b.sweep() == 1
+
+        bounded = SharedMapping(worker_a.db, "result_cursors", ttl_seconds=60, max_entries=2)
+        for index in range(4):
+            bounded[f"cursor-{index}"] = {"index": index}
+            time.sleep(0.001)
+        assert bounded.sweep() == 2
+        assert sorted(bounded) == ["cursor-2", "cursor-3"]
+        assert bounded.stats()["entries"] == 2
+    print("✅ 跨行程共用字典測試通過")
+
+
+def test_sessions_and_cursors_follow_user_across_workers():
+    """測試使用者的下一個回合與下一頁由另一個行程處理時能取得最新狀態"""
+    with tempfile.TemporaryDirectory() as tmp:
+        session_db = str(Path(tmp) / "sessions.db")
+        workers = []
+        for _ in range(2):
+            sessions = SessionStore("user_sessions", DAY, 100)
+            emails = SessionStore("email_sessions", DAY, 100)
+            persister = SessionPersister(SQLiteSessionBackend(session_db), write_through=True)
+            workers.append((sessions, emails, persister))
+        (sessions_a, emails_a, persister_a), (sessions_b, emails_b, persister_b) = workers
+
+        async def written(persister):
+            # write_through 的寫入由背景工作在執行緒中完成
+            while persister.stats()["pending"] or persister._writing:
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            for _, _, persister in workers:
+                persister.start()
+            session = UserSession("user-1", "user1@example.com")
+            session.conversation_id = "conv-1"
+            sessions_a["user-1"] = session
+            persister_a.mark_dirty(session)
+            await written(persister_a)
+            await persister_b.sync("user-1", sessions_b, emails_b)
+            assert sessions_b["user-1"].conversation_id == "conv-1"
+
+            # 行程 B 處理下一個回合後，行程 A 在下一次回合開始時讀到新的狀態
+            sessions_b["user-1"].conversation_id = "conv-2"
+            persister_b.mark_dirty(sessions_b["user-1"])
+            # 尚未寫入的本機變更不會被資料庫中的舊版本覆寫
+            await persister_b.sync("user-1", sessions_b, emails_b)
+            assert sessions_b["user-1"].conversation_id == "conv-2"
+            await written(persister_b)
+            await persister_a.sync("user-1", sessions_a, emails_a)
+            assert sessions_a["user-1"].conversation_id == "conv-2"
+            assert emails_a["user1@example.com"] is sessions_a["user-1"]
+
+            # 在行程 A 登出後，行程 B 不再保留舊的工作階段
+            persister_a.mark_deleted("user-1")
+            await written(persister_a)
+            await persister_b.sync("user-1", sessions_b, emails_b)
+            assert "user-1" not in sessions_b
+            for _, _, persister in workers:
+                await persister.close()
+
+        asyncio.run(scenario())
+
+        shared = SharedMapping(SharedStateDB(str(Path(tmp) / "shared.db")), "result_cursors", ttl_seconds=60)
+        cursors_a = ResultCursorStore(shared=shared)
+        cursors_b = ResultCursorStore(shared=shared)
+        answer = {
+            "statement_id": "stmt-1",
+            "columns": {"columns": [{"name": "id", "type_name": "INT"}]},
+            "data": {"data_array": [[1], [2]], "chunk_index": 0},
+            "chunks": [{"chunk_index": 0, "row_offset": 0, "row_count": 2}],
+            "total_row_count": 2,
+        }
+        cursor = asyncio.run(cursors_a.create("user-1", answer, page_size=1))
+        rebuilt = asyncio.run(cursors_b.get(cursor.cursor_id))
+        assert rebuilt.statement_id == "stmt-1"
+        assert rebuilt.page_count == 2
+        assert asyncio.run(cursors_b.get("missing")) is None
+
+    print("✅ 跨行程工作階段與分頁游標測試通過")
+
+
+def test_export_download_from_another_worker():
+    """測試匯出由一個行程完成後，下載請求由另一個行程處理時也能取得檔案"""
+
+    async def fetch_chunk(statement_id, chunk_index):
+        return {"data_array": [[chunk_index]]}
+
+    async def scenario(tmp):
+        export_dir = str(Path(tmp) / "exports")
+        workers = [
+            ResultExporter(
+                export_dir=export_dir,
+                shared=SharedMapping(SharedStateDB(str(Path(tmp) / "shared.db")), "export_jobs", ttl_seconds=60),
+            )
+            for _ in range(2)
+        ]
+        cursors = ResultCursorStore()
+        answer = {
+            "statement_id": "stmt-1",
+            "columns": {"columns": [{"name": "id", "type_name": "INT"}]},
+            "data": {"data_array": [[0]], "chunk_index": 0},
+            "chunks": [{"chunk_index": 0, "row_offset": 0, "row_count": 1}],
+            "total_row_count": 1,
+        }
+        cursor = await cursors.create("user-1", answer, page_size=1)
+        job = workers[0].start_export("user-1", cursor, "csv", fetch_chunk)
+        # 執行中的工作尚未公開給其他行程
+        assert await workers[1].get_job(job.job_id, job.token) is None
+        while job.status == ExportJob.RUNNING:
+            await asyncio.sleep(0.01)
+
+        rebuilt = await workers[1].get_job(job.job_id, job.token)
+        assert rebuilt.status == ExportJob.COMPLETED and rebuilt.path == job.path and rebuilt.path.exists()
+        assert rebuilt.filename == job.filename and rebuilt.content_type == job.content_type
+        assert rebuilt.bytes_written == job.bytes_written
+        assert await workers[1].get_job(job.job_id, "wrong-token") is None
+        for worker in workers:
+            worker.shared.db.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(tmp))
+    print("✅ 跨行程匯出下載測試通過")
+
+
+if __name__ == "__main__":
+    test_shared_mapping_across_connections()
+    test_sessions_and_cursors_follow_user_across_workers()
+    test_export_download_from_another_worker()
@@ -0,0 +1,88 @@
+"""測試 Unicode 文字圖表與繪圖池過載判斷"""
+
+from chart_render_pool import ChartRenderPool
+from text_chart import SPARKLINE_WIDTH, bar, render_text_chart, resample, sparkline
+
+BAR_CHART = {
+    'chart_type': 'bar',
+    'category_column': '產品',
+    'value_column': '銷售額',
+    'data_for_chart': [
+        {'category': '產品A', 'value': 1000},
+        {'category': '產品B', 'value': 2000},
+        {'category': '產品C', 'value': None},
+    ],
+}
+
+
+def test_bar_and_sparkline():
+    """測試 1/8 精度長條與 sparkline"""
+    assert bar(2000, 2000, width=4) == "████"
+    assert bar(1000, 2000, width=3) == "█▌"
+    assert bar(None, 2000) == "" and bar(-5, 2000) == ""
+    assert sparkline([0, 7, None, 3.5]) == "▁█ ▄"
+    assert sparkline([5, 5]) == "▅▅"
+    print("✅ 長條與 sparkline 測試通過")
+
+
+def test_render_text_chart():
+    """測試由 chart_info 產生可嵌入 Markdown 的文字圖表"""
+    text = render_text_chart(BAR_CHART, width=10)
+    assert text.startswith("**📊 產品 vs 銷售額**")
+    assert "```" in text
+    assert "產品B │██████████ 2,000" in text
+    assert "產品C │ —" in text
+
+    pie = dict(BAR_CHART, chart_type='pie', data_for_chart=BAR_CHART['data_for_chart'][:2])
+    assert "(66.7%)" in render_text_chart(pie)
+
+    line = {
+        'chart_type': 'line',
+        'category_column': '月份',
+        'value_column': '營收',
+        'categories': ['1月', '2月', '3月'],
+        'series': [{'name': 'A', 'values': [1, 2, 3]}, {'name': 'B', 'values': [3, None, 1]}],
+        'series_column': '產品',
+    }
+    text = render_text_chart(line)
+    assert "1月 → 3月（3 點）" in text
+    assert "A ▁▄█ 最小 1 · 最大 3 · 最新 3" in text
+    assert "B █ ▁" in text
+
+    # 點數較多的序列重新取樣到固定寬度
+    long_line = dict(line, categories=[str(day) for day in range(200)], series=[{'name': 'A', 'values': list(range(200))}])
+    spark = render_text_chart(long_line).split("\n")[4].split(" ")[1]
+    assert len(spark) == SPARKLINE_WIDTH and spark[0] == "▁" and spark[-1] == "█"
+    assert "最大 199 · 最新 199" in render_text_chart(long_line)
+    assert resample([1, None, None, None, 3, 5], 3) == [1, None, 4]
+
+    # 前 N 項縮減後的「其他」列不會被列數上限截掉
+    top_n = dict(
+        BAR_CHART,
+        data_for_chart=[{'category': f'產品{i}', 'value': 100 - i} for i in range(20)] + [{'category': '其他', 'value': 500}],
+        reduction={'method': 'top_n', 'original_points': 40, 'points': 21},
+    )
+    rows = render_text_chart(top_n, max_rows=5).split("\n")
+    assert rows[-3].startswith("其他") and rows[-2] == "…（另有 16 項未顯示）"
+    assert "產品3" in rows[-4] and "產品4" not in "\n".join(rows)
+    print("✅ 文字圖表測試通過")
+
+
+def test_pool_overload_estimate():
+    """測試以佇列深度與平均繪圖耗時估計等待時間"""
+    pool = ChartRenderPool(max_workers=2, max_queue_depth=8)
+    pool._render_ms.extend([400, 600])
+    assert pool.estimated_wait_ms() == 0.0
+    pool._pending = 5
+    # 新工作前有 4 張圖需由 2 個 worker 消化：2 輪 × 500ms
+    assert pool.estimated_wait_ms() == 1000.0
+    assert pool.is_overloaded(800) and not pool.is_overloaded(1500)
+    pool._pending = 8
+    assert pool.is_overloaded(10_000)
+    print("✅ 繪圖池過載判斷測試通過")
+
+
+if __name__ == "__main__":
+    test_bar_and_sparkline()
+    test_render_text_chart()
+    test_pool_overload_estimate()
@@ -0,0 +1,46 @@
+"""測試背景回合佇列（佇列上限、失敗統計與關閉時的排空）"""
+
+import asyncio
+
+from turn_queue import TurnQueue
+
+
+def test_bounded_queue_and_graceful_drain():
+    """測試佇列滿載時拒絕新的回合，關閉時處理完已排隊的回合後才停止"""
+
+    async def scenario():
+        processed = []
+
+        async def process(item, received_at):
+            await asyncio.sleep(0.05)
+            if item == "bad":
+                raise RuntimeError("boom")
+            processed.append(item)
+
+        queue = TurnQueue(process, workers=1, max_depth=2)
+        assert queue.submit("early") is False  # 尚未啟動
+        queue.start()
+
+        assert queue.submit("a") is True
+        await asyncio.sleep(0)  # 工作者取出 a
+        assert queue.submit("bad") is True
+        assert queue.submit("b") is True
+        assert queue.submit("overflow") is False
+        assert queue.stats()["depth"] == 2 and queue.stats()["in_flight"] == 1
+
+        await queue.drain(timeout=5)
+        assert processed == ["a", "b"]
+        assert queue.submit("late") is False
+
+        stats = queue.stats()
+        assert stats["accepted"] == 3 and stats["rejected"] == 3
+        assert stats["completed"] == 2 and stats["failed"] == 1
+        assert stats["depth"] == 0 and stats["in_flight"] == 0
+        assert stats["max_queue_wait_ms"] >= 50
+
+    asyncio.run(scenario())
+    print("✅ 背景回合佇列測試通過")
+
+
+if __name__ == "__main__":
+    test_bounded_queue_and_graceful_drain()
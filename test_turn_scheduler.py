@@ -0,0 +1,123 @@
+"""測試每位使用者的 Genie 問題排程（排隊、取代與端到端取消）"""
+
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from config import DefaultConfig
+from genie_service import GenieService
+from turn_scheduler import QUEUE_MODE, SUPERSEDE_MODE, TurnScheduler
+
+
+async def _turn(log, name, seconds, scheduler=None, key="user-1"):
+    log.append(f"{name}:start")
+    await asyncio.sleep(seconds)
+    if scheduler is not None:
+        scheduler.mark_answered(key)
+        await asyncio.sleep(seconds)
+    log.append(f"{name}:end")
+    return name
+
+
+def test_supersede_cancels_earlier_question():
+    """測試新問題取代尚未得到答案的問題，並通知被取代的回合"""
+
+    async def scenario():
+        scheduler = TurnScheduler(SUPERSEDE_MODE)
+        log, notified = [], []
+
+        async def notify(name):
+            notified.append(name)
+
+        first = asyncio.create_task(
+            scheduler.run("user-1", lambda: _turn(log, "A", 1.0), on_superseded=lambda: notify("A"))
+        )
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(
+            scheduler.run("user-1", lambda: _turn(log, "B", 1.0), on_superseded=lambda: notify("B"))
+        )
+        # C 與 B 同時到達：B 仍在等待 A 結束時就被取代
+        third = asyncio.create_task(
+            scheduler.run("user-1", lambda: _turn(log, "C", 0.01), on_superseded=lambda: notify("C"))
+        )
+        # 其他使用者不受影響
+        other = asyncio.create_task(scheduler.run("user-2", lambda: _turn(log, "X", 0.01)))
+        results = await asyncio.gather(first, second, third, other)
+
+        assert results == [None, None, "C", "X"]
+        assert notified == ["A", "B"]
+        # A 被取消，B 在開始前就被取代，不會送出第二個 Genie 問題
+        assert "A:end" not in log and "B:start" not in log
+        stats = scheduler.stats()
+        assert stats["superseded"] == 2 and stats["active_users"] == 0
+
+    asyncio.run(scenario())
+    print("✅ 新問題取代先前問題測試通過")
+
+
+def test_queue_mode_and_answered_turns():
+    """測試排隊模式依序執行，且已取得答案的回合不會被取消"""
+
+    async def scenario():
+        log = []
+        scheduler = TurnScheduler(QUEUE_MODE)
+        await asyncio.gather(
+            scheduler.run("user-1", lambda: _turn(log, "A", 0.05)),
+            scheduler.run("user-1", lambda: _turn(log, "B", 0.01)),
+        )
+        assert log == ["A:start", "A:end", "B:start", "B:end"]
+        assert scheduler.stats()["queued"] == 1
+
+        log.clear()
+        scheduler = TurnScheduler(SUPERSEDE_MODE)
+        first = asyncio.create_task(scheduler.run("user-1", lambda: _turn(log, "A", 0.05, scheduler)))
+        await asyncio.sleep(0.08)  # A 已取得答案，正在送出回覆
+        await asyncio.gather(first, scheduler.run("user-1", lambda: _turn(log, "B", 0.01)))
+        assert log == ["A:start", "A:end", "B:start", "B:end"]
+        assert scheduler.stats()["superseded"] == 0
+
+    asyncio.run(scenario())
+    print("✅ 排隊模式與已回答回合測試通過")
+
+
+class _FakeGenieAPI:
+    """第一次輪詢後訊息仍在執行查詢"""
+
+    def start_conversation(self, space_id, content):
+        return SimpleNamespace(conversation_id="conv-1", message_id="msg-1")
+
+    def get_message(self, space_id, conversation_id, message_id):
+        return SimpleNamespace(status="EXECUTING_QUERY", query_result=SimpleNamespace(statement_id="stmt-1"))
+
+
+def test_cancelled_question_stops_polling_and_query():
+    """測試回合被取消時 GenieService 停止輪詢並取消 SQL 查詢"""
+    cancelled = threading.Event()
+    client = SimpleNamespace(
+        statement_execution=SimpleNamespace(cancel_execution=lambda statement_id: cancelled.set())
+    )
+    service = GenieService(DefaultConfig(), workspace_client=client)
+    service._genie = _FakeGenieAPI()
+    session = SimpleNamespace(email="user@example.com")
+
+    async def scenario():
+        task = asyncio.create_task(service.ask("本月營收？", "space", session))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError("ask should propagate cancellation")
+        await asyncio.get_running_loop().run_in_executor(None, cancelled.wait, 5)
+
+    asyncio.run(scenario())
+    assert cancelled.is_set()
+    print("✅ 取消問題時停止輪詢與查詢測試通過")
+
+
+if __name__ == "__main__":
+    test_supersede_cancels_earlier_question()
+    test_queue_mode_and_answered_turns()
+    test_cancelled_question_stops_polling_and_query()
@@ -0,0 +1,85 @@
+"""測試使用者上下文快取（TTL、個別失效、位元組統計與 single-flight 查詢）"""
+
+import asyncio
+from types import SimpleNamespace
+
+from user_context_cache import UserContextCache, load_graph_user_context
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_invalidation_and_size_accounting():
+    """測試寫入起算的 TTL、依使用者失效、LRU 上限與位元組統計"""
+    clock = _Clock()
+    cache = UserContextCache(ttl_seconds=60, max_entries=2, clock=clock)
+
+    assert cache.get("user-1") is None
+    cache.put("user-1", {"email": "user1@example.com", "source": "graph"})
+    cache.put("user-2", {"email": "user2@example.com", "source": "teams"})
+    assert cache.get("user-1")["source"] == "graph"
+    size = cache.stats()["estimated_bytes"]
+    assert size > 0
+
+    # 讀取不延長存活時間
+    clock.now = 61
+    assert cache.get("user-1") is None
+    assert "user-2" not in cache
+    assert cache.sweep() == 1
+    assert cache.stats()["estimated_bytes"] == 0
+
+    # 個別失效不影響其他使用者；超過上限時淘汰最久未使用者
+    for index in range(3):
+        cache.put(f"user-{index}", {"email": f"user{index}@example.com"})
+    assert len(cache) == 2 and "user-0" not in cache
+    assert cache.invalidate("user-1") is True
+    assert cache.invalidate("user-1") is False
+    assert "user-2" in cache
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    assert stats["invalidations"] == 1 and stats["expired"] == 2 and stats["evicted"] == 1
+    print("✅ TTL、個別失效與位元組統計測試通過")
+
+
+def test_single_flight_graph_lookup():
+    """測試同一位使用者同時查詢時只呼叫一次 Graph API，且不快取沒有電子郵件的結果"""
+    calls = []
+
+    class _FakeGraphService:
+        async def get_user_email_and_id(self, turn_context):
+            user_id = turn_context.activity.from_property.id
+            calls.append(user_id)
+            await asyncio.sleep(0.05)
+            if user_id == "anonymous":
+                return {"email": None, "id": user_id, "source": "teams"}
+            return {"email": f"{user_id}@example.com", "id": user_id, "source": "graph"}
+
+    def turn(user_id):
+        return SimpleNamespace(activity=SimpleNamespace(from_property=SimpleNamespace(id=user_id)))
+
+    async def scenario():
+        cache = UserContextCache(ttl_seconds=60, max_entries=10)
+        graph = _FakeGraphService()
+        results = await asyncio.gather(*(load_graph_user_context(cache, graph, turn("user-1")) for _ in range(5)))
+        assert all(result is results[0] for result in results)
+        assert await load_graph_user_context(cache, graph, turn("user-1")) is results[0]
+        assert calls == ["user-1"]
+
+        assert await load_graph_user_context(cache, graph, turn("anonymous")) is None
+        assert await load_graph_user_context(cache, graph, turn("anonymous")) is None
+        assert calls == ["user-1", "anonymous", "anonymous"]
+        assert cache.stats()["loads"] == 3
+
+    asyncio.run(scenario())
+    print("✅ single-flight 查詢測試通過")
+
+
+if __name__ == "__main__":
+    test_ttl_invalidation_and_size_accounting()
+    test_single_flight_graph_lookup()
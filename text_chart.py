@@ -0,0 +1,177 @@
+"""Unicode text charts built from chart_info.
+
+不依賴任何繪圖庫，以 Unicode 方塊字元產生長條圖、以 sparkline 呈現時間序列，
+可直接嵌入 Markdown 回覆。繪圖池忙碌或使用者偏好文字圖表時作為快速路徑，
+產生一張文字圖表只需數十微秒。
+"""
+
+from __future__ import annotations
+
+import unicodedata
+from typing import List, Optional
+
+from chart_cards import chart_sample_note, chart_title
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+# 1/8 精度的水平方塊，索引 0 為空白
+BAR_EIGHTHS = " ▏▎▍▌▋▊▉█"
+
+DEFAULT_BAR_WIDTH = 24
+DEFAULT_MAX_ROWS = 15
+# sparkline 的欄數：點數較多的序列以 bucket 平均值重新取樣到此寬度
+SPARKLINE_WIDTH = 32
+MAX_LABEL_WIDTH = 16
+
+
+def _display_width(text: str) -> int:
+    """終端機 / 等寬字型中的顯示寬度（中日韓全形字元佔兩格）"""
+    return sum(2 if unicodedata.east_asian_width(char) in ("W", "F") else 1 for char in text)
+
+
+def _fit_label(text: str, width: int) -> str:
+    """截斷並以空白補齊到指定顯示寬度"""
+    result = ""
+    for char in text:
+        if _display_width(result + char) > width - (1 if _display_width(text) > width else 0):
+            result += "…"
+            break
+        result += char
+    return result + " " * max(0, width - _display_width(result))
+
+
+def _format_value(value: Optional[float]) -> str:
+    if value is None:
+        return "—"
+    if abs(value) >= 1000 or float(value).is_integer():
+        return f"{value:,.0f}"
+    return f"{value:,.2f}"
+
+
+def sparkline(values: List[Optional[float]]) -> str:
+    """以八階方塊字元表示一串數值，缺值為空白"""
+    present = [value for value in values if value is not None]
+    if not present:
+        return ""
+    low, high = min(present), max(present)
+    span = high - low
+    chars = []
+    for value in values:
+        if value is None:
+            chars.append(" ")
+        elif span == 0:
+            chars.append(SPARK_CHARS[len(SPARK_CHARS) // 2])
+        else:
+            chars.append(SPARK_CHARS[int((value - low) / span * (len(SPARK_CHARS) - 1))])
+    return "".join(chars)
+
+
+def resample(values: List[Optional[float]], width: int = SPARKLINE_WIDTH) -> List[Optional[float]]:
+    """將數值依序分成 width 個 bucket，以各 bucket 的平均值表示（全為缺值的 bucket 為 None）"""
+    if len(values) <= width:
+        return values
+    buckets = []
+    for index in range(width):
+        start, end = index * len(values) // width, (index + 1) * len(values) // width
+        present = [value for value in values[start:end] if value is not None]
+        buckets.append(sum(present) / len(present) if present else None)
+    return buckets
+
+
+def bar(value: Optional[float], max_value: float, width: int = DEFAULT_BAR_WIDTH) -> str:
+    """以 1/8 字元精度繪製水平長條（負值與缺值顯示為空）"""
+    if value is None or value <= 0 or max_value <= 0:
+        return ""
+    eighths = int(round(min(value / max_value, 1.0) * width * 8))
+    full, remainder = divmod(eighths, 8)
+    return BAR_EIGHTHS[-1] * full + (BAR_EIGHTHS[remainder] if remainder else "")
+
+
+def _series(chart_info: dict) -> List[dict]:
+    series = chart_info.get("series")
+    if series:
+        return series
+    return [{
+        "name": chart_info["value_column"],
+        "values": [point["value"] for point in chart_info["data_for_chart"]],
+    }]
+
+
+def _categories(chart_info: dict) -> List[str]:
+    if chart_info.get("categories"):
+        return chart_info["categories"]
+    return [point["category"] for point in chart_info["data_for_chart"]]
+
+
+def _line_chart(chart_info: dict) -> List[str]:
+    categories = _categories(chart_info)
+    lines = [f"{categories[0]} → {categories[-1]}（{len(categories)} 點）"]
+    series = _series(chart_info)
+    label_width = min(MAX_LABEL_WIDTH, max(_display_width(item["name"]) for item in series))
+    for item in series:
+        values = item["values"]
+        present = [value for value in values if value is not None]
+        if not present:
+            continue
+        lines.append(
+            f"{_fit_label(item['name'], label_width)} {sparkline(resample(values))} "
+            f"最小 {_format_value(min(present))} · 最大 {_format_value(max(present))} · 最新 {_format_value(present[-1])}"
+        )
+    return lines
+
+
+def _visible_rows(chart_info: dict, max_rows: int) -> List[int]:
+    """要顯示的類別索引；前 N 項縮減產生的「其他」列一定保留在最後"""
+    count = len(_categories(chart_info))
+    if count <= max_rows:
+        return list(range(count))
+    if (chart_info.get("reduction") or {}).get("method") == "top_n":
+        return list(range(max_rows - 1)) + [count - 1]
+    return list(range(max_rows))
+
+
+def _bar_chart(chart_info: dict, width: int, max_rows: int) -> List[str]:
+    all_categories = _categories(chart_info)
+    rows = _visible_rows(chart_info, max_rows)
+    categories = [all_categories[row] for row in rows]
+    series = _series(chart_info)
+    multi = len(series) > 1
+    is_pie = chart_info.get("chart_type") == "pie" and not multi
+    max_value = max(
+        (item["values"][row] for item in series for row in rows if item["values"][row] is not None),
+        default=0,
+    )
+    total = sum(value for value in series[0]["values"] if value is not None and value > 0) if is_pie else 0
+    label_width = min(MAX_LABEL_WIDTH, max(_display_width(str(category)) for category in categories))
+    name_width = min(MAX_LABEL_WIDTH, max(_display_width(item["name"]) for item in series)) if multi else 0
+
+    lines = []
+    for row, category in zip(rows, categories):
+        for index, item in enumerate(series):
+            value = item["values"][row]
+            label = _fit_label(str(category) if index == 0 else "", label_width)
+            name = f" {_fit_label(item['name'], name_width)}" if multi else ""
+            suffix = _format_value(value)
+            if is_pie and value is not None and total:
+                suffix += f" ({value / total:.1%})"
+            lines.append(f"{label}{name} │{bar(value, max_value, width)} {suffix}".rstrip())
+
+    hidden = len(all_categories) - len(categories)
+    if hidden > 0:
+        lines.append(f"…（另有 {hidden} 項未顯示）")
+    return lines
+
+
+def render_text_chart(
+    chart_info: dict,
+    width: int = DEFAULT_BAR_WIDTH,
+    max_rows: int = DEFAULT_MAX_ROWS,
+) -> str:
+    """由 chart_info 產生可嵌入 Markdown 的文字圖表"""
+    if chart_info.get("chart_type") == "line":
+        lines = _line_chart(chart_info)
+    else:
+        lines = _bar_chart(chart_info, width, max_rows)
+    body = "\n".join(lines)
+    text = f"**📊 {chart_title(chart_info)}**\n\n```\n{body}\n```"
+    note = chart_sample_note(chart_info)
+    return f"{text}\n\n{note}" if note else text
@@ -0,0 +1,122 @@
+"""Bounded background queue for bot turns.
+
+同步處理時 /api/messages 在整個 Genie 往返（最長 45 秒再加上圖表繪製）期間都不回應
+Bot Connector，頻道端會看到緩慢或逾時的 webhook，可能重送或節流。TurnQueue 讓 HTTP
+處理常式只負責驗證並放入佇列，立即回應；固定數量的背景工作者再依序處理回合，
+透過已儲存的對話參考主動送出回覆。
+
+- 佇列深度有上限，滿載時 submit 回傳 False，由呼叫端回應 503 讓頻道稍後重送
+- stats() 提供待處理數、處理中數量與排隊等待時間等積壓指標
+- drain() 在關閉時停止接受新的回合，並在期限內處理完佇列中的回合
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TurnQueue:
+    """以固定數量的背景工作者處理回合的有界佇列"""
+
+    def __init__(
+        self,
+        process: Callable[[Any, float], Awaitable[None]],
+        workers: int,
+        max_depth: int,
+    ):
+        # process(item, received_at)：received_at 為放入佇列時的 time.perf_counter()
+        self._process = process
+        self.workers = max(1, workers)
+        self.max_depth = max(1, max_depth)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+        self._in_flight = 0
+        self._accepted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_ms = deque(maxlen=200)
+        self._max_wait_ms = 0.0
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        self._accepting = True
+        self._tasks = [asyncio.create_task(self._worker(index)) for index in range(self.workers)]
+        logger.info(f"📥 回合佇列已啟動：{self.workers} 個工作者，佇列上限 {self.max_depth}")
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, item: Any) -> bool:
+        """放入佇列；尚未啟動、關閉中或已滿載時回傳 False"""
+        if not self._accepting:
+            self._rejected += 1
+            return False
+        try:
+            self._queue.put_nowait((item, time.perf_counter()))
+        except asyncio.QueueFull:
+            self._rejected += 1
+            logger.warning(f"⚠️ 回合佇列已滿（{self.max_depth}），拒絕新的回合")
+            return False
+        self._accepted += 1
+        return True
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            item, received_at = await self._queue.get()
+            wait_ms = (time.perf_counter() - received_at) * 1000
+            self._wait_ms.append(wait_ms)
+            self._max_wait_ms = max(self._max_wait_ms, wait_ms)
+            self._in_flight += 1
+            try:
+                await self._process(item, received_at)
+                self._completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"❌ 背景回合處理失敗（工作者 {index}）: {e}")
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def drain(self, timeout: float) -> None:
+        """停止接受新的回合，等待佇列中的回合處理完畢（最多 timeout 秒）後停止工作者"""
+        if not self._tasks:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"⚠️ 關閉時仍有 {self.depth} 個排隊中、{self._in_flight} 個處理中的回合未完成，將取消"
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "in_flight": self._in_flight,
+            "accepting": self._accepting,
+            "accepted": self._accepted,
+            "rejected": self._rejected,
+            "completed": self._completed,
+            "failed": self._failed,
+            "avg_queue_wait_ms": round(sum(self._wait_ms) / len(self._wait_ms), 1) if self._wait_ms else 0.0,
+            "max_queue_wait_ms": round(self._max_wait_ms, 1),
+        }
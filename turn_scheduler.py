@@ -0,0 +1,116 @@
+"""Per-user turn serialization for Genie questions.
+
+同一位使用者快速連續發送兩個問題時，兩個回合會同時對同一個 conversation_id 提問，
+互相覆寫 conversation_id / last_message_id，並重複消耗 Genie 配額。TurnScheduler
+確保每位使用者同時最多只有一個進行中的 Genie 問題：
+
+- queue：後來的問題依序排隊，前一個回合完成後才開始
+- supersede：後來的問題取代先前尚未得到答案的問題，先前的回合被取消（輪詢停止、
+  SQL 查詢一併取消），並通知使用者其問題已被取代
+
+排程只在單一行程內有效；多工作行程模式下同一位使用者的訊息可能由不同行程處理。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUE_MODE = "queue"
+SUPERSEDE_MODE = "supersede"
+TURN_SCHEDULER_MODES = (QUEUE_MODE, SUPERSEDE_MODE)
+
+
+class _Turn:
+    """單一回合的排程狀態"""
+
+    __slots__ = ("task", "superseded", "answered", "finished")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.superseded = False
+        # 已取得 Genie 答案、正在送出回覆的回合不再被取消，只讓新的問題排隊
+        self.answered = False
+        self.finished = asyncio.Event()
+
+
+class TurnScheduler:
+    """依使用者序列化 Genie 問題的排程器"""
+
+    def __init__(self, mode: str = SUPERSEDE_MODE):
+        if mode not in TURN_SCHEDULER_MODES:
+            raise ValueError(f"unsupported turn scheduler mode: {mode}")
+        self.mode = mode
+        # 每位使用者最新的回合；新的回合等待前一個回合結束後才開始
+        self._tails: Dict[str, _Turn] = {}
+        self._running: Dict[str, _Turn] = {}
+        self._started = 0
+        self._queued = 0
+        self._superseded = 0
+
+    async def run(
+        self,
+        key: str,
+        turn: Callable[[], Awaitable[Any]],
+        on_superseded: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Any:
+        """執行 key 的回合，回傳 turn 的結果；回合被取代時呼叫 on_superseded 並回傳 None"""
+        previous = self._tails.get(key)
+        current = _Turn()
+        self._tails[key] = current
+        try:
+            if previous is not None:
+                if self.mode == SUPERSEDE_MODE and not previous.answered:
+                    self._supersede(previous)
+                else:
+                    self._queued += 1
+                await previous.finished.wait()
+
+            if not current.superseded:
+                self._started += 1
+                self._running[key] = current
+                # 在子工作中執行，取代時只取消這個回合，而不是整個請求處理工作
+                current.task = asyncio.create_task(turn())
+                try:
+                    return await current.task
+                except asyncio.CancelledError:
+                    if not current.superseded:
+                        raise
+                finally:
+                    if self._running.get(key) is current:
+                        del self._running[key]
+
+            if on_superseded is not None:
+                try:
+                    await on_superseded()
+                except Exception as e:
+                    logger.warning(f"⚠️ 無法通知使用者問題已被取代: {e}")
+            return None
+        finally:
+            current.finished.set()
+            if self._tails.get(key) is current:
+                del self._tails[key]
+
+    def _supersede(self, turn: _Turn) -> None:
+        turn.superseded = True
+        self._superseded += 1
+        if turn.task is not None and not turn.task.done():
+            turn.task.cancel()
+
+    def mark_answered(self, key: str) -> None:
+        """在回合取得 Genie 答案後呼叫；之後的新問題改為排隊，不再取消此回合的回覆"""
+        turn = self._running.get(key)
+        if turn is not None and turn.task is asyncio.current_task():
+            turn.answered = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "active_users": len(self._tails),
+            "started": self._started,
+            "queued": self._queued,
+            "superseded": self._superseded,
+        }
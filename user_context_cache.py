@@ -0,0 +1,168 @@
+"""Per-user context cache for identity and profile lookups.
+
+識別使用者（Graph API 取得 token 並呼叫 /me）與 whoami 的個人資料卡片每次都需要
+數次網路往返；使用者登出、工作階段過期或被淘汰後的下一則訊息都會重新查詢。
+UserContextCache 以使用者 ID 為鍵保存查詢結果：
+
+- 每筆資料有固定的存活時間（自寫入起算，讀取不延長），避免個人資料長期過時
+- 依使用者個別失效（登出、/setuser），不影響其他使用者
+- 同一位使用者同時發生的查詢只執行一次（single-flight）
+- 統計筆數、實際佔用的位元組數與命中率，可交給 SessionSweeper 定期清除過期資料
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from session_store import estimate_size
+
+logger = logging.getLogger(__name__)
+
+
+class UserContextCache:
+    """以使用者 ID 為鍵、具 TTL 與筆數上限的使用者上下文快取"""
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_entries: int,
+        name: str = "user_context_cache",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        # user_id -> (context, 寫入時間, 位元組數)，依最近使用的順序排列
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float, int]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._loads = 0
+        self._invalidations = 0
+        self._expired = 0
+        self._evicted = 0
+
+    def __contains__(self, user_id: str) -> bool:
+        entry = self._entries.get(user_id)
+        return entry is not None and self._clock() - entry[1] <= self.ttl_seconds
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """讀取快取的上下文；不存在或已過期時回傳 None 並計為未命中"""
+        entry = self._entries.get(user_id)
+        if entry is not None and self._clock() - entry[1] > self.ttl_seconds:
+            self._remove(user_id)
+            self._expired += 1
+            entry = None
+        if entry is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self._hits += 1
+        return entry[0]
+
+    def put(self, user_id: str, context: Dict[str, Any]) -> None:
+        if user_id in self._entries:
+            self._remove(user_id)
+        size = estimate_size(user_id) + estimate_size(context)
+        self._entries[user_id] = (context, self._clock(), size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._evicted += 1
+
+    async def get_or_load(
+        self, user_id: str, loader: Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+    ) -> Optional[Dict[str, Any]]:
+        """讀取快取，未命中時以 loader 查詢並寫入；loader 回傳 None 時不快取
+
+        同一位使用者同時發生的多次未命中共用同一次查詢。
+        """
+        context = self.get(user_id)
+        if context is not None:
+            return context
+        pending = self._loading.get(user_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[user_id] = future
+        try:
+            self._loads += 1
+            context = await loader()
+            if context is not None:
+                self.put(user_id, context)
+            future.set_result(context)
+            return context
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # 沒有其他等待者時避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._loading[user_id]
+
+    def invalidate(self, user_id: str) -> bool:
+        """清除單一使用者的上下文，回傳是否有資料被清除"""
+        if user_id not in self._entries:
+            return False
+        self._remove(user_id)
+        self._invalidations += 1
+        logger.info(f"🗑️ 已清除使用者上下文快取: {user_id}")
+        return True
+
+    def _remove(self, user_id: str) -> None:
+        _, _, size = self._entries.pop(user_id)
+        self._bytes -= size
+
+    def sweep(self) -> int:
+        """清除所有過期的資料，回傳清除的筆數"""
+        cutoff = self._clock() - self.ttl_seconds
+        expired = [user_id for user_id, (_, stored_at, _) in self._entries.items() if stored_at < cutoff]
+        for user_id in expired:
+            self._remove(user_id)
+        self._expired += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "estimated_bytes": self._bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "loads": self._loads,
+            "invalidations": self._invalidations,
+            "expired": self._expired,
+            "evicted": self._evicted,
+        }
+
+
+async def load_graph_user_context(
+    cache: UserContextCache, graph_service: Any, turn_context: Any
+) -> Optional[Dict[str, Any]]:
+    """經由快取取得使用者的 Graph / Teams 身分資訊（GraphService.get_user_email_and_id）
+
+    沒有電子郵件的結果不快取，使用者完成登入或 Teams 提供電子郵件後可立即生效。
+    回傳的 dict 由快取共用，呼叫端不應修改。
+    """
+
+    async def load() -> Optional[Dict[str, Any]]:
+        user_info = await graph_service.get_user_email_and_id(turn_context)
+        return user_info if user_info and user_info.get("email") else None
+
+    return await cache.get_or_load(turn_context.activity.from_property.id, load)
@@ -3,28 +3,76 @@
 from __future__ import annotations
 
 import re
-from datetime import datetime, timezone, timedelta
+import time
+from datetime import datetime, timezone
 from typing import List, Optional
 
 
+class UserContext:
+    """Fixed-field per-user context (last question, message, SQL and counters)."""
+
+    __slots__ = (
+        "last_question",
+        "last_message_id",
+        "last_sql",
+        "last_response_at",
+        "query_count",
+        "text_charts",
+    )
+
+    def __init__(self):
+        self.last_question: Optional[str] = None
+        self.last_message_id: Optional[str] = None  # Genie 訊息 ID，用於回饋
+        self.last_sql: Optional[str] = None
+        self.last_response_at: Optional[float] = None  # epoch 秒
+        self.query_count = 0
+        self.text_charts = False  # 圖表改以文字呈現
+
+    def reset_conversation(self) -> None:
+        """開始新對話時清除與上一段對話相關的欄位（保留計數與偏好）"""
+        self.last_question = None
+        self.last_message_id = None
+        self.last_sql = None
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
 class UserSession:
-    """Represents a Teams user session."""
+    """Represents a Teams user session.
+
+    使用 __slots__ 與 epoch 浮點數時間戳，大型租戶中每個工作階段的記憶體用量較小。
+    """
+
+    __slots__ = (
+        "user_id",
+        "email",
+        "name",
+        "conversation_id",
+        "created_at",
+        "last_activity",
+        "is_authenticated",
+        "user_context",
+        "aad_object_id",
+        "upn",
+    )
 
     def __init__(self, user_id: str, email: str, name: Optional[str] = None):
         self.user_id = user_id
         self.email = email
         self.name = name or email.split('@')[0]
         self.conversation_id: Optional[str] = None
-        self.created_at = datetime.now(timezone.utc)
-        self.last_activity = datetime.now(timezone.utc)
+        now = time.time()
+        self.created_at = now  # epoch 秒
+        self.last_activity = now  # epoch 秒
         self.is_authenticated = True
-        self.user_context: dict = {}
+        self.user_context = UserContext()
         # 新增 AAD (Azure Active Directory) 相關資訊
         self.aad_object_id: Optional[str] = None  # OpenID / AAD Object ID
         self.upn: Optional[str] = None  # User Principal Name
 
     def update_activity(self) -> None:
-        self.last_activity = datetime.now(timezone.utc)
+        self.last_activity = time.time()
 
     def to_dict(self) -> dict:
         return {
@@ -32,8 +80,8 @@ class UserSession:
             "email": self.email,
             "name": self.name,
             "conversation_id": self.conversation_id,
-            "created_at": self.created_at.isoformat(),
-            "last_activity": self.last_activity.isoformat(),
+            "created_at": _isoformat(self.created_at),
+            "last_activity": _isoformat(self.last_activity),
             "is_authenticated": self.is_authenticated,
             "aad_object_id": self.aad_object_id,
             "upn": self.upn,
@@ -43,6 +91,10 @@ class UserSession:
         return f"{self.name} ({self.email})"
 
 
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
 def is_valid_email(email: str) -> bool:
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
@@ -52,8 +104,7 @@ def is_conversation_timed_out(user_session: UserSession, timeout_hours: int = 4)
     if not user_session:
         return False
 
-    time_since_last = datetime.now(timezone.utc) - user_session.last_activity
-    return time_since_last > timedelta(hours=timeout_hours)
+    return time.time() - user_session.last_activity > timeout_hours * 3600
 
 
 def get_sample_questions(sample_questions: Optional[str]) -> List[str]: